@@ -63,6 +63,15 @@ def get_wsgi_apps_types():
     return _WSGI_APPS_TYPES
 
 
+# Registered wsgi server worker pools, by pool name.
+_WSGI_POOLS = {}
+
+
+def get_wsgi_pools():
+    """Docstring"""
+    return _WSGI_POOLS
+
+
 # What the hell was I thinking here?
 def save_cached_values():
     """Docstring"""
@@ -5,3 +5,12 @@ This configuration describes the basic configuration for wsgi applications.
 """
 
 CONFIG_TYPE = 'WsgiApps'
+
+
+def update_1_0_0_to_1_1_0(config):
+    """Update from version 1.0.0 to 1.1.0, adding the resource path."""
+    api = config['@api']
+    api['version'] = '1.1.0'
+    api['prev_version'] = '1.0.0'
+    config.setdefault('resource_path', None)
+    return config
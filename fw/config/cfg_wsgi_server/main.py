@@ -1,3 +1,148 @@
 """Docstring"""
 
 CONFIG_TYPE = 'WsgiServer'
+
+
+def update_1_0_0_to_1_1_0(config):
+    """Update from version 1.0.0 to 1.1.0, adding keepalive_parking."""
+    api = config['@api']
+    api['version'] = '1.1.0'
+    api['prev_version'] = '1.0.0'
+    server = config.setdefault('server', {})
+    server.setdefault('keepalive_parking', False)
+    return config
+
+
+def update_1_1_0_to_1_2_0(config):
+    """Update from version 1.1.0 to 1.2.0, adding the process settings."""
+    api = config['@api']
+    api['version'] = '1.2.0'
+    api['prev_version'] = '1.1.0'
+    server = config.setdefault('server', {})
+    server.setdefault('workers', 1)
+    server.setdefault('threads', 10)
+    server.setdefault('reuse_port', False)
+    return config
+
+
+def update_1_2_0_to_1_3_0(config):
+    """Update from version 1.2.0 to 1.3.0, adding the autoscaling settings."""
+    api = config['@api']
+    api['version'] = '1.3.0'
+    api['prev_version'] = '1.2.0'
+    server = config.setdefault('server', {})
+    server.setdefault('max_threads', -1)
+    server.setdefault('autoscale', False)
+    server.setdefault('autoscale_cooldown', 60)
+    return config
+
+
+def update_1_3_0_to_1_4_0(config):
+    """Update from version 1.3.0 to 1.4.0, adding the accepted connection queue
+    settings."""
+    api = config['@api']
+    api['version'] = '1.4.0'
+    api['prev_version'] = '1.3.0'
+    server = config.setdefault('server', {})
+    server.setdefault('queue_size', -1)
+    server.setdefault('queue_discipline', 'fifo')
+    return config
+
+
+def update_1_4_0_to_1_5_0(config):
+    """Update from version 1.4.0 to 1.5.0, adding the listener settings."""
+    api = config['@api']
+    api['version'] = '1.5.0'
+    api['prev_version'] = '1.4.0'
+    server = config.setdefault('server', {})
+    server.setdefault('backlog', 128)
+    server.setdefault('accept_batch', 64)
+    server.setdefault('tcp_defer_accept', 0)
+    server.setdefault('tcp_fastopen', 0)
+    return config
+
+
+def update_1_5_0_to_1_6_0(config):
+    """Update from version 1.5.0 to 1.6.0, adding the compression settings."""
+    api = config['@api']
+    api['version'] = '1.6.0'
+    api['prev_version'] = '1.5.0'
+    server = config.setdefault('server', {})
+    server.setdefault('compression_level', 0)
+    server.setdefault('compression_min_size', 1024)
+    return config
+
+
+def update_1_6_0_to_1_7_0(config):
+    """Update from version 1.6.0 to 1.7.0, adding the metrics path."""
+    api = config['@api']
+    api['version'] = '1.7.0'
+    api['prev_version'] = '1.6.0'
+    server = config.setdefault('server', {})
+    server.setdefault('metrics_path', '')
+    return config
+
+
+def update_1_7_0_to_1_8_0(config):
+    """Update from version 1.7.0 to 1.8.0, adding the slow request time."""
+    api = config['@api']
+    api['version'] = '1.8.0'
+    api['prev_version'] = '1.7.0'
+    server = config.setdefault('server', {})
+    server.setdefault('slow_request_time', 0)
+    return config
+
+
+def update_1_8_0_to_1_9_0(config):
+    """Update from version 1.8.0 to 1.9.0, adding the profiler settings."""
+    api = config['@api']
+    api['version'] = '1.9.0'
+    api['prev_version'] = '1.8.0'
+    server = config.setdefault('server', {})
+    server.setdefault('profile_rate', 0)
+    server.setdefault('profile_dump_path', '/tmp/fw-profile-{pid}.txt')
+    return config
+
+
+def update_1_9_0_to_1_10_0(config):
+    """Update from version 1.9.0 to 1.10.0, adding the read time limits."""
+    api = config['@api']
+    api['version'] = '1.10.0'
+    api['prev_version'] = '1.9.0'
+    server = config.setdefault('server', {})
+    server.setdefault('header_timeout', 20)
+    server.setdefault('min_body_rate', 500)
+    return config
+
+
+def update_1_10_0_to_1_11_0(config):
+    """Update from version 1.10.0 to 1.11.0, adding the queue shard
+    settings."""
+    api = config['@api']
+    api['version'] = '1.11.0'
+    api['prev_version'] = '1.10.0'
+    server = config.setdefault('server', {})
+    server.setdefault('queue_shards', 0)
+    server.setdefault('queue_placement', 'round-robin')
+    return config
+
+
+def update_1_11_0_to_1_12_0(config):
+    """Update from version 1.11.0 to 1.12.0, adding write_behind."""
+    api = config['@api']
+    api['version'] = '1.12.0'
+    api['prev_version'] = '1.11.0'
+    server = config.setdefault('server', {})
+    server.setdefault('write_behind', 0)
+    return config
+
+
+def update_1_12_0_to_1_13_0(config):
+    """Update from version 1.12.0 to 1.13.0, adding the request deadlines."""
+    api = config['@api']
+    api['version'] = '1.13.0'
+    api['prev_version'] = '1.12.0'
+    server = config.setdefault('server', {})
+    server.setdefault('deadline', 0)
+    server.setdefault('deadlines', {})
+    return config
@@ -0,0 +1,231 @@
+# @PydevCodeAnalysisIgnore, pylint: disable=missing-docstring
+
+CONFIG_SCHEMA = {
+    "type": "object",
+    "$schema": "http://json-schema.org/draft-04/schema",
+    "properties": {
+        "@api": {
+            "type": "object",
+            "properties": {
+                "type": {
+                    "type": "string",
+                    "pattern": "jconf",
+                    "default": "jconf"
+                },
+                "name": {
+                    "type": "string",
+                    "pattern": "WsgiServer",
+                    "default": "WsgiServer"
+                },
+                "version": {
+                    "type": "string",
+                    "pattern": "^1\\.13\\.0$",
+                    "default": "1.13.0"
+                },
+                "prev_version": {
+                    "type": "string",
+                    "pattern": "^1\\.12\\.0$",
+                    "default": "1.12.0"
+                }
+            },
+            "required": [
+                "type",
+                "name",
+                "version",
+                "prev_version"
+            ]
+        },
+        "@config_id": {
+            "type": "string"
+        },
+        "server": {
+            "type": "object",
+            "properties": {
+                "address": {
+                    "type": "string",
+                    "default": "localhost",
+                    "anyOf": [
+                        {
+                            "pattern": (
+                                "^([01]?\\d\\d?|2[0-4]\\d|25[0-5])"
+                                "\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])"
+                                "\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])"
+                                "\\.([01]?\\d\\d?|2[0-4]\\d|25[0-5])$"
+                                )
+                        },
+                        {
+                            "enum": [
+                                "localhost"
+                            ]
+                        }
+                    ]
+                },
+                "port": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 1,
+                    "maximum": 65535,
+                    "default": 9000
+                },
+                "keepalive_parking": {
+                    "type": "boolean",
+                    "default": False
+                },
+                "workers": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 1,
+                    "default": 1
+                },
+                "threads": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 1,
+                    "default": 10
+                },
+                "reuse_port": {
+                    "type": "boolean",
+                    "default": False
+                },
+                "max_threads": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": -1,
+                    "default": -1
+                },
+                "autoscale": {
+                    "type": "boolean",
+                    "default": False
+                },
+                "autoscale_cooldown": {
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 60
+                },
+                "queue_size": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": -1,
+                    "default": -1
+                },
+                "queue_discipline": {
+                    "type": "string",
+                    "enum": [
+                        "fifo",
+                        "lifo",
+                        "codel"
+                    ],
+                    "default": "fifo"
+                },
+                "backlog": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 1,
+                    "default": 128
+                },
+                "accept_batch": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 1,
+                    "default": 64
+                },
+                "tcp_defer_accept": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "default": 0
+                },
+                "tcp_fastopen": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "default": 0
+                },
+                "compression_level": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "maximum": 9,
+                    "default": 0
+                },
+                "compression_min_size": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "default": 1024
+                },
+                "metrics_path": {
+                    "type": "string",
+                    "pattern": "^(/.*)?$",
+                    "default": ""
+                },
+                "slow_request_time": {
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 0
+                },
+                "profile_rate": {
+                    "type": "number",
+                    "minimum": 0,
+                    "maximum": 1000,
+                    "default": 0
+                },
+                "profile_dump_path": {
+                    "type": "string",
+                    "default": "/tmp/fw-profile-{pid}.txt"
+                },
+                "header_timeout": {
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 20
+                },
+                "min_body_rate": {
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 500
+                },
+                "queue_shards": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "default": 0
+                },
+                "queue_placement": {
+                    "type": "string",
+                    "enum": [
+                        "round-robin",
+                        "least-loaded"
+                    ],
+                    "default": "round-robin"
+                },
+                "write_behind": {
+                    "type": "number",
+                    "multipleOf": 1.0,
+                    "minimum": 0,
+                    "default": 0
+                },
+                "deadline": {
+                    "type": "number",
+                    "minimum": 0,
+                    "default": 0
+                },
+                "deadlines": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "patternProperties": {
+                        "^/.*$": {
+                            "type": "number",
+                            "minimum": 0
+                        }
+                    },
+                    "default": {}
+                }
+            }
+        }
+    },
+    "requried": [
+        "@api",
+        "@config_id",
+        "content"
+    ]
+}
@@ -462,7 +462,19 @@ def update_config(config, version_chain=None):
 
 
 def register_wsgi_apps_types(types):
-    """Registers custom wsgi application types."""
+    """Registers custom wsgi application types.
+
+    Each type is a dict with the 'url_regex' of its paths and the 'function'
+    serving them, and optionally the 'resource_path' of its static files,
+    which is otherwise the framework's default resources. For example:
+
+        register_wsgi_apps_types({
+            'notes': {'url_regex': r'^/(?P<user_name>[a-z]+)/notes/$',
+                'function': 'amnesia.web.notes.entry',
+                'resource_path': '/srv/amnesia/resources'}
+        })
+
+    """
     apps_types = cache.get_wsgi_apps_types()
     for type_name, type_value in types.items():
         if type_name in apps_types.keys():
@@ -472,5 +484,27 @@ def register_wsgi_apps_types(types):
         apps_types[type_name] = type_value
 
 
+def register_wsgi_pools(pools):
+    """Registers worker pools of their own for wsgi app routes.
+
+    Each pool is a dict with the 'routes' (path prefixes) it serves, and
+    optionally its 'min_threads', 'max_threads' and 'queue_size'. For
+    example, keeping uploads from taking up the threads of the pages:
+
+        register_wsgi_pools({
+            'uploads': {'routes': ['/upload'], 'min_threads': 2,
+                'max_threads': 4, 'queue_size': 8}
+        })
+
+    """
+    wsgi_pools = cache.get_wsgi_pools()
+    for pool_name, pool_value in pools.items():
+        if pool_name in wsgi_pools.keys():
+            LOG.warning(
+                'Registering already existing wsgi pool "{}".'.format(
+                    pool_name))
+        wsgi_pools[pool_name] = pool_value
+
+
 def get_app_config(parts):
     return parts
@@ -0,0 +1,135 @@
+"""A library for integrating Python's builtin ``ssl`` library with CherryPy.
+
+The ssl module must be importable for SSL functionality.
+
+To use this module, set ``CherryPyWSGIServer.ssl_adapter`` to an instance of
+``BuiltinSSLAdapter``.
+
+All connections share one ``ssl.SSLContext``, so its session cache and
+session ticket keys are shared as well, and returning clients can resume
+their TLS session with an abbreviated handshake. The handshake itself is
+not done by wrap(), on the accepting thread, but by handshake(), on the
+WorkerThread serving the connection; a slow client then only holds up its
+own worker thread.
+"""
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+try:
+    from _pyio import DEFAULT_BUFFER_SIZE
+except ImportError:
+    try:
+        from io import DEFAULT_BUFFER_SIZE
+    except ImportError:
+        DEFAULT_BUFFER_SIZE = -1
+
+import sys
+import socket
+
+from fw.externals import wsgiserver
+
+
+class BuiltinSSLAdapter(wsgiserver.SSLAdapter):
+
+    """A wrapper for integrating Python's builtin ssl module with CherryPy."""
+
+    certificate = None
+    """The filename of the server SSL certificate."""
+
+    private_key = None
+    """The filename of the server's private key file."""
+
+    context = None
+    """The ssl.SSLContext shared by all connections."""
+
+    session_tickets = 2
+    """The number of TLS 1.3 session tickets sent after each full
+    handshake, or 0 to disable tickets (and resumption) altogether."""
+
+    def __init__(self, certificate, private_key, certificate_chain=None):
+        if ssl is None:
+            raise ImportError("You must install the ssl module to use HTTPS.")
+        self.certificate = certificate
+        self.private_key = private_key
+        self.certificate_chain = certificate_chain
+        self.context = self.create_context()
+
+    def create_context(self):
+        """Return a server-side SSLContext with the certificate loaded."""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        context.load_cert_chain(self.certificate, self.private_key)
+        if self.certificate_chain:
+            context.load_verify_locations(self.certificate_chain)
+        if self.session_tickets:
+            # TLS 1.2 clients resume from the server's session cache (on
+            # by default in OpenSSL), TLS 1.3 clients with a ticket.
+            context.options &= ~ssl.OP_NO_TICKET
+            context.num_tickets = self.session_tickets
+        else:
+            context.options |= ssl.OP_NO_TICKET
+            context.num_tickets = 0
+        return context
+
+    def bind(self, sock):
+        """Wrap and return the given socket."""
+        return sock
+
+    def wrap(self, sock):
+        """Wrap and return the given socket, plus WSGI environ entries."""
+        s = self.context.wrap_socket(sock, server_side=True,
+                                     do_handshake_on_connect=False)
+        ssl_environ = self.handshake(s)
+        if ssl_environ is None:
+            return None, {}
+        return s, ssl_environ
+
+    def wrap_deferred(self, sock):
+        """Wrap the given socket for SSL, leaving the handshake to be done
+        by handshake(), on the thread serving the connection."""
+        return self.context.wrap_socket(sock, server_side=True,
+                                        do_handshake_on_connect=False)
+
+    def handshake(self, sock):
+        """Do the handshake on a socket from wrap_deferred().
+
+        Return the WSGI environ entries, or None if the connection should
+        just be dropped. Raise NoSSLError if the client spoke plain HTTP.
+        """
+        try:
+            sock.do_handshake()
+        except ssl.SSLError:
+            e = sys.exc_info()[1]
+            reason = getattr(e, 'reason', None)
+            if reason == 'HTTP_REQUEST':
+                # The client is speaking HTTP to an HTTPS server.
+                raise wsgiserver.NoSSLError
+            if isinstance(e, ssl.SSLEOFError) or reason in (
+                    'UNKNOWN_PROTOCOL', 'WRONG_VERSION_NUMBER'):
+                # Either the server 'pinging' its own socket (see stop()),
+                # or a client speaking some non-HTTP protocol. Drop the
+                # conn.
+                return None
+            raise
+        except (ConnectionError, socket.timeout):
+            return None
+        return self.get_environ(sock)
+
+    def get_environ(self, sock):
+        """Create WSGI environ entries to be merged into each request."""
+        cipher = sock.cipher()
+        ssl_environ = {
+            "wsgi.url_scheme": "https",
+            "HTTPS": "on",
+            'SSL_PROTOCOL': cipher[1],
+            'SSL_CIPHER': cipher[0],
+            'SSL_SESSION_RESUMED': sock.session_reused and 'Resumed' or
+            'Initial',
+        }
+        return ssl_environ
+
+    def makefile(self, sock, mode='r', bufsize=DEFAULT_BUFFER_SIZE):
+        return wsgiserver.CP_makefile(sock, mode, bufsize)
@@ -76,11 +76,18 @@ __all__ = ['HTTPRequest', 'HTTPConnection', 'HTTPServer',
            'SizeCheckWrapper', 'KnownLengthRFile', 'ChunkedRFile',
            'CP_makefile',
            'MaxSizeExceeded', 'NoSSLError', 'FatalSSLAlert',
-           'WorkerThread', 'ThreadPool', 'SSLAdapter',
+           'WorkerThread', 'RequestQueue', 'ThreadPool',
+           'ThreadPoolAutoscaler', 'SSLAdapter', 'TimerWheel',
+           'ConnectionManager',
            'CherryPyWSGIServer',
-           'Gateway', 'WSGIGateway', 'WSGIGateway_10', 'WSGIGateway_u0',
-           'WSGIPathInfoDispatcher', 'get_ssl_adapter_class']
-
+           'Gateway', 'FileWrapper',
+           'WSGIGateway', 'WSGIGateway_10', 'WSGIGateway_u0',
+           'WSGIPathInfoDispatcher', 'get_ssl_adapter_class',
+           'AsyncioRFile', 'AsyncioWFile', 'AsyncioHTTPConnection',
+           'AsyncioHTTPProtocol', 'AsyncioWSGIServer']
+
+import asyncio
+import concurrent.futures
 import os
 try:
     import queue
@@ -88,7 +95,11 @@ except:
     import Queue as queue
 import re
 import email.utils
+import collections
+import itertools
+import selectors
 import socket
+import stat
 import sys
 if 'win' in sys.platform and hasattr(socket, "AF_INET6"):
     if not hasattr(socket, 'IPPROTO_IPV6'):
@@ -101,8 +112,20 @@ else:
     import _pyio as io
 DEFAULT_BUFFER_SIZE = io.DEFAULT_BUFFER_SIZE
 
+# The max number of buffers to pass to one sendmsg() call.
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
 import threading
 import time
+import zlib
+try:
+    from time import thread_time
+except ImportError:
+    # No per-thread CPU clock; use the process' instead.
+    from time import process_time as thread_time
 from traceback import format_exc
 
 if sys.version_info >= (3, 0):
@@ -145,6 +168,13 @@ quoted_slash = re.compile(ntob("(?i)%2F"))
 
 import errno
 
+try:
+    import ssl
+    # Raised by non-blocking SSL sockets in place of io.BlockingIOError.
+    SSLWantErrors = (ssl.SSLWantReadError, ssl.SSLWantWriteError)
+except ImportError:
+    SSLWantErrors = ()
+
 
 def plat_specific_errors(*errnames):
     """Return error numbers for all errors in errnames on this platform.
@@ -242,10 +272,149 @@ def read_headers(rfile, hdict=None):
     return hdict
 
 
+# Header names, as received, mapped to their .title()d form.
+_header_titles = {}
+_comma_separated_headers = frozenset(comma_separated_headers)
+
+
+def parse_header_lines(lines, hdict=None):
+    """Parse the given header lines (without CRLF) into a header dict.
+
+    The one-pass counterpart of read_headers, for a request head which has
+    been read in full. Raises ValueError for the same malformed lines.
+    """
+    if hdict is None:
+        hdict = {}
+    titles = _header_titles
+
+    for line in lines:
+        k, sep, v = line.partition(COLON)
+        if not sep:
+            raise ValueError("Illegal header line.")
+        hname = titles.get(k)
+        if hname is None:
+            hname = k.strip().title()
+            if len(titles) < 1024:
+                titles[k] = hname
+        v = v.strip()
+
+        if hname in _comma_separated_headers:
+            existing = hdict.get(hname)
+            if existing:
+                v = b", ".join((existing, v))
+        hdict[hname] = v
+
+    return hdict
+
+
+# Serialized response header lines, so the header blocks an app sends for
+# every response (Content-Type, Cache-Control, ...) are only built once.
+_header_lines = {}
+_status_lines = {}
+_server_lines = {}
+_date_line = (None, EMPTY)
+MAX_CACHED_HEADER_LINES = 1024
+
+# Headers whose values differ from one response to the next (and may be
+# private to a user, like session cookies), which are never cached.
+_uncached_headers = frozenset([
+    b"content-length", b"set-cookie", b"location", b"etag",
+    b"last-modified", b"expires", b"content-range", b"date",
+])
+
+
+def header_line(k, v):
+    """Return the header line for name k and value v (bytes), with CRLF."""
+    key = (k, v)
+    line = _header_lines.get(key)
+    if line is None:
+        line = k + COLON + SPACE + v + CRLF
+        if (len(_header_lines) < MAX_CACHED_HEADER_LINES
+                and k.lower() not in _uncached_headers):
+            _header_lines[key] = line
+    return line
+
+
+def status_line(protocol, status):
+    """Return the Status-Line for the given protocol (str) and status."""
+    key = (protocol, status)
+    line = _status_lines.get(key)
+    if line is None:
+        line = protocol.encode('ascii') + SPACE + status + CRLF
+        if len(_status_lines) < MAX_CACHED_HEADER_LINES:
+            _status_lines[key] = line
+    return line
+
+
+def server_line(server_name):
+    """Return the Server header line for the given server name (str)."""
+    line = _server_lines.get(server_name)
+    if line is None:
+        line = header_line(b"Server", server_name.encode('ISO-8859-1'))
+        _server_lines[server_name] = line
+    return line
+
+
+def date_line():
+    """Return the Date header line for now; rebuilt once per second."""
+    global _date_line
+    now = int(time.time())
+    second, line = _date_line
+    if second != now:
+        line = (b"Date: " + email.utils.formatdate(now, usegmt=True).encode(
+            'ISO-8859-1') + CRLF)
+        _date_line = (now, line)
+    return line
+
+
 class MaxSizeExceeded(Exception):
     pass
 
 
+class DeadlineExceeded(Exception):
+
+    """Raised to a request's writer once the DeadlineWatchdog has answered
+    the request with 504 Gateway Timeout in its place."""
+
+
+class ReadDeadline(object):
+
+    """A time by which reads from a connection must be done.
+
+    The deadline is fixed, or moves with the bytes read so far (counted in
+    bytes_read by the reader), so that a transfer slower than min_rate
+    bytes per second (after the first grace seconds) runs out of time.
+    With both, whichever comes first applies.
+
+    The min_rate clock starts at the first read, rather than when the
+    deadline is set, so the time the app takes before it reads the body
+    isn't held against the client.
+    """
+
+    def __init__(self, deadline=None, min_rate=0, grace=0):
+        self.deadline = deadline
+        self.min_rate = min_rate
+        self.grace = grace
+        self.start = None
+        self.bytes_read = 0
+
+    def remaining(self):
+        """Return the seconds left to read in (negative if overdue).
+
+        Readers call this before each read; the first call starts the
+        min_rate clock.
+        """
+        now = time.time()
+        deadline = self.deadline
+        if self.min_rate:
+            if self.start is None:
+                self.start = now + self.grace
+            rate_deadline = self.start + self.bytes_read / self.min_rate
+            if deadline is None or rate_deadline < deadline:
+                deadline = rate_deadline
+        return deadline - now
+
+
 class SizeCheckWrapper(object):
 
     """Wraps a file-like object, raising MaxSizeExceeded if too large."""
@@ -336,6 +505,17 @@ class KnownLengthRFile(object):
         self.remaining -= len(data)
         return data
 
+    def readinto(self, b):
+        """Read into the given writable buffer; return the number of bytes."""
+        if self.remaining == 0:
+            return 0
+        view = memoryview(b).cast("B")
+        if len(view) > self.remaining:
+            view = view[:self.remaining]
+        n = self.rfile.readinto(view)
+        self.remaining -= n
+        return n
+
     def readline(self, size=None):
         if self.remaining == 0:
             return b''
@@ -349,16 +529,17 @@ class KnownLengthRFile(object):
         return data
 
     def readlines(self, sizehint=0):
-        # Shamelessly stolen from StringIO
+        # Shamelessly stolen from StringIO. The sizehint only limits the
+        # number of lines: readline(0) would return no line at all.
         total = 0
         lines = []
-        line = self.readline(sizehint)
+        line = self.readline()
         while line:
             lines.append(line)
             total += len(line)
             if 0 < sizehint <= total:
                 break
-            line = self.readline(sizehint)
+            line = self.readline()
         return lines
 
     def close(self):
@@ -380,21 +561,38 @@ class ChunkedRFile(object):
     This class is intended to provide a conforming wsgi.input value for
     request entities that have been encoded with the 'chunked' transfer
     encoding.
+
+    The chunk framing is decoded as the body is read: data is read (or
+    readinto() a buffer) straight from the wrapped file, up to the end of
+    the current chunk, and never buffered here. Reading is therefore linear
+    in the size of the body, however small its chunks.
     """
 
     def __init__(self, rfile, maxlen, bufsize=8192):
         self.rfile = rfile
         self.maxlen = maxlen
         self.bytes_read = 0
-        self.buffer = EMPTY
         self.bufsize = bufsize
         self.closed = False
+        # The number of data bytes left to read in the current chunk.
+        self.chunk_remaining = 0
+        # True until the CRLF ending the current chunk has been read.
+        self._in_chunk = False
 
-    def _fetch(self):
+    def _next_chunk(self):
+        """Read the next chunk-size line. Return False at the last chunk."""
         if self.closed:
-            return
+            return False
+
+        if self._in_chunk:
+            crlf = self.rfile.read(2)
+            if crlf != CRLF:
+                raise ValueError(
+                    "Bad chunked transfer coding (expected '\\r\\n', "
+                    "got " + repr(crlf) + ")")
+            self._in_chunk = False
 
-        line = self.rfile.readline()
+        line = self.rfile.readline(self.bufsize)
         self.bytes_read += len(line)
 
         if self.maxlen and self.bytes_read > self.maxlen:
@@ -410,82 +608,160 @@ class ChunkedRFile(object):
 
         if chunk_size <= 0:
             self.closed = True
-            return
+            return False
 
 ##            if line: chunk_extension = line[0]
 
         if self.maxlen and self.bytes_read + chunk_size > self.maxlen:
             raise IOError("Request Entity Too Large")
 
-        chunk = self.rfile.read(chunk_size)
-        self.bytes_read += len(chunk)
-        self.buffer += chunk
-
-        crlf = self.rfile.read(2)
-        if crlf != CRLF:
-            raise ValueError(
-                "Bad chunked transfer coding (expected '\\r\\n', "
-                "got " + repr(crlf) + ")")
+        self.chunk_remaining = chunk_size
+        self._in_chunk = True
+        return True
 
-    def read(self, size=None):
-        data = EMPTY
+    def _received(self, n):
+        """Account for n data bytes read from the current chunk."""
+        if not n:
+            raise ValueError("Bad chunked transfer coding (the body ended "
+                             "in a chunk)")
+        self.chunk_remaining -= n
+        self.bytes_read += n
+
+    def _read_buffered(self, size, out):
+        """Decode the whole chunks which are already buffered in the rfile.
+
+        Append their data to the out list (as memoryviews of one block read
+        from the rfile), up to size bytes (-1 for no limit), and return the
+        number of bytes appended. Return 0 if the next chunk isn't wholly
+        buffered, or is the last one; the caller falls back to reading it
+        with _next_chunk, which also raises any framing errors.
+        """
+        buf = self.rfile.peek(1)
+        pos = 0
+        spans = []
+        total = 0
+        in_chunk = self._in_chunk
+        bytes_read = self.bytes_read
         while True:
-            if size and len(data) >= size:
-                return data
+            start = pos
+            if in_chunk:
+                if buf[pos:pos + 2] != CRLF:
+                    break
+                start += 2
+            eol = buf.find(LF, start)
+            if eol < 0:
+                break
+            try:
+                chunk_size = int(buf[start:eol].split(SEMICOLON, 1)[0], 16)
+            except ValueError:
+                break
+            data_start = eol + 1
+            data_end = data_start + chunk_size
+            if chunk_size <= 0 or data_end > len(buf):
+                break
+            if size >= 0 and total + chunk_size > size:
+                break
+            bytes_read += data_end - start
+            if self.maxlen and bytes_read > self.maxlen:
+                break
+            spans.append((data_start, data_end))
+            total += chunk_size
+            in_chunk = True
+            pos = data_end
+        if not spans:
+            return 0
+        block = memoryview(self.rfile.read(pos))
+        for data_start, data_end in spans:
+            out.append(block[data_start:data_end])
+        self._in_chunk = True
+        self.bytes_read = bytes_read
+        return total
 
-            if not self.buffer:
-                self._fetch()
-                if not self.buffer:
+    def read(self, size=None):
+        if size is None or size < 0:
+            size = -1
+        buffered = hasattr(self.rfile, "peek")
+        chunks = []
+        while size:
+            if not self.chunk_remaining:
+                if buffered:
+                    n = self._read_buffered(size, chunks)
+                    if n:
+                        if size > 0:
+                            size -= n
+                        continue
+                if not self._next_chunk():
                     # EOF
-                    return data
-
-            if size:
-                remaining = size - len(data)
-                data += self.buffer[:remaining]
-                self.buffer = self.buffer[remaining:]
-            else:
-                data += self.buffer
+                    break
+            n = self.chunk_remaining
+            if 0 < size < n:
+                n = size
+            data = self.rfile.read(n)
+            self._received(len(data))
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return EMPTY.join(chunks)
+
+    def readinto(self, b):
+        """Read into the given writable buffer; return the number of bytes.
+
+        The buffer is filled unless the body ends first.
+        """
+        view = memoryview(b).cast("B")
+        total = 0
+        size = len(view)
+        buffered = hasattr(self.rfile, "peek")
+        while total < size:
+            if not self.chunk_remaining:
+                if buffered:
+                    chunks = []
+                    if self._read_buffered(size - total, chunks):
+                        for chunk in chunks:
+                            view[total:total + len(chunk)] = chunk
+                            total += len(chunk)
+                        continue
+                if not self._next_chunk():
+                    # EOF
+                    break
+            n = min(size - total, self.chunk_remaining)
+            n = self.rfile.readinto(view[total:total + n])
+            self._received(n)
+            total += n
+        return total
 
     def readline(self, size=None):
-        data = EMPTY
-        while True:
-            if size and len(data) >= size:
-                return data
-
-            if not self.buffer:
-                self._fetch()
-                if not self.buffer:
-                    # EOF
-                    return data
-
-            newline_pos = self.buffer.find(LF)
-            if size:
-                if newline_pos == -1:
-                    remaining = size - len(data)
-                    data += self.buffer[:remaining]
-                    self.buffer = self.buffer[remaining:]
-                else:
-                    remaining = min(size - len(data), newline_pos)
-                    data += self.buffer[:remaining]
-                    self.buffer = self.buffer[remaining:]
-            else:
-                if newline_pos == -1:
-                    data += self.buffer
-                else:
-                    data += self.buffer[:newline_pos]
-                    self.buffer = self.buffer[newline_pos:]
+        if size is None or size < 0:
+            size = -1
+        chunks = []
+        while size:
+            if not self.chunk_remaining and not self._next_chunk():
+                # EOF
+                break
+            n = self.chunk_remaining
+            if 0 < size < n:
+                n = size
+            line = self.rfile.readline(n)
+            self._received(len(line))
+            chunks.append(line)
+            if size > 0:
+                size -= len(line)
+            if line.endswith(LF):
+                break
+        return EMPTY.join(chunks)
 
     def readlines(self, sizehint=0):
-        # Shamelessly stolen from StringIO
+        # Shamelessly stolen from StringIO. The sizehint only limits the
+        # number of lines: readline(0) would return no line at all.
         total = 0
         lines = []
-        line = self.readline(sizehint)
+        line = self.readline()
         while line:
             lines.append(line)
             total += len(line)
             if 0 < sizehint <= total:
                 break
-            line = self.readline(sizehint)
+            line = self.readline()
         return lines
 
     def read_trailer_lines(self):
@@ -515,15 +791,78 @@ class ChunkedRFile(object):
         self.rfile.close()
 
     def __iter__(self):
-        # Shamelessly stolen from StringIO
-        total = 0
-        line = self.readline(sizehint)
+        line = self.readline()
         while line:
             yield line
-            total += len(line)
-            if 0 < sizehint <= total:
-                break
-            line = self.readline(sizehint)
+            line = self.readline()
+
+
+class RequestTimeline(object):
+
+    """The wall clock and thread CPU times of the phases of a request.
+
+    Each mark ends the phase of that name, which began at the previous
+    mark. The first request on a connection starts with an "accept" mark
+    (or "readable", for a parked connection that the client woke up);
+    the phases that follow are:
+
+    queue: waiting on the Queue (or the executor) for a worker thread.
+      A request handed off to another pool after "parse" (see
+      HTTPServer.add_pool) waits in the "queue" phase again.
+    handshake: the SSL handshake, on the first request of an HTTPS
+      connection (CherryPyWSGIServer only).
+    read: waiting for the first bytes of the request from the client.
+    parse: reading and parsing the Request-Line and headers.
+    app: calling the WSGI application.
+    first_byte: until the first body bytes were written.
+    last_byte: until the whole response was written.
+
+    Later requests on a keep-alive connection start at "read".
+    """
+
+    def __init__(self):
+        self.marks = []
+
+    def mark(self, name):
+        """Record the end of the named phase."""
+        self.marks.append((name, time.time(), thread_time(),
+                           threading.get_ident()))
+
+    def has(self, name):
+        """Return True if the named phase has ended."""
+        for mark in self.marks:
+            if mark[0] == name:
+                return True
+        return False
+
+    def elapsed(self):
+        """Return the wall clock seconds from the first to the last mark."""
+        if not self.marks:
+            return 0.0
+        return self.marks[-1][1] - self.marks[0][1]
+
+    def phases(self):
+        """Return a list of (name, wall seconds, CPU seconds) tuples.
+
+        The CPU time is None for a phase which began in another thread.
+        """
+        phases = []
+        for prev, mark in zip(self.marks, self.marks[1:]):
+            cpu = None
+            if mark[3] == prev[3]:
+                cpu = mark[2] - prev[2]
+            phases.append((mark[0], mark[1] - prev[1], cpu))
+        return phases
+
+    def format(self):
+        """Return the phases as one line of text."""
+        parts = []
+        for name, wall, cpu in self.phases():
+            if cpu is None:
+                parts.append("%s=%.6f" % (name, wall))
+            else:
+                parts.append("%s=%.6f(cpu %.6f)" % (name, wall, cpu))
+        return " ".join(parts)
 
 
 class HTTPRequest(object):
@@ -566,6 +905,20 @@ class HTTPRequest(object):
 
         self.ready = False
         self.started_request = False
+        # The time the first bytes of the request were read.
+        self.start_time = None
+        # A RequestTimeline, if server.slow_request_time is set.
+        self.timeline = None
+        # The time by which the response must be started, and the
+        # DeadlineWatchdog watching for it (see HTTPServer.deadline).
+        self.deadline = None
+        self.watchdog = None
+        # Set to an Event once the watchdog answers 504 in our place, which
+        # is set once the 504 is written.
+        self.expired = None
+        if server.slow_request_time:
+            self.timeline = conn.timeline or RequestTimeline()
+            conn.timeline = None
         self.scheme = ntob("http")
         if self.server.ssl_adapter is not None:
             self.scheme = ntob("https")
@@ -584,6 +937,18 @@ class HTTPRequest(object):
         """Parse the next HTTP request start-line and message-headers."""
         self.rfile = SizeCheckWrapper(self.conn.rfile,
                                       self.server.max_request_header_size)
+        if self.conn.read_deadline is not None:
+            # The previous request's deadline doesn't apply to the wait
+            # for this one.
+            self.conn.set_read_deadline(None)
+        head = self.read_request_head()
+        if head is not None:
+            if self.parse_request_head(head):
+                self.ready = True
+                if self.timeline is not None:
+                    self.timeline.mark("parse")
+            return
+
         try:
             success = self.read_request_line()
         except MaxSizeExceeded:
@@ -609,6 +974,95 @@ class HTTPRequest(object):
                 return
 
         self.ready = True
+        if self.timeline is not None:
+            self.timeline.mark("parse")
+
+    def set_start_time(self):
+        """Note that the first bytes of the request have been read."""
+        self.start_time = time.time()
+        self.conn.idle = False
+        if self.timeline is not None:
+            self.timeline.mark("read")
+        if self.server.header_timeout:
+            # The rest of the head must arrive in time, however it trickles.
+            self.conn.set_read_deadline(ReadDeadline(
+                self.start_time + self.server.header_timeout))
+
+    def has_body(self):
+        """Return True if the request has a message-body to read."""
+        return bool(self.chunked_read or
+                    int(self.inheaders.get(b"Content-Length", 0) or 0))
+
+    def read_request_head(self):
+        """Read the whole request head at once, if it fits in the buffer.
+
+        Return the head (the Request-Line and headers, including the blank
+        line), or None if the head can't be peeked at in the connection's
+        read buffer; parse_request then reads it line by line instead.
+        """
+        rfile = self.conn.rfile
+        peek = getattr(rfile, 'peek', None)
+        if peek is None:
+            return None
+        bufsize = getattr(rfile, 'buffer_size', DEFAULT_BUFFER_SIZE)
+
+        # peek() returns everything buffered, and only reads from the
+        # socket if that's less than asked for.
+        data = peek(1)
+        self.set_start_time()
+        while True:
+            end = data.find(CRLF + CRLF)
+            if end >= 0:
+                break
+            if not data or data[:2] == CRLF or len(data) >= bufsize:
+                return None
+            if CRLF in data:
+                # Send 408 from here on out (see read_request_line).
+                self.started_request = True
+            more = peek(len(data) + 1)
+            if len(more) <= len(data):
+                # EOF, or no more data buffered.
+                return None
+            data = more
+        if data[:2] == CRLF:
+            return None
+        return rfile.read(end + 4)
+
+    def parse_request_head(self, head):
+        """Parse a head from read_request_head. Return success."""
+        self.started_request = True
+        lines = head[:-4].split(CRLF)
+
+        maxlen = self.server.max_request_header_size
+        if maxlen and len(head) > maxlen:
+            if len(lines[0]) + 2 > maxlen:
+                self.simple_response(
+                    "414 Request-URI Too Long",
+                    "The Request-URI sent with the request exceeds the "
+                    "maximum allowed bytes.")
+            else:
+                self.simple_response(
+                    "413 Request Entity Too Large",
+                    "The headers sent with the request exceed the maximum "
+                    "allowed bytes.")
+            return False
+
+        if head.count(LF) != head.count(CRLF):
+            self.simple_response(
+                "400 Bad Request", "HTTP requires CRLF terminators")
+            return False
+
+        if not self.parse_request_line(lines[0] + CRLF):
+            return False
+
+        try:
+            parse_header_lines(lines[1:], self.inheaders)
+        except ValueError:
+            ex = sys.exc_info()[1]
+            self.simple_response("400 Bad Request", ex.args[0])
+            return False
+
+        return self.process_request_headers()
 
     def read_request_line(self):
         # HTTP/1.1 connections are persistent by default. If a client
@@ -619,6 +1073,8 @@ class HTTPRequest(object):
         # (although your TCP stack might suffer for it: cf Apache's history
         # with FIN_WAIT_2).
         request_line = self.rfile.readline()
+        if self.start_time is None:
+            self.set_start_time()
 
         # Set started_request to True so communicate() knows to send 408
         # from here on out.
@@ -635,6 +1091,10 @@ class HTTPRequest(object):
             if not request_line:
                 return False
 
+        return self.parse_request_line(request_line)
+
+    def parse_request_line(self, request_line):
+        """Parse the Request-Line (with its CRLF). Return success."""
         if not request_line.endswith(CRLF):
             self.simple_response(
                 "400 Bad Request", "HTTP requires CRLF terminators")
@@ -721,6 +1181,10 @@ class HTTPRequest(object):
             self.simple_response("400 Bad Request", ex.args[0])
             return False
 
+        return self.process_request_headers()
+
+    def process_request_headers(self):
+        """Act on the headers read into self.inheaders. Return success."""
         mrbs = self.server.max_request_body_size
         if mrbs and int(self.inheaders.get(b"Content-Length", 0)) > mrbs:
             self.simple_response(
@@ -857,16 +1321,110 @@ class HTTPRequest(object):
                 return
             self.rfile = KnownLengthRFile(self.conn.rfile, cl)
 
+        server = self.server
+        deadline = None
+        if server.watchdog is not None:
+            seconds = server.deadline_for(self.path or b"/")
+            if seconds:
+                deadline = (self.start_time or time.time()) + seconds
+        if self.has_body() and (server.min_body_rate or deadline):
+            # The body must arrive in time for the response, too.
+            self.conn.set_read_deadline(ReadDeadline(
+                deadline, min_rate=server.min_body_rate,
+                grace=server.timeout))
+        elif self.conn.read_deadline is not None:
+            self.conn.set_read_deadline(None)
+
+        metrics = self.server.metrics
+        if metrics is None and self.timeline is None and deadline is None:
+            self.respond_gateway()
+            return
+        try:
+            if deadline is None:
+                self.respond_gateway()
+            else:
+                self.deadline = deadline
+                self.watchdog = server.watchdog
+                if self.watchdog.watch(self):
+                    self.respond_gateway()
+        except DeadlineExceeded:
+            # Answered with 504 by the watchdog; drop the rest.
+            self.expired.wait()
+        except:
+            if not self.time_out():
+                # The connection will answer 500 (if it still can).
+                self.status = b"500 Internal Server Error"
+                raise
+        finally:
+            if metrics is not None:
+                metrics.observe(self)
+            timeline = self.timeline
+            if (timeline is not None and
+                    timeline.elapsed() >= self.server.slow_request_time):
+                self.server.log_slow_request(self)
+
+    def respond_gateway(self):
+        """Call the gateway and finish the response."""
         self.server.gateway(self).respond()
 
+        if self.expired is not None:
+            raise DeadlineExceeded()
         if (self.ready and not self.sent_headers):
             self.sent_headers = True
             self.send_headers()
         if self.chunked_write:
             self.conn.wfile.write(b"0\r\n\r\n")
+        else:
+            # Send the headers, if they're still held (no body was written).
+            self.conn.wfile.flush()
+        timeline = self.timeline
+        if timeline is not None:
+            if not timeline.has("first_byte"):
+                timeline.mark("first_byte")
+            timeline.mark("last_byte")
+
+    def time_out(self):
+        """Answer 504 Gateway Timeout if the deadline has passed before the
+        response was started, e.g. when the app gave up on a blocking call
+        for lack of time. Return True if the request is answered with 504
+        (by this or by the DeadlineWatchdog)."""
+        if self.watchdog is None:
+            return False
+        if not self.sent_headers and time.time() >= self.deadline:
+            self.watchdog.time_out(self)
+        if self.expired is None:
+            return False
+        self.expired.wait()
+        return True
+
+    def send_timeout(self):
+        """Write the 504 Gateway Timeout for the DeadlineWatchdog.
+
+        The app may still be running in another thread, but won't write
+        (see DeadlineExceeded), so its held output can be sent along.
+        """
+        self.status = b"504 Gateway Timeout"
+        self.sent_headers = True
+        wfile = self.conn.wfile
+        undefer = getattr(wfile, 'undefer', None)
+        if undefer is not None:
+            undefer()
+        self._simple_response(
+            "504 Gateway Timeout",
+            "The server did not finish the request in time.")
+        uncork = getattr(wfile, 'uncork', None)
+        if uncork is not None:
+            uncork()
 
     def simple_response(self, status, msg=""):
         """Write a simple response back to the client."""
+        if self.watchdog is not None and not self.watchdog.claim(self):
+            # Answered with 504 Gateway Timeout already.
+            return
+        self._simple_response(status, msg)
+
+    def _simple_response(self, status, msg=""):
+        """Write a simple response, without claiming it from the watchdog."""
         status = str(status)
         buf = [bytes(self.server.protocol, "ascii") + SPACE +
                bytes(status, "ISO-8859-1") + CRLF,
@@ -885,6 +1443,11 @@ class HTTPRequest(object):
                 # HTTP/1.0 had no 413/414 status nor Connection header.
                 # Emit 400 instead and trust the message body is enough.
                 status = "400 Bad Request"
+        elif status[:3] == "504":
+            # The app may still be running; see DeadlineWatchdog.
+            self.close_connection = True
+            if self.response_protocol == 'HTTP/1.1':
+                buf.append(b"Connection: close\r\n")
 
         buf.append(CRLF)
         if msg:
@@ -901,20 +1464,30 @@ class HTTPRequest(object):
 
     def write(self, chunk):
         """Write unbuffered data to the client."""
+        if self.expired is not None:
+            raise DeadlineExceeded()
         if self.chunked_write and chunk:
-            buf = [bytes(hex(len(chunk)), 'ASCII')[2:], CRLF, chunk, CRLF]
-            self.conn.wfile.write(EMPTY.join(buf))
+            self.conn.wfile.writev(
+                [bytes(hex(len(chunk)), 'ASCII')[2:], CRLF, chunk, CRLF])
         else:
             self.conn.wfile.write(chunk)
+        timeline = self.timeline
+        if timeline is not None and not timeline.has("first_byte"):
+            timeline.mark("first_byte")
 
     def send_headers(self):
         """Assert, process, and send the HTTP response message-headers.
 
         You must set self.status, and self.outheaders before calling this.
         """
-        hkeys = [key.lower() for key, value in self.outheaders]
+        if self.watchdog is not None and not self.watchdog.claim(self):
+            raise DeadlineExceeded()
+        hkeys = set([key.lower() for key, value in self.outheaders])
         status = int(self.status[:3])
 
+        if self.server.draining:
+            # No more requests on this connection; see HTTPServer.drain.
+            self.close_connection = True
         if status == 413:
             # Request Entity Too Large. Close conn to avoid garbage.
             self.close_connection = True
@@ -959,24 +1532,24 @@ class HTTPRequest(object):
             # badly broken client implementations."
             remaining = getattr(self.rfile, 'remaining', 0)
             if remaining > 0:
+                # The response is ready, so the body's read deadline no
+                # longer applies; only the socket timeout does.
+                self.conn.set_read_deadline(None)
                 self.rfile.read(remaining)
 
+        buf = [status_line(self.server.protocol, self.status)]
+        for k, v in self.outheaders:
+            buf.append(header_line(k, v))
+
         if b"date" not in hkeys:
-            self.outheaders.append((
-                b"Date",
-                email.utils.formatdate(usegmt=True).encode('ISO-8859-1')
-            ))
+            buf.append(date_line())
 
         if b"server" not in hkeys:
-            self.outheaders.append(
-                (b"Server", self.server.server_name.encode('ISO-8859-1')))
+            buf.append(server_line(self.server.server_name))
 
-        buf = [self.server.protocol.encode(
-            'ascii') + SPACE + self.status + CRLF]
-        for k, v in self.outheaders:
-            buf.append(k + COLON + SPACE + v + CRLF)
         buf.append(CRLF)
-        self.conn.wfile.write(EMPTY.join(buf))
+        # Held, to go out in the same syscall as the first body chunk.
+        self.conn.wfile.hold(EMPTY.join(buf))
 
 
 class NoSSLError(Exception):
@@ -993,33 +1566,277 @@ class FatalSSLAlert(Exception):
 
 class CP_BufferedWriter(io.BufferedWriter):
 
-    """Faux file object attached to a socket object."""
+    """Faux file object attached to a socket object.
+
+    Data is sent as soon as it's written, except for held segments (the
+    response headers), which go out together with the next write. Segments
+    are sent with a single sendmsg() call where the socket supports it, as
+    memoryviews, so partial sends resume without copying.
+
+    While corked (see cork()), all writes are held, up to cork_limit bytes,
+    so several pipelined responses can go out in one flush.
+
+    While deferring (see defer()), all writes are held as well, up to
+    defer_limit bytes, for the OutputMultiplexer to send with send_held();
+    only what's written beyond that is sent at once.
+    """
+
+    cork_limit = 65536
+    """The max number of bytes to hold while corked."""
+
+    defer_limit = 0
+    """The max number of bytes to hold while deferring, or 0 if not."""
+
+    def __init__(self, raw, buffer_size=DEFAULT_BUFFER_SIZE):
+        io.BufferedWriter.__init__(self, raw, buffer_size)
+        self.bytes_written = 0
+        self._segments = []
+        self._corked = False
+        self._held_bytes = 0
+        sock = getattr(raw, '_sock', None)
+        # SSL sockets don't implement sendmsg().
+        if type(sock) is socket.socket and hasattr(sock, 'sendmsg'):
+            self._sendmsg = sock.sendmsg
+        else:
+            self._sendmsg = None
+
+    def hold(self, b):
+        """Queue b to be sent along with the next write (or flush)."""
+        self._checkClosed()
+        with self._write_lock:
+            self._segments.append(b)
+            self._held_bytes += len(b)
+
+    def cork(self):
+        """Hold all writes, and flushes, until uncork()."""
+        self._corked = True
+
+    def uncork(self):
+        """Stop holding writes, and send everything held so far (unless
+        deferring)."""
+        with self._write_lock:
+            self._corked = False
+            if not self.defer_limit:
+                self._flush_unlocked()
+
+    def defer(self, limit):
+        """Hold writes, and flushes, up to limit bytes, until undefer()."""
+        self.defer_limit = limit
+
+    def undefer(self):
+        """Stop deferring; what's still held goes out with the next flush.
+        """
+        self.defer_limit = 0
+
+    def _get_deferred(self):
+        """Number of bytes held while deferring (else 0). Read-only."""
+        if self.defer_limit:
+            return self._held_bytes
+        return 0
+    deferred = property(_get_deferred, doc=_get_deferred.__doc__)
+
+    def flush(self):
+        with self._write_lock:
+            if not self._corked and not self.defer_limit:
+                self._flush_unlocked()
 
     def write(self, b):
+        return self.writev([b])
+
+    def writev(self, segments):
+        """Write all the given segments, as one sendmsg() if possible."""
         self._checkClosed()
-        if isinstance(b, str):
-            raise TypeError("can't write str to binary stream")
+        n = 0
+        with self._write_lock:
+            for b in segments:
+                if isinstance(b, str):
+                    raise TypeError("can't write str to binary stream")
+                if ((self._corked or self.defer_limit)
+                        and not isinstance(b, bytes)):
+                    # The caller may reuse its buffer once we return.
+                    b = bytes(b)
+                n += len(b)
+                self._segments.append(b)
+            self._held_bytes += n
+            if self.defer_limit:
+                if self._held_bytes > self.defer_limit:
+                    # Send the excess now, holding on to defer_limit bytes.
+                    self._flush_unlocked(self.defer_limit)
+            elif not self._corked or self._held_bytes >= self.cork_limit:
+                self._flush_unlocked()
+        return n
+
+    def send_held(self):
+        """Send what the (non-blocking) socket takes of the held writes.
 
+        Returns the number of bytes sent; 0 if the socket isn't writable.
+        """
         with self._write_lock:
-            self._write_buf.extend(b)
-            self._flush_unlocked()
-            return len(b)
+            self._checkClosed("flush of closed file")
+            views = [memoryview(b).cast('B') for b in self._segments
+                     if len(b)]
+            if not views:
+                self._segments = []
+                self._held_bytes = 0
+                return 0
+            if len(views) > 1 and self._sendmsg is None:
+                views = [memoryview(EMPTY.join(views))]
+            try:
+                if self._sendmsg is not None:
+                    n = self._sendmsg(views[:IOV_MAX])
+                else:
+                    n = self.raw.write(views[0])
+            except (io.BlockingIOError,) + SSLWantErrors:
+                n = 0
+            n = n or 0
+            self.bytes_written += n
+            self._held_bytes -= n
+            sent = n
+            while n:
+                if n >= len(views[0]):
+                    n -= len(views.pop(0))
+                else:
+                    views[0] = views[0][n:]
+                    n = 0
+            self._segments = views
+            return sent
 
-    def _flush_unlocked(self):
+    def _flush_unlocked(self, keep=0):
+        """Send the held segments, until at most keep bytes are left."""
         self._checkClosed("flush of closed file")
-        while self._write_buf:
+        if not self._segments:
+            return
+        views = [memoryview(b).cast('B') for b in self._segments if len(b)]
+        self._segments = []
+        self._held_bytes = 0
+        if len(views) > 1 and self._sendmsg is None:
+            # No scatter/gather; one copy still beats one syscall per piece.
+            views = [memoryview(EMPTY.join(views))]
+        left = sum([len(view) for view in views])
+        while views and left > keep:
             try:
-                # ssl sockets only except 'bytes', not bytearrays
-                # so perhaps we should conditionally wrap this for perf?
-                n = self.raw.write(bytes(self._write_buf))
+                if self._sendmsg is not None:
+                    n = self._sendmsg(views[:IOV_MAX])
+                else:
+                    n = self.raw.write(views[0])
             except io.BlockingIOError as e:
-                n = e.characters_written
-            del self._write_buf[:n]
+                n = getattr(e, 'characters_written', 0)
+            n = n or 0
+            self.bytes_written += n
+            left -= n
+            # Drop what was sent, and resume mid-segment after a partial send.
+            while n:
+                if n >= len(views[0]):
+                    n -= len(views.pop(0))
+                else:
+                    views[0] = views[0][n:]
+                    n = 0
+        # Hold on to the rest (only when keeping some).
+        self._segments = views
+        self._held_bytes = left
+
+
+class DeadlineSocketIO(socket.SocketIO):
+
+    """A raw socket reader enforcing a ReadDeadline, if one is set.
+
+    The socket timeout still applies to each read; near the deadline it is
+    shortened to the time left, so a client trickling data can't hold the
+    reading thread past the deadline.
+    """
+
+    read_deadline = None
+
+    def readinto(self, b):
+        read_deadline = self.read_deadline
+        if read_deadline is None:
+            return socket.SocketIO.readinto(self, b)
+        remaining = read_deadline.remaining()
+        if remaining <= 0:
+            raise socket.timeout("timed out")
+        timeout = self._sock.gettimeout()
+        if timeout is not None and timeout <= remaining:
+            n = socket.SocketIO.readinto(self, b)
+        else:
+            self._sock.settimeout(remaining)
+            try:
+                n = socket.SocketIO.readinto(self, b)
+            finally:
+                self._sock.settimeout(timeout)
+        if n:
+            read_deadline.bytes_read += n
+        return n
+
+
+class CP_BufferedReader(io.BufferedReader):
+
+    """Faux file object attached to a socket object."""
+
+    def readinto(self, b):
+        """Read into the given writable buffer; return the number of bytes.
+
+        Unlike _pyio's (as of Python 3.11), this doesn't fail when more is
+        asked for than is buffered. Data beyond a buffer_size is read
+        straight into b.
+        """
+        view = memoryview(b).cast("B")
+        size = len(view)
+        written = 0
+        with self._read_lock:
+            while written < size:
+                avail = min(len(self._read_buf) - self._read_pos,
+                            size - written)
+                if avail:
+                    pos = self._read_pos
+                    view[written:written + avail] = \
+                        memoryview(self._read_buf)[pos:pos + avail]
+                    self._read_pos += avail
+                    written += avail
+                elif size - written > self.buffer_size:
+                    n = self.raw.readinto(view[written:])
+                    if not n:
+                        break  # EOF
+                    written += n
+                elif not self._peek_unlocked(1):
+                    break  # EOF
+        return written
+
+    def readline(self, size=-1):
+        """Read and return a line of at most size bytes.
+
+        Unlike _pyio's (as of Python 3.11), this never returns more than
+        size bytes, however the line is spread over the buffer refills.
+        """
+        if size is None:
+            size = -1
+        chunks = []
+        with self._read_lock:
+            while size:
+                buf = self._read_buf
+                pos = self._read_pos
+                if pos >= len(buf):
+                    if not self._peek_unlocked(1):
+                        break  # EOF
+                    buf = self._read_buf
+                    pos = self._read_pos
+                end = len(buf)
+                if 0 < size < end - pos:
+                    end = pos + size
+                newline = buf.find(LF, pos, end)
+                if newline >= 0:
+                    end = newline + 1
+                chunks.append(buf[pos:end])
+                self._read_pos = end
+                if newline >= 0:
+                    break
+                if size > 0:
+                    size -= end - pos
+        return EMPTY.join(chunks)
 
 
 def CP_makefile(sock, mode='r', bufsize=DEFAULT_BUFFER_SIZE):
     if 'r' in mode:
-        return io.BufferedReader(socket.SocketIO(sock, mode), bufsize)
+        return CP_BufferedReader(DeadlineSocketIO(sock, mode), bufsize)
     else:
         return CP_BufferedWriter(socket.SocketIO(sock, mode), bufsize)
 
@@ -1039,6 +1856,23 @@ class HTTPConnection(object):
     rbufsize = DEFAULT_BUFFER_SIZE
     wbufsize = DEFAULT_BUFFER_SIZE
     RequestHandlerClass = HTTPRequest
+    read_deadline = None
+    timeline = None
+    """The RequestTimeline of the connection's next request, if it was
+    started before the request (when the connection was accepted)."""
+    pool = None
+    """The ThreadPool whose WorkerThread is serving the connection."""
+    pending_request = None
+    """A parsed request handed off to another pool, to be responded to by
+    the next call to communicate()."""
+    handoff_pool = None
+    """The ThreadPool to hand the connection off to, once communicate()
+    returns (see HTTPServer.add_pool)."""
+    ssl_handshake = False
+    """If True, the SSL handshake is yet to be done, by communicate()."""
+    idle = False
+    """True from the end of a response until the first bytes of the next
+    request on the connection arrive."""
 
     def __init__(self, server, sock, makefile=CP_makefile):
         self.server = server
@@ -1047,31 +1881,116 @@ class HTTPConnection(object):
         self.wfile = makefile(sock, "wb", self.wbufsize)
         self.requests_seen = 0
 
+    def set_read_deadline(self, read_deadline):
+        """Make reads fail with socket.timeout after the ReadDeadline.
+
+        Pass None to remove the deadline.
+        """
+        self.read_deadline = read_deadline
+        raw = getattr(self.rfile, 'raw', None)
+        if isinstance(raw, DeadlineSocketIO):
+            raw.read_deadline = read_deadline
+
     def communicate(self):
-        """Read each request and respond appropriately."""
+        """Read each request and respond appropriately.
+
+        Returns True if the connection is idle but should be kept alive,
+        in which case the caller must hand it back to the server (see
+        HTTPServer.keepalive_parking) instead of closing it.
+
+        A request for a route served by another pool than self.pool is
+        kept in pending_request, and handoff_pool set, for the caller to
+        hand the connection off to that pool.
+        """
+        if self.ssl_handshake:
+            self.ssl_handshake = False
+            if not self.handshake():
+                return
         request_seen = False
+        responded = False
+        cork = getattr(self.wfile, 'cork', None)
+        batched = 0
         try:
             while True:
                 # (re)set req to None so that if something goes wrong in
                 # the RequestHandlerClass constructor, the error doesn't
                 # get written to the previous request.
                 req = None
-                req = self.RequestHandlerClass(self.server, self)
+                req = self.pending_request
+                if req is not None:
+                    self.pending_request = None
+                else:
+                    req = self.RequestHandlerClass(self.server, self)
 
-                # This order of operations should guarantee correct pipelining.
-                req.parse_request()
-                if self.server.stats['Enabled']:
-                    self.requests_seen += 1
-                if not req.ready:
-                    # Something went wrong in the parsing (and the server has
-                    # probably already made a simple_response). Return and
-                    # let the conn close.
-                    return
+                    # This order of operations should guarantee correct
+                    # pipelining.
+                    req.parse_request()
+                    if self.server.stats['Enabled']:
+                        self.requests_seen += 1
+                    if not req.ready:
+                        # Something went wrong in the parsing (and the server
+                        # has probably already made a simple_response).
+                        # Return and let the conn close.
+                        return
+
+                    if self.server.pools:
+                        pool = self.server.pool_for(req.path or b"/")
+                        if pool is not self.pool:
+                            self.pending_request = req
+                            self.handoff_pool = pool
+                            return
 
                 request_seen = True
+                responded = False
+                end_batch = False
+                if cork is not None:
+                    if req.has_body():
+                        # Flush any held responses (and 100 Continue) before
+                        # we block on the request body.
+                        self.wfile.uncork()
+                        batched = 0
+                    elif (batched < self.server.pipeline_batch
+                            and self.has_pipelined_request()):
+                        # Hold this response back while the client has more
+                        # requests lined up, to send a batch of them at once.
+                        cork()
+                        batched += 1
+                    elif batched:
+                        # The last response of the batch goes out together
+                        # with the held ones, before we block on the next
+                        # request.
+                        end_batch = True
+                        batched = 0
                 req.respond()
+                responded = True
+                if end_batch:
+                    self.wfile.uncork()
+                self.idle = True
+                if self.server.draining:
+                    if not getattr(self.wfile, 'deferred', 0):
+                        # Else counted by the output multiplexer, once sent.
+                        self.server.count_drained()
+                    return
                 if req.close_connection:
                     return
+                if (self.server.connections is not None
+                        and not self.has_buffered_input()):
+                    # Nothing more to do until the client sends again.
+                    return True
+                if self.server.pools and self.pool is not self.server.requests:
+                    # Keep the threads of a named pool for its own routes;
+                    # the next request is read in the default pool.
+                    self.handoff_pool = self.server.requests
+                    return
+                if getattr(self.wfile, 'deferred', 0):
+                    # Free this thread while the output multiplexer sends
+                    # the rest (see HTTPServer.write_behind); the next
+                    # request is read once it's done.
+                    self.handoff_pool = self.pool
+                    return
+                undefer = getattr(self.wfile, 'undefer', None)
+                if undefer is not None:
+                    undefer()
         except socket.error:
             e = sys.exc_info()[1]
             errnum = e.args[0]
@@ -1127,6 +2046,67 @@ class HTTPConnection(object):
                 except FatalSSLAlert:
                     # Close the connection.
                     return
+        finally:
+            if cork is not None:
+                try:
+                    self.wfile.uncork()
+                except (socket.error, ValueError):
+                    pass
+            if (self.server.draining and not responded and req is not None
+                    and req.ready and req is not self.pending_request):
+                # Cut off (or failed) during HTTPServer.drain.
+                self.server.count_drained(False)
+
+    def handshake(self):
+        """Do the deferred SSL handshake; return False to drop the conn."""
+        try:
+            ssl_env = self.server.ssl_adapter.handshake(self.socket)
+        except NoSSLError:
+            msg = ("The client sent a plain HTTP request, but "
+                   "this server only speaks HTTPS on this port.")
+            buf = ["%s 400 Bad Request\r\n" % self.server.protocol,
+                   "Content-Length: %s\r\n" % len(msg),
+                   "Content-Type: text/plain\r\n\r\n",
+                   msg]
+            try:
+                # Past the SSL layer, straight to the TCP socket.
+                socket.socket.sendall(
+                    self.socket, "".join(buf).encode('ISO-8859-1'))
+            except socket.error:
+                pass
+            return False
+        except socket.error:
+            e = sys.exc_info()[1]
+            if e.args and e.args[0] not in socket_errors_to_ignore:
+                self.server.error_log("SSL handshake failed: %r" % e,
+                                      level=logging.INFO)
+            return False
+        if ssl_env is None:
+            return False
+        self.ssl_env = ssl_env
+        if self.timeline is not None:
+            self.timeline.mark("handshake")
+        return True
+
+    def has_pipelined_request(self):
+        """Return True if another complete request head is buffered."""
+        if not self.has_buffered_input():
+            return False
+        peek = getattr(self.rfile, 'peek', None)
+        # With data buffered, peek() won't block.
+        return peek is not None and CRLF + CRLF in peek(1)
+
+    def has_buffered_input(self):
+        """Return True if unread request data is already buffered."""
+        rfile = self.rfile
+        read_buf = getattr(rfile, '_read_buf', None)
+        if read_buf is not None and len(read_buf) > rfile._read_pos:
+            return True
+        pending = getattr(self.socket, 'pending', None)
+        if pending is not None and pending():
+            # SSL sockets may hold decrypted data the selector can't see.
+            return True
+        return False
 
     linger = False
 
@@ -1192,9 +2172,15 @@ class WorkerThread(threading.Thread):
     """A simple flag for the calling server to know when this thread
     has begun polling the Queue."""
 
-    def __init__(self, server):
+    pool = None
+    """The ThreadPool this thread takes its connections from."""
+
+    def __init__(self, server, pool=None):
         self.ready = False
         self.server = server
+        if pool is None:
+            pool = server.requests
+        self.pool = pool
 
         self.requests_seen = 0
         self.bytes_read = 0
@@ -1234,17 +2220,29 @@ class WorkerThread(threading.Thread):
         try:
             self.ready = True
             while True:
-                conn = self.server.requests.get()
+                conn = self.pool.get()
                 if conn is _SHUTDOWNREQUEST:
                     return
+                self.pool.record_wait(time.time() - conn.queued_at)
+                if conn.timeline is not None:
+                    conn.timeline.mark("queue")
 
                 self.conn = conn
+                conn.pool = self.pool
                 if self.server.stats['Enabled']:
                     self.start_time = time.time()
+                keep_conn = False
                 try:
-                    conn.communicate()
+                    keep_conn = conn.communicate()
                 finally:
-                    conn.close()
+                    output_mux = self.server.output_mux
+                    if (output_mux is not None
+                            and getattr(conn.wfile, 'deferred', 0)):
+                        # Leave the rest of the response to the output
+                        # multiplexer (see HTTPServer.write_behind).
+                        output_mux.put(conn, keep_conn)
+                    else:
+                        self.server.release(conn, keep_conn)
                     if self.server.stats['Enabled']:
                         self.requests_seen += self.conn.requests_seen
                         self.bytes_read += self.conn.rfile.bytes_read
@@ -1257,30 +2255,304 @@ class WorkerThread(threading.Thread):
             self.server.interrupt = exc
 
 
-class ThreadPool(object):
+class RequestQueue(queue.Queue):
 
-    """A Request Queue for an HTTPServer which pools threads.
+    """A Queue of accepted connections with a configurable discipline.
 
-    ThreadPool objects must provide min, get(), put(obj), start()
-    and stop(timeout) attributes.
+    fifo
+        First in, first out (the default), like queue.Queue.
+    lifo
+        The newest connection is served first. When the queue is full, the
+        oldest waiting connection is dropped to make room for a new one.
+    codel
+        First in, first out, but once connections have waited longer than
+        `target` seconds for more than `interval` seconds straight, get()
+        drops stale connections until it finds a fresh one (the CoDel
+        "controlled delay" algorithm).
+
+    Dropped connections are passed to on_drop(conn, reason); reason is
+    'Shed Queue Full' or 'Shed Stale'.
     """
 
-    def __init__(self, server, min=10, max=-1,
-        accepted_queue_size=-1, accepted_queue_timeout=10):
-        self.server = server
-        self.min = min
-        self.max = max
-        self._threads = []
-        self._queue = queue.Queue(maxsize=accepted_queue_size)
-        self._queue_put_timeout = accepted_queue_timeout
-        self.get = self._queue.get
+    disciplines = ('fifo', 'lifo', 'codel')
+
+    def __init__(self, maxsize=0, discipline='fifo', on_drop=None,
+                 target=0.1, interval=0.5):
+        if discipline not in self.disciplines:
+            raise ValueError("Unknown queue discipline %r." % discipline)
+        queue.Queue.__init__(self, maxsize)
+        self.discipline = discipline
+        self.on_drop = on_drop
+        self.target = target
+        self.interval = interval
+        # The codel state is shared by all the worker threads calling get().
+        self._codel_lock = threading.Lock()
+        self._first_above_time = None
+
+    def _get(self):
+        if self.discipline == 'lifo':
+            return self.queue.pop()
+        return self.queue.popleft()
+
+    def pop_all(self):
+        """Remove and return all the queued items, oldest first."""
+        with self.mutex:
+            items = list(self.queue)
+            self.queue.clear()
+            self.not_full.notify_all()
+        return items
+
+    def put(self, item, block=True, timeout=None):
+        if (self.discipline == 'lifo' and item is not _SHUTDOWNREQUEST
+                and self.maxsize > 0):
+            evicted = None
+            with self.mutex:
+                if self._qsize() >= self.maxsize and (
+                        self.queue[0] is not _SHUTDOWNREQUEST):
+                    evicted = self.queue.popleft()
+                    self.not_full.notify()
+            if evicted is not None:
+                self.on_drop(evicted, 'Shed Stale')
+        queue.Queue.put(self, item, block, timeout)
+
+    def get(self, block=True, timeout=None):
+        while True:
+            item = queue.Queue.get(self, block, timeout)
+            if not self._shed_stale(item):
+                return item
 
-    def start(self):
-        """Start the pool of threads."""
-        for i in range(self.min):
-            self._threads.append(WorkerThread(self.server))
+    def _shed_stale(self, item):
+        """Drop the item and return True if codel finds it stale."""
+        if self.discipline != 'codel' or item is _SHUTDOWNREQUEST:
+            return False
+        now = time.time()
+        with self._codel_lock:
+            if now - item.queued_at < self.target:
+                self._first_above_time = None
+                return False
+            if self._first_above_time is None:
+                self._first_above_time = now + self.interval
+                return False
+            if now < self._first_above_time:
+                return False
+        # The queue has been standing for too long; shed stale work.
+        self.on_drop(item, 'Shed Stale')
+        return True
+
+
+class QueueShard(object):
+
+    """One of the queues of a ShardedRequestQueue.
+
+    The deque needs no lock of its own (append and pop are atomic); the
+    condition is only used by the workers sleeping on an empty shard.
+    """
+
+    def __init__(self):
+        self.items = collections.deque()
+        self.ready = threading.Condition(threading.Lock())
+        self.sleeping = 0
+
+
+class ShardedRequestQueue(RequestQueue):
+
+    """A RequestQueue split into several shards, to spread lock contention.
+
+    With a single queue, the thread calling put() and all the worker
+    threads calling get() contend on one lock and condition. Here, each
+    worker thread is assigned a shard (round-robin, on its first get()),
+    and takes its connections from it; only when its shard is empty does
+    it steal from the others, and only then sleep on its own shard. put()
+    places a connection on the next shard in turn with a sleeping worker,
+    if any ('round-robin'), or on the one with the fewest connections per
+    sleeping worker ('least-loaded'), and wakes a worker of that shard, or
+    failing that, of another shard to steal it. When all workers are busy,
+    a worker finishing a request takes whichever connection waits, so most
+    of them are stolen (see the steals count); the sharding then only
+    spreads the lock contention, which is its point.
+
+    maxsize bounds all shards together, and put() never blocks: it raises
+    queue.Full at once. With the lifo discipline, workers take the newest
+    connection of their own shard but steal the oldest.
+    """
+
+    placements = ('round-robin', 'least-loaded')
+
+    def __init__(self, shards=2, maxsize=0, discipline='fifo', on_drop=None,
+                 target=0.1, interval=0.5, placement='round-robin'):
+        if placement not in self.placements:
+            raise ValueError("Unknown queue placement %r." % placement)
+        RequestQueue.__init__(self, maxsize, discipline, on_drop, target,
+                              interval)
+        self.placement = placement
+        self.shards = [QueueShard() for i in range(max(shards, 1))]
+        self.steals = 0
+        self._next_shard = itertools.count()
+        self._next_worker = itertools.count()
+        self._local = threading.local()
+
+    def qsize(self):
+        return sum([len(shard.items) for shard in self.shards])
+
+    def empty(self):
+        return not self.qsize()
+
+    def full(self):
+        return 0 < self.maxsize <= self.qsize()
+
+    def _place(self):
+        """Return the index of the shard to put the next item on."""
+        shards = self.shards
+        if self.placement == 'least-loaded':
+            loads = [len(shard.items) - shard.sleeping for shard in shards]
+            return loads.index(min(loads))
+        index = next(self._next_shard) % len(shards)
+        # Skip to the next shard with a sleeping worker, if this one has
+        # none, so that the worker put() wakes takes the item from its own
+        # shard, instead of stealing it.
+        for i in range(len(shards)):
+            if shards[(index + i) % len(shards)].sleeping:
+                return (index + i) % len(shards)
+        return index
+
+    def put(self, item, block=True, timeout=None):
+        index = self._place()
+        shard = self.shards[index]
+        if item is not _SHUTDOWNREQUEST and 0 < self.maxsize <= self.qsize():
+            if self.discipline != 'lifo':
+                raise queue.Full
+            # Make room by dropping the oldest waiting connection.
+            try:
+                evicted = shard.items.popleft()
+            except IndexError:
+                raise queue.Full
+            if evicted is _SHUTDOWNREQUEST:
+                shard.items.appendleft(evicted)
+                raise queue.Full
+            self.on_drop(evicted, 'Shed Stale')
+        shard.items.append(item)
+        # Wake a worker sleeping on that shard, else one to steal it. The
+        # waker uncounts the sleeper, so each put() wakes another worker.
+        shards = self.shards
+        for i in range(len(shards)):
+            other = shards[(index + i) % len(shards)]
+            if other.sleeping:
+                with other.ready:
+                    if other.sleeping:
+                        other.sleeping -= 1
+                        other.ready.notify()
+                        return
+
+    def get(self, block=True, timeout=None):
+        index = getattr(self._local, 'shard', None)
+        if index is None:
+            index = next(self._next_worker) % len(self.shards)
+            self._local.shard = index
+        shard = self.shards[index]
+        while True:
+            try:
+                item = self._take(index)
+            except queue.Empty:
+                with shard.ready:
+                    # Count ourselves as sleeping *before* the last look,
+                    # so a put() after it is sure to wake us.
+                    shard.sleeping += 1
+                    try:
+                        item = self._take(index)
+                    except queue.Empty:
+                        shard.ready.wait()
+                        continue
+                    shard.sleeping -= 1
+            if not self._shed_stale(item):
+                return item
+
+    def pop_all(self):
+        """Remove and return all the queued items, shard by shard."""
+        items = []
+        for shard in self.shards:
+            while True:
+                try:
+                    items.append(shard.items.popleft())
+                except IndexError:
+                    break
+        return items
+
+    def _take(self, index):
+        """Pop an item off the shard, or steal one; raise queue.Empty."""
+        shards = self.shards
+        try:
+            if self.discipline == 'lifo':
+                return shards[index].items.pop()
+            return shards[index].items.popleft()
+        except IndexError:
+            pass
+        for i in range(1, len(shards)):
+            try:
+                item = shards[(index + i) % len(shards)].items.popleft()
+            except IndexError:
+                continue
+            self.steals += 1
+            return item
+        raise queue.Empty
+
+
+class ThreadPool(object):
+
+    """A Request Queue for an HTTPServer which pools threads.
+
+    ThreadPool objects must provide min, get(), put(obj), start()
+    and stop(timeout) attributes, and for HTTPServer.drain, qsize, busy,
+    close_idle() and reject_queued().
+
+    The server's default pool is unnamed; named pools serve the routes
+    given to HTTPServer.add_pool, and their threads are named after them.
+
+    With queue_shards above 1, the accepted connections are queued on a
+    ShardedRequestQueue of that many shards (placed 'round-robin' or
+    'least-loaded'), instead of a single RequestQueue.
+    """
+
+    def __init__(self, server, min=10, max=-1,
+        accepted_queue_size=-1, accepted_queue_timeout=0,
+        queue_discipline='fifo', name=None, queue_shards=0,
+        queue_placement='round-robin'):
+        self.server = server
+        self.min = min
+        self.max = max
+        self.name = name
+        self._threads = []
+        if queue_shards > 1:
+            self._queue = ShardedRequestQueue(
+                shards=queue_shards, maxsize=accepted_queue_size,
+                discipline=queue_discipline, on_drop=self._drop,
+                placement=queue_placement)
+        else:
+            self._queue = RequestQueue(maxsize=accepted_queue_size,
+                                       discipline=queue_discipline,
+                                       on_drop=self._drop)
+        self._queue_put_timeout = accepted_queue_timeout
+        self.get = self._queue.get
+        # Worker threads record their waits while the autoscaler pops them.
+        self._wait_lock = threading.Lock()
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self.shed_count = 0
+        self.autoscaler = None
+        self.stats = {
+            'Queue': lambda s: self.qsize,
+            'Threads': lambda s: len(self._threads),
+            'Threads Idle': lambda s: self.idle,
+            'Shed': lambda s: self.shed_count,
+            'Steals': lambda s: getattr(self._queue, 'steals', 0),
+        }
+
+    def start(self):
+        """Start the pool of threads."""
+        for i in range(self.min):
+            self._threads.append(WorkerThread(self.server, self))
         for worker in self._threads:
-            worker.setName("CP Server " + worker.getName())
+            worker.setName(self._thread_name(worker))
             worker.start()
         for worker in self._threads:
             while not worker.ready:
@@ -1291,13 +2563,88 @@ class ThreadPool(object):
         return len([t for t in self._threads if t.conn is None])
     idle = property(_get_idle, doc=_get_idle.__doc__)
 
-    def put(self, obj):
-        self._queue.put(obj, block=True, timeout=self._queue_put_timeout)
-        if obj is _SHUTDOWNREQUEST:
-            return
+    def _get_busy(self):
+        """Number of worker threads serving a connection. Read-only."""
+        return len([t for t in self._threads if t.conn is not None])
+    busy = property(_get_busy, doc=_get_busy.__doc__)
+
+    def _thread_name(self, worker):
+        if self.name:
+            return "CP Server %s %s" % (self.name, worker.getName())
+        return "CP Server " + worker.getName()
+
+    def put(self, obj, shed=True):
+        """Queue a connection for the workers; raise queue.Full if full.
+
+        Unless shed is False, the caller then sheds the connection, and it
+        is counted so.
+        """
+        if obj is not _SHUTDOWNREQUEST:
+            obj.queued_at = time.time()
+        try:
+            self._queue.put(obj, block=True, timeout=self._queue_put_timeout)
+        except queue.Full:
+            if shed:
+                self.shed_count += 1
+            raise
+
+    def _drop(self, conn, reason):
+        """Shed a connection the queue discipline dropped."""
+        self.shed_count += 1
+        self.server.shed(conn, reason)
+
+    def close_idle(self):
+        """Shut down the idle keep-alive connections (see
+        HTTPConnection.idle) of the workers, to free the workers."""
+        for worker in list(self._threads):
+            c = worker.conn
+            if c is not None and c.idle and not c.rfile.closed:
+                try:
+                    c.socket.shutdown(socket.SHUT_RD)
+                except TypeError:
+                    # pyOpenSSL sockets don't take an arg
+                    c.socket.shutdown()
+                except socket.error:
+                    pass
+
+    def reject_queued(self):
+        """Shed the connections still waiting for a worker (with 503).
+
+        Returns how many there were. Used by HTTPServer.drain.
+        """
+        rejected = 0
+        for conn in self._queue.pop_all():
+            if conn is _SHUTDOWNREQUEST:
+                self._queue.put(conn)
+                continue
+            self.server.shed(conn, 'Shed Draining')
+            rejected += 1
+        return rejected
+
+    def record_wait(self, seconds):
+        """Record how long a connection waited in the queue. Thread-safe."""
+        with self._wait_lock:
+            self._wait_count += 1
+            self._wait_total += seconds
+            if seconds > self._wait_max:
+                self._wait_max = seconds
+
+    def pop_wait_stats(self):
+        """Return (count, total, max) of queue waits since the last call."""
+        with self._wait_lock:
+            stats = (self._wait_count, self._wait_total, self._wait_max)
+            self._wait_count = 0
+            self._wait_total = 0.0
+            self._wait_max = 0.0
+        return stats
+
+    def _clear_dead_threads(self):
+        """Remove threads which have exited (after shrink) from the pool."""
+        self._threads = [t for t in self._threads if t.is_alive()]
 
     def grow(self, amount):
         """Spawn new worker threads (not above self.max)."""
+        self._clear_dead_threads()
         if self.max > 0:
             budget = max(self.max - len(self._threads), 0)
         else:
@@ -1312,8 +2659,8 @@ class ThreadPool(object):
         self._threads.extend(workers)
 
     def _spawn_worker(self):
-        worker = WorkerThread(self.server)
-        worker.setName("CP Server " + worker.getName())
+        worker = WorkerThread(self.server, self)
+        worker.setName(self._thread_name(worker))
         worker.start()
         return worker
 
@@ -1321,10 +2668,9 @@ class ThreadPool(object):
         """Kill off worker threads (not below self.min)."""
         # Grow/shrink the pool if necessary.
         # Remove any dead threads from our list
-        for t in self._threads:
-            if not t.isAlive():
-                self._threads.remove(t)
-                amount -= 1
+        n_threads = len(self._threads)
+        self._clear_dead_threads()
+        amount -= n_threads - len(self._threads)
 
         # calculate the number of threads above the minimum
         n_extra = max(len(self._threads) - self.min, 0)
@@ -1350,7 +2696,7 @@ class ThreadPool(object):
             endtime = time.time() + timeout
         while self._threads:
             worker = self._threads.pop()
-            if worker is not current and worker.isAlive():
+            if worker is not current and worker.is_alive():
                 try:
                     if timeout is None or timeout < 0:
                         worker.join()
@@ -1358,7 +2704,7 @@ class ThreadPool(object):
                         remaining_time = endtime - time.time()
                         if remaining_time > 0:
                             worker.join(remaining_time)
-                        if worker.isAlive():
+                        if worker.is_alive():
                             # We exhausted the timeout.
                             # Forcibly shut down the socket.
                             c = worker.conn
@@ -1381,6 +2727,98 @@ class ThreadPool(object):
     qsize = property(_get_qsize)
 
 
+class ThreadPoolAutoscaler(threading.Thread):
+
+    """Grow and shrink a ThreadPool to follow the load.
+
+    Every `interval` seconds the autoscaler samples the pool's queue depth,
+    its idle workers and how long connections waited in the queue. If more
+    connections are queued than there are idle workers, or they waited
+    longer than `max_wait` seconds on average, the pool is grown toward its
+    max (at most doubling per interval). Once some workers have been idle
+    for `cooldown` seconds straight, the pool is shrunk by the number that
+    stayed idle throughout (never below its min).
+
+    Decisions are counted in `stats`, which HTTPServer publishes as
+    stats['Autoscaler'].
+    """
+
+    def __init__(self, pool, interval=1, max_wait=0.05, cooldown=60):
+        threading.Thread.__init__(self, name="CP Server Autoscaler")
+        self.daemon = True
+        self.pool = pool
+        self.interval = interval
+        self.max_wait = max_wait
+        self.cooldown = cooldown
+        self._stopping = threading.Event()
+        self._idle_since = None
+        self._idle_floor = 0
+        self.stats = {
+            'Grown': 0,
+            'Shrunk': 0,
+            'Last Decision': None,
+            'Queue Wait Avg': 0.0,
+            'Queue Wait Max': 0.0,
+        }
+
+    def run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.tick()
+            except Exception:
+                self.pool.server.error_log(
+                    "Error in ThreadPoolAutoscaler.tick", level=logging.ERROR,
+                    traceback=True)
+
+    def stop(self):
+        self._stopping.set()
+
+    def tick(self, now=None):
+        """Sample the pool once and grow or shrink it if needed."""
+        if now is None:
+            now = time.time()
+        pool = self.pool
+        pool._clear_dead_threads()
+        n_threads = len(pool._threads)
+        qsize = pool.qsize
+        idle = pool.idle
+        count, total, longest = pool.pop_wait_stats()
+        wait = count and total / count or 0.0
+        self.stats['Queue Wait Avg'] = wait
+        self.stats['Queue Wait Max'] = longest
+
+        if qsize > idle or wait > self.max_wait:
+            self._idle_since = None
+            amount = min(max(qsize - idle, 1), max(n_threads, 1))
+            pool.grow(amount)
+            grown = len(pool._threads) - n_threads
+            if grown:
+                self.stats['Grown'] += grown
+                self._decide(now, "grow", grown, qsize, idle, wait)
+            return
+
+        if idle <= 0 or n_threads <= pool.min:
+            self._idle_since = None
+            return
+        if self._idle_since is None:
+            self._idle_since = now
+            self._idle_floor = idle
+            return
+        self._idle_floor = min(self._idle_floor, idle)
+        if now - self._idle_since >= self.cooldown:
+            amount = min(self._idle_floor, n_threads - pool.min)
+            self._idle_since = None
+            pool.shrink(amount)
+            self.stats['Shrunk'] += amount
+            self._decide(now, "shrink", amount, qsize, idle, wait)
+
+    def _decide(self, now, action, amount, qsize, idle, wait):
+        self.stats['Last Decision'] = (
+            "%s %s by %d (queue %d, idle %d, wait %.3fs)" % (
+                time.strftime("%H:%M:%S", time.localtime(now)),
+                action, amount, qsize, idle, wait))
+
+
 try:
     import fcntl
 except ImportError:
@@ -1420,6 +2858,12 @@ class SSLAdapter(object):
         * ``wrap(sock) -> (wrapped socket, ssl environ dict)``
         * ``makefile(sock, mode='r', bufsize=DEFAULT_BUFFER_SIZE) ->
           socket file object``
+
+    Adapters may also split wrap() in two, so the handshake is done by the
+    WorkerThread serving the connection instead of the accepting thread:
+
+        * ``wrap_deferred(sock) -> wrapped socket, before the handshake``
+        * ``handshake(wrapped socket) -> ssl environ dict, or None``
     """
 
     def __init__(self, certificate, private_key, certificate_chain=None):
@@ -1434,6 +2878,453 @@ class SSLAdapter(object):
         raise NotImplemented
 
 
+class TimerWheel(object):
+
+    """A hashed timing wheel which expires items after a timeout.
+
+    Each item is stored in the slot for the tick at which it expires, so
+    adding, removing and expiring an item are all O(1) no matter how many
+    items are tracked. Timeouts longer than one turn of the wheel simply
+    stay in their slot until the right turn comes around.
+    """
+
+    def __init__(self, resolution=1.0, slots=64):
+        self.resolution = resolution
+        self._slots = [set() for i in range(slots)]
+        self._expiry = {}
+        self._tick = self._get_tick(time.time())
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def _get_tick(self, now):
+        return int(now / self.resolution)
+
+    def add(self, item, timeout, now=None):
+        """Track item until it is removed or timeout seconds have passed."""
+        if now is None:
+            now = time.time()
+        self.remove(item)
+        tick = max(self._get_tick(now + timeout), self._tick + 1)
+        self._expiry[item] = tick
+        self._slots[tick % len(self._slots)].add(item)
+
+    def remove(self, item):
+        """Stop tracking item. Unknown items are ignored."""
+        tick = self._expiry.pop(item, None)
+        if tick is not None:
+            self._slots[tick % len(self._slots)].discard(item)
+
+    def expire(self, now=None):
+        """Advance the wheel to now and return the list of expired items."""
+        if now is None:
+            now = time.time()
+        tick = self._get_tick(now)
+        expired = []
+        if tick <= self._tick:
+            return expired
+        # Visit every slot passed since the last call, but never go round
+        # the wheel more than once.
+        start = max(self._tick + 1, tick - len(self._slots) + 1)
+        for t in range(start, tick + 1):
+            slot = self._slots[t % len(self._slots)]
+            for item in [i for i in slot if self._expiry[i] <= tick]:
+                slot.discard(item)
+                del self._expiry[item]
+                expired.append(item)
+        self._tick = tick
+        return expired
+
+
+class ConnectionManager(object):
+
+    """Park idle keep-alive connections until they become readable.
+
+    Between requests, a keep-alive connection is handed back to the manager
+    instead of pinning a WorkerThread in readline(). The server's accept
+    thread polls the parked sockets together with the listening socket, and
+    puts each connection back on the request Queue once the client sends
+    its next request. Idle connections are expired by a TimerWheel after
+    server.timeout seconds rather than by a per-socket timeout.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self._selector = selectors.DefaultSelector()
+        self._wheel = TimerWheel(slots=int(server.timeout or 0) + 2)
+        # Connections parked by worker threads, waiting to be registered
+        # by the polling thread.
+        self._pending = collections.deque()
+        self._conns = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._listener = None
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, self)
+
+    def _get_parked(self):
+        """Number of connections currently parked. Read-only."""
+        return len(self._conns) + len(self._pending)
+    parked = property(_get_parked, doc=_get_parked.__doc__)
+
+    def register_listener(self, sock):
+        """Poll the given listening socket alongside the parked connections.
+        """
+        self._listener = sock
+        self._selector.register(sock, selectors.EVENT_READ, None)
+
+    def wakeup(self):
+        """Make a pending select() return immediately."""
+        try:
+            self._wakeup_w.send(b'x')
+        except socket.error:
+            # The wakeup buffer is full (so select() will return anyway)
+            # or the manager has been closed.
+            pass
+
+    def put(self, conn):
+        """Park the given idle keep-alive connection. Thread-safe."""
+        if self._closed:
+            conn.close()
+            return
+        self._pending.append(conn)
+        if self._closed:
+            # close() ran after the check above, and may have emptied
+            # _pending before the append: close whatever is left in it.
+            self._close_pending()
+            return
+        self.wakeup()
+
+    def _close_pending(self):
+        while True:
+            try:
+                conn = self._pending.popleft()
+            except IndexError:
+                return
+            conn.close()
+
+    def select(self, timeout=None):
+        """Wait for activity; return (listener_ready, readable_conns).
+
+        Must be called from a single thread (the server's accept thread).
+        """
+        listener_ready = False
+        conns = []
+        with self._lock:
+            if self._closed:
+                return listener_ready, conns
+
+            now = time.time()
+            while self._pending:
+                conn = self._pending.popleft()
+                try:
+                    self._selector.register(
+                        conn.socket, selectors.EVENT_READ, conn)
+                except (ValueError, KeyError, OSError):
+                    # The socket was closed under us or is already known.
+                    conn.close()
+                    continue
+                self._conns.add(conn)
+                if self.server.timeout:
+                    self._wheel.add(conn, self.server.timeout, now)
+
+            for key, events in self._selector.select(timeout):
+                if key.data is self:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except socket.error:
+                        pass
+                elif key.data is None:
+                    listener_ready = True
+                else:
+                    conn = key.data
+                    self._unregister(conn)
+                    conns.append(conn)
+
+            for conn in self._wheel.expire():
+                self._unregister(conn)
+                conn.close()
+        return listener_ready, conns
+
+    def _unregister(self, conn):
+        self._conns.discard(conn)
+        self._wheel.remove(conn)
+        try:
+            self._selector.unregister(conn.socket)
+        except (ValueError, KeyError, OSError):
+            pass
+
+    def close(self):
+        """Close the manager and every connection still parked in it."""
+        self._closed = True
+        self.wakeup()
+        with self._lock:
+            for conn in list(self._conns):
+                self._unregister(conn)
+                conn.close()
+            self._close_pending()
+            self._selector.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+
+
+class OutputMultiplexer(threading.Thread):
+
+    """Send the held responses of slow clients (see HTTPServer.write_behind).
+
+    Once the app has returned, a WorkerThread whose response is still held
+    in the connection's CP_BufferedWriter (at most write_behind bytes of
+    it; see CP_BufferedWriter.defer) puts the connection here, instead of
+    waiting for the client to read it all. The multiplexer polls those
+    sockets, and sends to each as much as it takes whenever it becomes
+    writable. Once a response is sent, the connection is released like
+    the worker would have (see HTTPServer.release). Clients which take no
+    data for server.timeout seconds are disconnected.
+    """
+
+    def __init__(self, server):
+        threading.Thread.__init__(self, name="CP Server Output Multiplexer")
+        self.daemon = True
+        self.server = server
+        self._selector = selectors.DefaultSelector()
+        # Connections put by worker threads, waiting to be registered by
+        # the multiplexer thread.
+        self._pending = collections.deque()
+        # conn: [keep_conn, socket timeout, time of the last send]
+        self._conns = {}
+        self._stopping = False
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self.bytes_sent = 0
+        self.timeouts = 0
+        self.stats = {
+            'Connections': lambda s: self.pending,
+            'Bytes Held': lambda s: sum(
+                [conn.wfile.deferred for conn in list(self._conns)]),
+            'Bytes Sent': lambda s: self.bytes_sent,
+            'Timeouts': lambda s: self.timeouts,
+        }
+
+    def _get_pending(self):
+        """Number of connections with a response to send. Read-only."""
+        return len(self._conns) + len(self._pending)
+    pending = property(_get_pending, doc=_get_pending.__doc__)
+
+    def put(self, conn, keep_conn):
+        """Send the connection's held response. Thread-safe.
+
+        keep_conn is what communicate() returned, for HTTPServer.release.
+        """
+        self._pending.append((conn, keep_conn))
+        try:
+            self._wakeup_w.send(b'x')
+        except socket.error:
+            # The wakeup buffer is full (so select() will return anyway)
+            # or the multiplexer has been stopped.
+            pass
+
+    def run(self):
+        while not self._stopping:
+            try:
+                self.tick()
+            except Exception:
+                self.server.error_log("Error in OutputMultiplexer.tick",
+                                      level=logging.ERROR, traceback=True)
+        for conn in list(self._conns):
+            self._close(conn)
+        while self._pending:
+            conn = self._pending.popleft()[0]
+            if self.server.draining:
+                self.server.count_drained(False)
+            conn.close()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def tick(self):
+        """Send what the writable sockets take, and expire stalled ones."""
+        while self._pending:
+            conn, keep_conn = self._pending.popleft()
+            sock = conn.socket
+            self._conns[conn] = [keep_conn, sock.gettimeout(), time.time()]
+            sock.setblocking(False)
+            # Most sockets can take some more at once.
+            if self._send(conn):
+                self._selector.register(sock, selectors.EVENT_WRITE, conn)
+
+        for key, events in self._selector.select(1):
+            if key.data is None:
+                try:
+                    while self._wakeup_r.recv(4096):
+                        pass
+                except socket.error:
+                    pass
+            elif not self._send(key.data):
+                self._unregister(key.data)
+
+        timeout = self.server.timeout
+        if timeout:
+            expired = time.time() - timeout
+            for conn, state in list(self._conns.items()):
+                if state[2] < expired:
+                    self.timeouts += 1
+                    self._close(conn)
+
+    def _send(self, conn):
+        """Send to the connection; return True if there's more to send."""
+        state = self._conns[conn]
+        try:
+            n = conn.wfile.send_held()
+        except (socket.error, ValueError):
+            # The client went away.
+            self._close(conn)
+            return False
+        if n:
+            self.bytes_sent += n
+            state[2] = time.time()
+        if conn.wfile.deferred:
+            return True
+        # Sent it all: hand the connection back.
+        del self._conns[conn]
+        if self.server.draining:
+            self.server.count_drained()
+        conn.socket.settimeout(state[1])
+        self.server.release(conn, state[0])
+        return False
+
+    def _unregister(self, conn):
+        try:
+            self._selector.unregister(conn.socket)
+        except (ValueError, KeyError, OSError):
+            pass
+
+    def _close(self, conn):
+        self._unregister(conn)
+        self._conns.pop(conn, None)
+        if self.server.draining:
+            self.server.count_drained(False)
+        conn.close()
+
+    def stop(self):
+        """Stop the thread, closing the connections not done sending."""
+        self._stopping = True
+        try:
+            self._wakeup_w.send(b'x')
+        except socket.error:
+            pass
+        if self is not threading.current_thread():
+            self.join()
+
+
+class DeadlineWatchdog(threading.Thread):
+
+    """Answer 504 Gateway Timeout to requests past their deadline.
+
+    A request with a deadline (see HTTPServer.deadline) is watched from the
+    start of HTTPRequest.respond() until its response is started. If the
+    deadline passes first, the watchdog writes the 504, with "Connection:
+    close", in the app's place. The app call can't be interrupted, but
+    anything it writes from then on is dropped (see DeadlineExceeded).
+    Apps are meant to keep to the deadline themselves, which they find in
+    the 'fw.deadline' environ entry.
+    """
+
+    resolution = 0.05
+    """The seconds between checks; a 504 may be up to twice this late."""
+
+    def __init__(self, server):
+        threading.Thread.__init__(self, name="CP Server Deadline Watchdog")
+        self.daemon = True
+        self.server = server
+        self._wheel = TimerWheel(self.resolution, slots=256)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.timeouts = 0
+        self.stats = {
+            'Watched': lambda s: len(self._wheel),
+            'Timeouts': lambda s: self.timeouts,
+        }
+
+    def watch(self, req):
+        """Watch the request until claim(). Return False if its deadline
+        has passed already (it has been answered with 504 then)."""
+        now = time.time()
+        if now >= req.deadline:
+            self.time_out(req)
+            return False
+        with self._lock:
+            # The wheel expires items up to one tick early.
+            self._wheel.add(req, req.deadline - now + self.resolution, now)
+        return True
+
+    def claim(self, req):
+        """Stop watching the request, whose response is to be started.
+
+        Return False if it has been answered with 504 instead, once that
+        has been written.
+        """
+        with self._lock:
+            self._wheel.remove(req)
+            expired = req.expired
+        if expired is None:
+            return True
+        expired.wait()
+        return False
+
+    def time_out(self, req):
+        """Answer the request with 504, unless that's been done already."""
+        with self._lock:
+            self._wheel.remove(req)
+            if req.expired is not None:
+                return
+            req.expired = threading.Event()
+            self.timeouts += 1
+        self._answer(req)
+
+    def _answer(self, req):
+        try:
+            self.server.error_log(
+                "Deadline exceeded (%.3fs): %s %s" % (
+                    time.time() - (req.start_time or req.deadline),
+                    req.method.decode('ISO-8859-1'),
+                    req.uri.decode('ISO-8859-1')),
+                level=logging.WARNING)
+            observe_timeout = getattr(
+                self.server.metrics, 'observe_timeout', None)
+            if observe_timeout is not None:
+                observe_timeout(req)
+            req.send_timeout()
+        except (socket.error, ValueError):
+            # The client went away, or the connection has been closed.
+            pass
+        except Exception:
+            self.server.error_log("Error answering 504",
+                                  level=logging.ERROR, traceback=True)
+        finally:
+            req.expired.set()
+
+    def run(self):
+        while not self._stopping.wait(self.resolution):
+            with self._lock:
+                expired = self._wheel.expire()
+                for req in expired:
+                    req.expired = threading.Event()
+                self.timeouts += len(expired)
+            for req in expired:
+                self._answer(req)
+
+    def stop(self):
+        """Stop the thread; the requests still watched are left to run."""
+        self._stopping.set()
+        if self is not threading.current_thread():
+            self.join()
+
+
 class HTTPServer(object):
 
     """An HTTP server."""
@@ -1465,6 +3356,19 @@ class HTTPServer(object):
     (default 5).
     """
 
+    accept_batch = 64
+    """The max number of connections to accept each time the listening
+    socket becomes readable, before polling again (default 64)."""
+
+    tcp_defer_accept = 0
+    """If non-zero, set TCP_DEFER_ACCEPT on the listening socket, so a
+    connection is only accepted once the client has sent data, or this many
+    seconds have passed (Linux only; default 0, disabled)."""
+
+    tcp_fastopen = 0
+    """If non-zero, enable TCP_FASTOPEN on the listening socket, with a queue
+    of this many pending fast open requests (default 0, disabled)."""
+
     shutdown_timeout = 5
     """The total time, in seconds, to wait for worker threads to cleanly exit.
     """
@@ -1494,6 +3398,135 @@ class HTTPServer(object):
     nodelay = True
     """If True (the default since 3.1), sets the TCP_NODELAY socket option."""
 
+    reuse_port = False
+    """If True, sets the SO_REUSEPORT socket option, so that several server
+    processes can each bind their own listening socket to bind_addr."""
+
+    bound_socket = None
+    """An already bound and listening socket to serve on, or None (the
+    default) to create one for bind_addr. This lets several server processes
+    share one listening socket."""
+
+    draining = False
+    """True while drain() stops the server. Each request served meanwhile
+    is answered with "Connection: close"."""
+
+    drain_report = None
+    """The counts of requests 'Completed', 'Aborted' and 'Rejected' by the
+    last drain()."""
+
+    _drain_expired = False
+
+    autoscale = False
+    """If True, a ThreadPoolAutoscaler grows the worker pool toward
+    maxthreads when requests queue up, and shrinks it back toward
+    minthreads when workers stay idle (default False). The default pool
+    and each pool added must then have a max number of threads, or start()
+    raises ValueError."""
+
+    autoscale_cooldown = 60
+    """The number of seconds workers must stay idle before the autoscaler
+    removes them."""
+
+    autoscaler = None
+    """The running ThreadPoolAutoscaler, or None."""
+
+    pools = None
+    """A dict of the named worker pools added by add_pool(), or None."""
+
+    _pool_routes = ()
+
+    profiler = None
+    """If not None, an object with start() and stop() methods which is run
+    along with the worker threads (e.g. fw.wsgi.profiler.StackSampler)."""
+
+    retry_after = 1
+    """The Retry-After value, in seconds, of 503 responses sent when the
+    server sheds load (see RequestQueue)."""
+
+    _selector = None
+
+    compression_level = 0
+    """The zlib level (1-9) at which to gzip or deflate responses for
+    clients that accept it, or 0 to never compress (the default)."""
+
+    compression_min_size = 1024
+    """Responses known to be smaller than this many bytes aren't compressed.
+    """
+
+    compression_skip_types = (
+        b"image/png", b"image/jpeg", b"image/gif", b"image/webp",
+        b"image/avif", b"video/", b"audio/", b"font/woff",
+        b"application/zip", b"application/gzip", b"application/x-gzip",
+        b"application/x-bzip2", b"application/x-xz",
+        b"application/x-7z-compressed", b"application/octet-stream",
+        b"text/event-stream")
+    """Content-Type prefixes of responses never to compress: those which
+    are compressed already, or are streamed."""
+
+    pipeline_batch = 16
+    """The max number of pipelined responses to hold back and send in one
+    batch, while the client has more complete requests buffered."""
+
+    keepalive_parking = False
+    """If True, idle keep-alive connections are parked in a selector between
+    requests instead of holding a WorkerThread (default False). Parked
+    connections are closed after ``timeout`` seconds without a new request.
+    """
+
+    write_behind = 0
+    """If non-zero, the max number of bytes of a response to hold per
+    connection (default 0, off). Once the app has returned, the worker
+    thread leaves the rest of the response (up to this much, as the rest was
+    sent already) to the OutputMultiplexer, instead of waiting for a slow
+    client to read it. Doesn't apply to files sent with sendfile()."""
+
+    output_mux = None
+    """The OutputMultiplexer sending the held responses (see write_behind),
+    while the server is running."""
+
+    connections = None
+    """The ConnectionManager holding parked keep-alive connections, or None
+    if keepalive_parking is off or the server isn't running."""
+
+    header_timeout = 20
+    """The max number of seconds from the first byte of a request until its
+    whole Request-Line and headers have been read, or 0 for no limit. Unlike
+    ``timeout``, this isn't reset by each byte received, so clients sending
+    their headers very slowly are answered with 408 Request Timeout."""
+
+    min_body_rate = 500
+    """The min average rate, in bytes per second, at which request bodies
+    must be received after the first ``timeout`` seconds from the app's
+    first read of the body, or 0 for no limit. Slower uploads are answered
+    with 408 Request Timeout. The rest of a body the app didn't read is
+    drained at any rate, within the socket ``timeout`` per read."""
+
+    slow_request_time = 0
+    """If non-zero, requests taking at least this many seconds are logged
+    with a breakdown of where the time went (see RequestTimeline and
+    log_slow_request). Timelines are only recorded when this is set."""
+
+    metrics = None
+    """If not None, an object whose observe(req) method is called by the
+    worker thread after each response (e.g. fw.wsgi.metrics.MetricsRegistry).
+    Unlike the stats dict, it is meant to stay on in production. Its
+    observe_timeout(req) method, if any, is called for each request
+    answered with 504 by the DeadlineWatchdog."""
+
+    deadline = 0
+    """The max number of seconds from the first byte of a request until its
+    response is started, or 0 for no limit (see set_deadline for the limits
+    of some routes). Requests still running then are answered with 504
+    Gateway Timeout by the DeadlineWatchdog. Reading the request body
+    counts against the limit, as does waiting for an executor thread in
+    AsyncioWSGIServer."""
+
+    watchdog = None
+    """The DeadlineWatchdog, while the server is running with a deadline."""
+
+    _deadline_routes = ()
+
     ConnectionClass = HTTPConnection
     """The class to use for handling HTTP connections."""
 
@@ -1526,7 +3559,12 @@ class HTTPServer(object):
             'Queue': lambda s: getattr(self.requests, "qsize", None),
             'Threads': lambda s: len(getattr(self.requests, "_threads", [])),
             'Threads Idle': lambda s: getattr(self.requests, "idle", None),
+            'Parked Connections': lambda s: getattr(
+                self.connections, "parked", 0),
             'Socket Errors': 0,
+            'Shed Queue Full': 0,
+            'Shed Stale': 0,
+            'Shed Draining': 0,
             'Requests': lambda s: (not s['Enabled']) and -1 or sum(
                 [w['Requests'](w) for w in s['Worker Threads'].values()], 0),
             'Bytes Read': lambda s: (not s['Enabled']) and -1 or sum(
@@ -1543,6 +3581,8 @@ class HTTPServer(object):
                 [w['Bytes Written'](w) / (w['Work Time'](w) or 1e-6)
                  for w in s['Worker Threads'].values()], 0),
             'Worker Threads': {},
+            'Pools': dict([(name, pool.stats)
+                           for name, pool in (self.pools or {}).items()]),
         }
         logging.statistics["CherryPy HTTPServer %d" % id(self)] = self.stats
 
@@ -1600,6 +3640,198 @@ class HTTPServer(object):
         if self.software is None:
             self.software = "%s Server" % self.version
 
+        if self.autoscale:
+            for pool in [self.requests] + list((self.pools or {}).values()):
+                if pool.max <= 0:
+                    raise ValueError(
+                        "Autoscaling needs a max number of threads for "
+                        "the %s pool." % (pool.name or "default"))
+
+        self.prepare_socket()
+        # The listener is polled, so accept() never blocks the tick loop.
+        self.socket.setblocking(False)
+
+        if self.keepalive_parking:
+            self.connections = ConnectionManager(self)
+            self.connections.register_listener(self.socket)
+        else:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self.socket, selectors.EVENT_READ)
+            # Lets stop() interrupt select() even after the listener has
+            # been closed under it.
+            self._wakeup = socket.socketpair()
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ)
+
+        if self.write_behind:
+            self.output_mux = OutputMultiplexer(self)
+            self.stats['Write Behind'] = self.output_mux.stats
+            self.output_mux.start()
+        self._start_watchdog()
+
+        # Create worker threads
+        self.requests.start()
+        pools = list((self.pools or {}).values())
+        for pool in pools:
+            pool.start()
+
+        if self.autoscale:
+            self.autoscaler = ThreadPoolAutoscaler(
+                self.requests, cooldown=self.autoscale_cooldown)
+            self.stats['Autoscaler'] = self.autoscaler.stats
+            self.autoscaler.start()
+            for pool in pools:
+                pool.autoscaler = ThreadPoolAutoscaler(
+                    pool, cooldown=self.autoscale_cooldown)
+                pool.autoscaler.setName(
+                    "CP Server %s Autoscaler" % pool.name)
+                pool.stats['Autoscaler'] = pool.autoscaler.stats
+                pool.autoscaler.start()
+
+        if self.profiler is not None:
+            self.profiler.start()
+
+        self.ready = True
+        self._start_time = time.time()
+        while self.ready:
+            try:
+                self.tick()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
+                               traceback=True)
+            if self.interrupt:
+                while self.interrupt is True:
+                    # Wait for self.stop() to complete. See _set_interrupt.
+                    time.sleep(0.1)
+                if self.interrupt:
+                    raise self.interrupt
+
+    def add_pool(self, name, routes, min=1, max=-1, queue_size=-1):
+        """Serve the requests for the routes in a worker pool of their own.
+
+        The routes are path prefixes, as given to WSGIPathInfoDispatcher.
+        Requests for them are served by the pool's own min (up to max, when
+        autoscaling) threads, so slow requests there, like large uploads,
+        can't take up the workers of the other routes. At most queue_size
+        (-1 for no limit) connections wait for a thread of the pool; others
+        are shed with 503. Returns the pool.
+
+        Pools must be added before the server is started.
+        """
+        if self.pools is None:
+            self.pools = {}
+        if name in self.pools:
+            raise ValueError("Pool %r already exists." % name)
+        pool = self._make_pool(name, min, max, queue_size)
+        self.pools[name] = pool
+        self.stats['Pools'][name] = pool.stats
+        pool_routes = list(self._pool_routes)
+        for route in routes:
+            prefix = route.rstrip('/').encode('ISO-8859-1')
+            pool_routes.append((prefix, pool))
+        # Longest prefix first, as in WSGIPathInfoDispatcher.
+        pool_routes.sort(key=lambda item: item[0], reverse=True)
+        self._pool_routes = pool_routes
+        return pool
+
+    def _make_pool(self, name, min, max, queue_size):
+        return ThreadPool(self, min=min, max=max,
+                          accepted_queue_size=queue_size, name=name)
+
+    def set_deadline(self, routes, seconds):
+        """Give requests for the routes (path prefixes, as for add_pool)
+        seconds to start their response, instead of ``deadline`` (0 for no
+        limit). Deadlines must be set before the server is started."""
+        prefixes = [route.rstrip('/').encode('ISO-8859-1') for route in routes]
+        deadline_routes = [(prefix, limit) for prefix, limit
+                           in self._deadline_routes if prefix not in prefixes]
+        for prefix in prefixes:
+            deadline_routes.append((prefix, seconds))
+        # Longest prefix first, as in WSGIPathInfoDispatcher.
+        deadline_routes.sort(key=lambda item: item[0], reverse=True)
+        self._deadline_routes = deadline_routes
+
+    def deadline_for(self, path):
+        """Return the deadline in seconds of requests for the path (bytes),
+        or 0 for none."""
+        for prefix, seconds in self._deadline_routes:
+            if path.startswith(prefix + b"/") or path == prefix:
+                return seconds
+        return self.deadline
+
+    def _start_watchdog(self):
+        if self.deadline or [seconds for prefix, seconds
+                             in self._deadline_routes if seconds]:
+            self.watchdog = DeadlineWatchdog(self)
+            self.stats['Deadlines'] = self.watchdog.stats
+            self.watchdog.start()
+
+    def _stop_watchdog(self):
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+
+    def pool_for(self, path):
+        """Return the pool serving requests for the path (bytes)."""
+        for prefix, pool in self._pool_routes:
+            if path.startswith(prefix + b"/") or path == prefix:
+                return pool
+        return self.requests
+
+    def release(self, conn, keep_conn):
+        """Hand off, park or close a connection done with communicate(),
+        which returned keep_conn."""
+        undefer = getattr(conn.wfile, 'undefer', None)
+        if undefer is not None:
+            undefer()
+        handoff_pool = conn.handoff_pool
+        connections = self.connections
+        if handoff_pool is not None:
+            conn.handoff_pool = None
+            self.hand_off(conn, handoff_pool)
+        elif keep_conn and connections is not None:
+            connections.put(conn)
+        else:
+            conn.close()
+
+    def hand_off(self, conn, pool):
+        """Put a connection with a pending request, or between requests,
+        on another pool.
+
+        If that pool's queue is full, a pending (or pipelined) request is
+        answered with 503 (or, from the output multiplexer, just closed),
+        and a connection between requests just closed.
+        """
+        if not self.ready and (not self.draining or self._drain_expired):
+            # The pool may have stopped already.
+            if self.draining and conn.pending_request is not None:
+                self.count_drained(False)
+            conn.close()
+            return
+        pending = (conn.pending_request is not None
+                   or conn.has_buffered_input())
+        try:
+            pool.put(conn, shed=pending)
+        except queue.Full:
+            if not pending:
+                conn.close()
+            elif threading.current_thread() is self.output_mux:
+                # Shed without the 503: a blocking write would hold up the
+                # output multiplexer, and all the slow clients with it.
+                self.stats['Shed Queue Full'] += 1
+                conn.close()
+            else:
+                self.shed(conn)
+
+    def prepare_socket(self):
+        """Create self.socket for bind_addr and start listening on it."""
+        if self.bound_socket is not None:
+            self.socket = self.bound_socket
+            # Timeout so KeyboardInterrupt can be caught on Win32
+            self.socket.settimeout(1)
+            return
+
         # Select the appropriate socket
         if isinstance(self.bind_addr, basestring):
             # AF_UNIX socket
@@ -1653,27 +3885,37 @@ class HTTPServer(object):
 
         # Timeout so KeyboardInterrupt can be caught on Win32
         self.socket.settimeout(1)
+        if not isinstance(self.bind_addr, basestring):
+            self.set_listen_options()
         self.socket.listen(self.request_queue_size)
 
-        # Create worker threads
-        self.requests.start()
-
-        self.ready = True
-        self._start_time = time.time()
-        while self.ready:
+    def set_listen_options(self):
+        """Apply the opt-in TCP options to the (bound) listening socket."""
+        options = [('TCP_DEFER_ACCEPT', self.tcp_defer_accept),
+                   ('TCP_FASTOPEN', self.tcp_fastopen)]
+        for name, value in options:
+            if not value:
+                continue
+            if not hasattr(socket, name):
+                self.error_log("%s is not supported on this platform." % name,
+                               level=logging.WARNING)
+                continue
             try:
-                self.tick()
-            except (KeyboardInterrupt, SystemExit):
-                raise
-            except:
-                self.error_log("Error in HTTPServer.tick", level=logging.ERROR,
-                               traceback=True)
-            if self.interrupt:
-                while self.interrupt is True:
-                    # Wait for self.stop() to complete. See _set_interrupt.
-                    time.sleep(0.1)
-                if self.interrupt:
-                    raise self.interrupt
+                self.socket.setsockopt(
+                    socket.IPPROTO_TCP, getattr(socket, name), int(value))
+            except socket.error as exc:
+                self.error_log("Could not set %s: %s" % (name, exc),
+                               level=logging.WARNING)
+
+    def log_slow_request(self, req):
+        """Log a request which took at least slow_request_time seconds."""
+        status = req.status[:3]
+        if isinstance(status, bytes):
+            status = status.decode('ISO-8859-1')
+        self.error_log("Slow request (%.3fs): %s %s %s: %s" % (
+            req.timeline.elapsed(), req.method.decode('ISO-8859-1'),
+            req.uri.decode('ISO-8859-1'), status, req.timeline.format()),
+            level=logging.WARNING)
 
     def error_log(self, msg="", level=20, traceback=False):
         # Override this in subclasses as desired
@@ -1689,6 +3931,8 @@ class HTTPServer(object):
         self.socket = socket.socket(family, type, proto)
         prevent_socket_inheritance(self.socket)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         if self.nodelay and not isinstance(self.bind_addr, str):
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
@@ -1711,13 +3955,58 @@ class HTTPServer(object):
         self.socket.bind(self.bind_addr)
 
     def tick(self):
-        """Accept a new connection and put it on the Queue."""
+        """Accept new connections and put them on the Queue."""
+        connections = self.connections
+        if connections is None:
+            selector = self._selector
+            if selector is None:
+                return
+            try:
+                events = selector.select(1)
+            except (ValueError, OSError):
+                # The listening socket was closed by stop().
+                events = []
+            if not self.ready:
+                self._selector = None
+                selector.close()
+                for sock in self._wakeup:
+                    sock.close()
+            elif events:
+                self.accept()
+            return
+
+        listener_ready, conns = connections.select(1)
+        for conn in conns:
+            # A parked keep-alive connection has a new request.
+            if self.slow_request_time:
+                conn.timeline = RequestTimeline()
+                conn.timeline.mark("readable")
+            try:
+                self.requests.put(conn)
+            except queue.Full:
+                self.shed(conn)
+        if listener_ready and self.ready:
+            self.accept()
+
+    def accept(self):
+        """Accept pending connections (up to accept_batch) onto the Queue."""
+        for i in range(self.accept_batch):
+            if not self.accept_one():
+                break
+
+    def accept_one(self):
+        """Accept a new connection and put it on the Queue.
+
+        Return False if there was no connection to accept (or the listening
+        socket failed), True otherwise.
+        """
         try:
             s, addr = self.socket.accept()
             if self.stats['Enabled']:
                 self.stats['Accepts'] += 1
             if not self.ready:
-                return
+                s.close()
+                return False
 
             prevent_socket_inheritance(s)
             if hasattr(s, 'settimeout'):
@@ -1725,8 +4014,15 @@ class HTTPServer(object):
 
             makefile = CP_makefile
             ssl_env = {}
+            ssl_handshake = False
             # if ssl cert and key are set, we try to be a secure HTTP server
-            if self.ssl_adapter is not None:
+            if getattr(self.ssl_adapter, 'handshake', None) is not None:
+                # Leave the handshake to the WorkerThread, so a slow client
+                # can't hold up the accepting of other connections.
+                s = self.ssl_adapter.wrap_deferred(s)
+                makefile = self.ssl_adapter.makefile
+                ssl_handshake = True
+            elif self.ssl_adapter is not None:
                 try:
                     s, ssl_env = self.ssl_adapter.wrap(s)
                 except NoSSLError:
@@ -1744,9 +4040,9 @@ class HTTPServer(object):
                         x = sys.exc_info()[1]
                         if x.args[0] not in socket_errors_to_ignore:
                             raise
-                    return
+                    return True
                 if not s:
-                    return
+                    return True
                 makefile = self.ssl_adapter.makefile
                 # Re-apply our timeout since we may have a new socket object
                 if hasattr(s, 'settimeout'):
@@ -1769,20 +4065,27 @@ class HTTPServer(object):
                 conn.remote_port = addr[1]
 
             conn.ssl_env = ssl_env
+            conn.ssl_handshake = ssl_handshake
+            if self.slow_request_time:
+                conn.timeline = RequestTimeline()
+                conn.timeline.mark("accept")
 
             try:
                 self.requests.put(conn)
             except queue.Full:
-                # Just drop the conn. TODO: write 503 back?
-                conn.close()
-                return
+                self.shed(conn)
+            return True
         except socket.timeout:
             # The only reason for the timeout in start() is so we can
             # notice keyboard interrupts on Win32, which don't interrupt
             # accept() by default
-            return
+            return False
         except socket.error:
             x = sys.exc_info()[1]
+            if x.args[0] in socket_errors_nonblocking:
+                # The listener is drained; wait for the next wakeup. See
+                # https://bitbucket.org/cherrypy/cherrypy/issue/479.
+                return False
             if self.stats['Enabled']:
                 self.stats['Socket Errors'] += 1
             if x.args[0] in socket_error_eintr:
@@ -1792,17 +4095,39 @@ class HTTPServer(object):
                 # will then go ahead and poll for and handle the signal
                 # elsewhere. See
                 # https://bitbucket.org/cherrypy/cherrypy/issue/707.
-                return
-            if x.args[0] in socket_errors_nonblocking:
-                # Just try again. See
-                # https://bitbucket.org/cherrypy/cherrypy/issue/479.
-                return
+                return False
             if x.args[0] in socket_errors_to_ignore:
                 # Our socket was closed.
                 # See https://bitbucket.org/cherrypy/cherrypy/issue/686.
-                return
+                return False
             raise
 
+    def shed(self, conn, reason='Shed Queue Full'):
+        """Answer a connection we can't serve with 503, and close it.
+
+        A TLS connection yet to do its handshake (see ssl_handshake) is just
+        closed: writing the 503 would do the handshake first, blocking for
+        up to `timeout` seconds on a client which doesn't take part.
+        """
+        self.stats[reason] += 1
+        if getattr(conn, 'ssl_handshake', False):
+            conn.close()
+            return
+        if reason == 'Shed Draining':
+            msg = b"The server is shutting down, please try again later."
+        else:
+            msg = b"The server is overloaded, please try again later."
+        buf = [bytes(self.protocol, "ascii"), b" 503 Service Unavailable\r\n",
+               b"Content-Length: ", str(len(msg)).encode('ascii'), CRLF,
+               b"Content-Type: text/plain\r\n",
+               b"Retry-After: ", str(self.retry_after).encode('ascii'), CRLF,
+               b"Connection: close\r\n\r\n", msg]
+        try:
+            conn.wfile.write(EMPTY.join(buf))
+        except socket.error:
+            pass
+        conn.close()
+
     def _get_interrupt(self):
         return self._interrupt
 
@@ -1816,6 +4141,81 @@ class HTTPServer(object):
 
     def stop(self):
         """Gracefully shutdown a server that is serving forever."""
+        self._stop_accepting()
+        self.requests.stop(self.shutdown_timeout)
+        for pool in (self.pools or {}).values():
+            pool.stop(self.shutdown_timeout)
+        self._stop_output_mux()
+        self._stop_watchdog()
+
+    def _stop_output_mux(self):
+        if self.output_mux is not None:
+            self.output_mux.stop()
+            self.output_mux = None
+
+    def drain(self, timeout=None):
+        """Stop a server that is serving forever, letting it finish its work.
+
+        Where stop() closes the connections waiting for a worker thread, and
+        keeps the requests in progress for only shutdown_timeout seconds,
+        drain() stops accepting, serves the connections already accepted
+        (with "Connection: close"), and waits up to timeout seconds (default
+        shutdown_timeout) for their requests to finish. Connections still
+        waiting then are answered with 503, and the requests still in
+        progress are cut off, as by stop(). Idle keep-alive connections are
+        closed at once.
+
+        The timeout is a soft limit: a thread can't be killed, so drain()
+        returns only once the worker threads have exited, and an app which
+        neither reads the request nor writes the response keeps its worker
+        (and drain()) until it returns.
+
+        Call it from another thread than the one running start(). Returns
+        the drain_report: the number of requests 'Completed' (their
+        response sent in full) during the drain, 'Aborted' (cut off before
+        that, or failed) and 'Rejected' (never started, answered 503).
+        """
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        endtime = time.time() + timeout
+        self._drain_lock = threading.Lock()
+        self.drain_report = report = {
+            'Completed': 0, 'Aborted': 0, 'Rejected': 0}
+        self._drain_expired = False
+        self.draining = True
+        self._stop_accepting()
+        pools = [self.requests] + list((self.pools or {}).values())
+        for pool in pools:
+            pool.close_idle()
+        output_mux = self.output_mux
+        while time.time() < endtime and ([
+                pool for pool in pools if pool.qsize or pool.busy] or (
+                output_mux is not None and output_mux.pending)):
+            time.sleep(0.05)
+        # The pools stop one by one, so no more hand-offs between them.
+        self._drain_expired = True
+        for pool in pools:
+            report['Rejected'] += pool.reject_queued()
+        # The requests still in progress count themselves, as they finish
+        # or fail, until the workers (and the output multiplexer) are gone.
+        for pool in pools:
+            pool.stop(max(endtime - time.time(), 0.01))
+        self._stop_output_mux()
+        self._stop_watchdog()
+        self.draining = False
+        return report
+
+    def count_drained(self, completed=True):
+        """Count a request completed (or aborted) during drain().
+
+        Thread-safe.
+        """
+        with self._drain_lock:
+            self.drain_report['Completed' if completed else 'Aborted'] += 1
+
+    def _stop_accepting(self):
+        """Close the listening socket and parked connections, and stop the
+        autoscalers and profiler; the worker threads keep running."""
         self.ready = False
         if self._start_time is not None:
             self._run_time += (time.time() - self._start_time)
@@ -1823,7 +4223,10 @@ class HTTPServer(object):
 
         sock = getattr(self, "socket", None)
         if sock:
-            if not isinstance(self.bind_addr, basestring):
+            # A bound_socket may be shared with other processes, one of
+            # which would accept the touch; accept() doesn't block anyway.
+            if (self.bound_socket is None and
+                    not isinstance(self.bind_addr, basestring)):
                 # Touch our own socket to make accept() return immediately.
                 try:
                     host, port = sock.getsockname()[:2]
@@ -1858,7 +4261,27 @@ class HTTPServer(object):
                 sock.close()
             self.socket = None
 
-        self.requests.stop(self.shutdown_timeout)
+        if self.connections is not None:
+            self.connections.close()
+            self.connections = None
+        if self._selector is not None:
+            # Interrupt select(); tick() then closes the selector.
+            try:
+                self._wakeup[1].send(b'x')
+            except socket.error:
+                pass
+
+        if self.autoscaler is not None:
+            self.autoscaler.stop()
+            self.autoscaler = None
+
+        if self.profiler is not None:
+            self.profiler.stop()
+
+        for pool in (self.pools or {}).values():
+            if pool.autoscaler is not None:
+                pool.autoscaler.stop()
+                pool.autoscaler = None
 
 
 class Gateway(object):
@@ -1877,7 +4300,7 @@ class Gateway(object):
 # These may either be wsgiserver.SSLAdapter subclasses or the string names
 # of such classes (in which case they will be lazily loaded).
 ssl_adapters = {
-    'builtin': 'cherrypy.wsgiserver.ssl_builtin.BuiltinSSLAdapter',
+    'builtin': 'fw.externals.ssl_builtin.BuiltinSSLAdapter',
 }
 
 
@@ -1911,17 +4334,30 @@ def get_ssl_adapter_class(name='builtin'):
 
 class CherryPyWSGIServer(HTTPServer):
 
-    """A subclass of HTTPServer which calls a WSGI application."""
+    """A subclass of HTTPServer which calls a WSGI application.
+
+    Accepted connections wait for a worker thread on the queue of the
+    ThreadPool. By default (accepted_queue_size -1) it is unbounded, as in
+    CherryPy, so no connection is ever shed: give it a size for the server
+    to answer 503 instead once that many are waiting, or to drop the oldest
+    of them with the 'lifo' queue_discipline. A full queue sheds at once,
+    as accepted_queue_timeout is 0 (CherryPy waited up to 10 seconds, with
+    the accept thread, and every connection behind it, blocked meanwhile).
+    """
 
     wsgi_version = (1, 0)
     """The version of WSGI to produce."""
 
     def __init__(self, bind_addr, wsgi_app, numthreads=10, server_name=None,
                  max=-1, request_queue_size=5, timeout=10, shutdown_timeout=5,
-                 accepted_queue_size=-1, accepted_queue_timeout=10):
+                 accepted_queue_size=-1, accepted_queue_timeout=0,
+                 queue_discipline='fifo', queue_shards=0,
+                 queue_placement='round-robin'):
         self.requests = ThreadPool(self, min=numthreads or 1, max=max,
             accepted_queue_size=accepted_queue_size,
-            accepted_queue_timeout=accepted_queue_timeout)
+            accepted_queue_timeout=accepted_queue_timeout,
+            queue_discipline=queue_discipline, queue_shards=queue_shards,
+            queue_placement=queue_placement)
         self.wsgi_app = wsgi_app
         self.gateway = wsgi_gateways[self.wsgi_version]
 
@@ -1942,6 +4378,80 @@ class CherryPyWSGIServer(HTTPServer):
         self.requests.min = value
     numthreads = property(_get_numthreads, _set_numthreads)
 
+    def _get_maxthreads(self):
+        return self.requests.max
+
+    def _set_maxthreads(self, value):
+        self.requests.max = value
+    maxthreads = property(_get_maxthreads, _set_maxthreads)
+
+
+# Request header names mapped to their WSGI environ keys.
+_environ_names = {
+    b"Content-Type": "CONTENT_TYPE",
+    b"Content-Length": "CONTENT_LENGTH",
+}
+
+
+def environ_name(header_name):
+    """Return (and cache) the environ key for the given request header."""
+    name = header_name.decode('ISO-8859-1').upper().replace("-", "_")
+    if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+        name = "HTTP_" + name
+    if len(_environ_names) < MAX_CACHED_HEADER_LINES:
+        _environ_names[header_name] = name
+    return name
+
+
+def negotiate_encoding(accept_encoding):
+    """Return b"gzip" or b"deflate" per the given Accept-Encoding, or None.
+    """
+    if not accept_encoding:
+        return None
+    qvalues = {}
+    for coding in accept_encoding.lower().split(b","):
+        coding, _, params = coding.partition(b";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith(b"q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qvalues[coding.strip()] = q
+    star = qvalues.get(b"*", 0.0)
+    best = None
+    best_q = 0.0
+    for coding in (b"gzip", b"deflate"):
+        q = qvalues.get(coding, star)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class FileWrapper(object):
+
+    """The wsgi.file_wrapper: an iterable over a file-like object.
+
+    The gateway sends a wrapped regular file with os.sendfile() when it can
+    (see WSGIGateway.sendfile); otherwise it's read in blksize chunks.
+    """
+
+    def __init__(self, filelike, blksize=65536):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        data = self.filelike.read(self.blksize)
+        if data:
+            return data
+        raise StopIteration
+
 
 class WSGIGateway(Gateway):
 
@@ -1952,6 +4462,10 @@ class WSGIGateway(Gateway):
         self.started_response = False
         self.env = self.get_environ()
         self.remaining_bytes_out = None
+        # None until the first body chunk, then a zlib compressobj, or
+        # False if the response isn't compressed.
+        self.compressor = None
+        self.size_hint = None
 
     def get_environ(self):
         """Return a new environ dict targeting the given wsgi.version"""
@@ -1960,7 +4474,20 @@ class WSGIGateway(Gateway):
     def respond(self):
         """Process the current request."""
         response = self.req.server.wsgi_app(self.env, self.start_response)
+        if self.req.timeline is not None:
+            self.req.timeline.mark("app")
+        server = self.req.server
+        if server.output_mux is not None:
+            # Hold the body rather than wait for a slow client to read it.
+            self.req.conn.wfile.defer(server.write_behind)
         try:
+            if isinstance(response, (list, tuple)):
+                self.size_hint = sum([len(chunk) for chunk in response])
+            if (isinstance(response, FileWrapper)
+                    and self.started_response
+                    and not self.init_compressor()
+                    and self.sendfile(response)):
+                return
             for chunk in response:
                 # "The start_response callable must not actually transmit
                 # the response headers. Instead, it must store them for the
@@ -1972,10 +4499,101 @@ class WSGIGateway(Gateway):
                     if isinstance(chunk, unicodestr):
                         chunk = chunk.encode('ISO-8859-1')
                     self.write(chunk)
+            if self.compressor:
+                self.write_encoded(self.compressor.flush())
         finally:
             if hasattr(response, "close"):
                 response.close()
 
+    def init_compressor(self):
+        """Decide whether to compress the response; return the compressor.
+
+        The response is compressed (see HTTPServer.compression_level) if the
+        client accepts gzip or deflate, and it isn't already compressed,
+        too small, or of a type listed in compression_skip_types. The
+        response headers are adjusted to match.
+        """
+        if self.compressor is not None:
+            return self.compressor
+        self.compressor = False
+        req = self.req
+        server = req.server
+        if not server.compression_level or req.method == b'HEAD':
+            return False
+        status = int(req.status[:3])
+        if status < 200 or status in (204, 206, 304):
+            return False
+        headers = dict([(k.lower(), v) for k, v in req.outheaders])
+        if b"content-encoding" in headers:
+            return False
+        ctype = headers.get(b"content-type", EMPTY).split(b";")[0]
+        if ctype.strip().lower().startswith(server.compression_skip_types):
+            return False
+        size = self.remaining_bytes_out
+        if size is None:
+            size = self.size_hint
+        if size is not None and size < server.compression_min_size:
+            return False
+
+        # The response depends on Accept-Encoding from here on.
+        vary = headers.get(b"vary")
+        if vary is None:
+            req.outheaders.append((b"Vary", b"Accept-Encoding"))
+        elif b"accept-encoding" not in vary.lower():
+            req.outheaders = [(k, v) for k, v in req.outheaders
+                              if k.lower() != b"vary"]
+            req.outheaders.append((b"Vary", vary + b", Accept-Encoding"))
+
+        encoding = negotiate_encoding(req.inheaders.get(b"Accept-Encoding"))
+        if encoding is None:
+            return False
+        req.outheaders = [(k, v) for k, v in req.outheaders
+                          if k.lower() != b"content-length"]
+        req.outheaders.append((b"Content-Encoding", encoding))
+        # The compressed length isn't known up front; send_headers will
+        # use the chunked transfer-coding (or close the connection).
+        self.remaining_bytes_out = None
+        wbits = 16 + zlib.MAX_WBITS if encoding == b"gzip" else zlib.MAX_WBITS
+        self.compressor = zlib.compressobj(
+            server.compression_level, zlib.DEFLATED, wbits)
+        return self.compressor
+
+    def sendfile(self, wrapper):
+        """Send a wrapped file with os.sendfile; return False if we can't.
+
+        Only regular files with a declared Content-Length are sent this way,
+        and only over plain (non-SSL) sockets. The file contents then go
+        straight from the page cache to the socket, never through Python.
+        """
+        req = self.req
+        rbo = self.remaining_bytes_out
+        if (rbo is None or not hasattr(os, 'sendfile')
+                or req.server.ssl_adapter is not None
+                or not isinstance(req.conn.wfile, CP_BufferedWriter)):
+            return False
+        filelike = wrapper.filelike
+        try:
+            offset = filelike.tell()
+            st = os.fstat(filelike.fileno())
+        except (AttributeError, OSError, ValueError):
+            return False
+        if not stat.S_ISREG(st.st_mode) or st.st_size - offset < rbo:
+            return False
+
+        if not req.sent_headers:
+            req.sent_headers = True
+            req.send_headers()
+        if req.expired is not None:
+            raise DeadlineExceeded()
+        req.conn.wfile.undefer()
+        req.conn.wfile.uncork()
+        if rbo:
+            sent = req.conn.socket.sendfile(filelike, offset, rbo)
+            if sent < rbo:
+                raise socket.error(errno.EPIPE, "The client went away "
+                                   "before the whole file was sent.")
+        return True
+
     def start_response(self, status, headers, exc_info=None):
         """WSGI callable to begin the HTTP response."""
         # "The application may call start_response more than once,
@@ -1993,6 +4611,8 @@ class WSGIGateway(Gateway):
                 raise exc_info[0](exc_info[1]).with_traceback(exc_info[2])
             finally:
                 exc_info = None
+        # Decide on compression again, for the new headers.
+        self.compressor = None
 
         # According to PEP 3333, when using Python 3, the response status
         # and headers must be bytes masquerading as unicode; that is, they
@@ -2025,6 +4645,15 @@ class WSGIGateway(Gateway):
         if not self.started_response:
             raise AssertionError("WSGI write called before start_response.")
 
+        if self.init_compressor():
+            chunk = self.compressor.compress(chunk)
+            if not chunk:
+                # zlib is still buffering.
+                return
+        self.write_encoded(chunk)
+
+    def write_encoded(self, chunk):
+        """Write the given (possibly compressed) body data to the client."""
         chunklen = len(chunk)
         rbo = self.remaining_bytes_out
         if rbo is not None and chunklen > rbo:
@@ -2076,6 +4705,7 @@ class WSGIGateway_10(WSGIGateway):
             'SERVER_PROTOCOL': req.request_protocol.decode('ISO-8859-1'),
             'SERVER_SOFTWARE': req.server.software,
             'wsgi.errors': sys.stderr,
+            'wsgi.file_wrapper': FileWrapper,
             'wsgi.input': req.rfile,
             'wsgi.multiprocess': False,
             'wsgi.multithread': True,
@@ -2090,22 +4720,22 @@ class WSGIGateway_10(WSGIGateway):
         else:
             env["SERVER_PORT"] = str(req.server.bind_addr[1])
 
-        # Request headers
+        # Request headers (including CONTENT_TYPE/CONTENT_LENGTH)
+        names = _environ_names
         for k, v in req.inheaders.items():
-            k = k.decode('ISO-8859-1').upper().replace("-", "_")
-            env["HTTP_" + k] = v.decode('ISO-8859-1')
-
-        # CONTENT_TYPE/CONTENT_LENGTH
-        ct = env.pop("HTTP_CONTENT_TYPE", None)
-        if ct is not None:
-            env["CONTENT_TYPE"] = ct
-        cl = env.pop("HTTP_CONTENT_LENGTH", None)
-        if cl is not None:
-            env["CONTENT_LENGTH"] = cl
+            name = names.get(k)
+            if name is None:
+                name = environ_name(k)
+            env[name] = v.decode('ISO-8859-1')
 
         if req.conn.ssl_env:
             env.update(req.conn.ssl_env)
 
+        if req.deadline is not None:
+            # The time.time() by which the app must start its response
+            # (see HTTPServer.deadline), to bound its own blocking calls.
+            env['fw.deadline'] = req.deadline
+
         return env
 
 
@@ -2120,21 +4750,23 @@ class WSGIGateway_u0(WSGIGateway_10):
     def get_environ(self):
         """Return a new environ dict targeting the given wsgi.version"""
         req = self.req
-        env_10 = WSGIGateway_10.get_environ(self)
-        env = env_10.copy()
+        # The WSGI 1.0 environ is ours to modify; no need to copy it.
+        env = WSGIGateway_10.get_environ(self)
         env['wsgi.version'] = ('u', 0)
 
         # Request-URI
         env.setdefault('wsgi.url_encoding', 'utf-8')
         try:
             # SCRIPT_NAME is the empty string, who cares what encoding it is?
-            env["PATH_INFO"] = req.path.decode(env['wsgi.url_encoding'])
-            env["QUERY_STRING"] = req.qs.decode(env['wsgi.url_encoding'])
+            path = req.path.decode(env['wsgi.url_encoding'])
+            qs = req.qs.decode(env['wsgi.url_encoding'])
         except UnicodeDecodeError:
-            # Fall back to latin 1 so apps can transcode if needed.
+            # Fall back to latin 1 (as in WSGI 1.0), so apps can transcode
+            # if needed.
             env['wsgi.url_encoding'] = 'ISO-8859-1'
-            env["PATH_INFO"] = env_10["PATH_INFO"]
-            env["QUERY_STRING"] = env_10["QUERY_STRING"]
+        else:
+            env["PATH_INFO"] = path
+            env["QUERY_STRING"] = qs
 
         return env
 
@@ -2149,9 +4781,14 @@ class WSGIPathInfoDispatcher(object):
     """A WSGI dispatcher for dispatch based on the PATH_INFO.
 
     apps: a dict or list of (path_prefix, app) pairs.
+    copy_environ: if False, SCRIPT_NAME and PATH_INFO are updated in the
+        given environ, instead of in a copy of it. Only safe when the
+        caller doesn't use the environ afterwards, as with an environ
+        created for each request by a WSGIGateway.
     """
 
-    def __init__(self, apps):
+    def __init__(self, apps, copy_environ=True):
+        self.copy_environ = copy_environ
         try:
             apps = list(apps.items())
         except AttributeError:
@@ -2170,11 +4807,694 @@ class WSGIPathInfoDispatcher(object):
         for p, app in self.apps:
             # The apps list should be sorted by length, descending.
             if path.startswith(p + "/") or path == p:
-                environ = environ.copy()
+                if self.copy_environ:
+                    environ = environ.copy()
                 environ["SCRIPT_NAME"] = environ["SCRIPT_NAME"] + p
                 environ["PATH_INFO"] = path[len(p):]
                 return app(environ, start_response)
 
         start_response('404 Not Found', [('Content-Type', 'text/plain'),
                                          ('Content-Length', '0')])
-        return ['']
\ No newline at end of file
+        return ['']
+
+
+# ------------------------------ asyncio Stuff ------------------------------ #
+
+
+class AsyncioRFile(object):
+
+    """A read buffer fed by an event loop and read by executor threads.
+
+    The event loop appends received data with feed(); readers block (up to
+    the server timeout) until enough data is available. Reading is paused
+    on the transport while more than `limit` bytes are buffered.
+    """
+
+    def __init__(self, protocol, limit=65536):
+        self.protocol = protocol
+        self.limit = limit
+        self.buffer = bytearray()
+        self.eof = False
+        self.closed = False
+        self.bytes_read = 0
+        self.timeout = protocol.server.timeout
+        # A ReadDeadline, set by the connection.
+        self.read_deadline = None
+        self._cond = threading.Condition()
+        self._paused = False
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data):
+        """Append data received by the event loop."""
+        with self._cond:
+            self.buffer.extend(data)
+            self._cond.notify_all()
+            if len(self.buffer) > self.limit and not self._paused:
+                self._paused = True
+                self.protocol.pause_reading()
+
+    def feed_eof(self):
+        """Signal that no more data will be received."""
+        with self._cond:
+            self.eof = True
+            self._cond.notify_all()
+
+    def find(self, sub, start=0):
+        with self._cond:
+            return self.buffer.find(sub, start)
+
+    def peek(self, size=0):
+        """Return the buffered data, without consuming it. Never blocks."""
+        with self._cond:
+            return bytes(self.buffer)
+
+    def _wait(self, predicate):
+        # Must be called with self._cond held.
+        timeout = self.timeout
+        if self.read_deadline is not None:
+            timeout = min(timeout, self.read_deadline.remaining())
+            if timeout <= 0:
+                raise socket.timeout("timed out")
+        if not self._cond.wait_for(
+                lambda: predicate() or self.eof, timeout):
+            raise socket.timeout("timed out")
+
+    def _consume(self, size):
+        # Must be called with self._cond held.
+        data = bytes(self.buffer[:size])
+        self._discard(len(data))
+        return data
+
+    def _discard(self, size):
+        # Must be called with self._cond held.
+        del self.buffer[:size]
+        self.bytes_read += size
+        if self.read_deadline is not None:
+            self.read_deadline.bytes_read += size
+        if self._paused and len(self.buffer) <= self.limit // 2:
+            self._paused = False
+            self.protocol.resume_reading()
+
+    def read(self, size=None):
+        chunks = []
+        with self._cond:
+            while size is None or size < 0 or size > 0:
+                self._wait(lambda: self.buffer)
+                if not self.buffer:
+                    # EOF
+                    break
+                n = len(self.buffer)
+                if size is not None and size >= 0:
+                    n = min(n, size)
+                    size -= n
+                chunks.append(self._consume(n))
+        return EMPTY.join(chunks)
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        total = 0
+        with self._cond:
+            while total < len(view):
+                self._wait(lambda: self.buffer)
+                if not self.buffer:
+                    # EOF
+                    break
+                n = min(len(view) - total, len(self.buffer))
+                with memoryview(self.buffer) as data:
+                    view[total:total + n] = data[:n]
+                self._discard(n)
+                total += n
+        return total
+
+    def readline(self, size=None):
+        with self._cond:
+            def has_line():
+                if size is not None and len(self.buffer) >= size:
+                    return True
+                return self.buffer.find(LF) >= 0
+            self._wait(has_line)
+            end = self.buffer.find(LF)
+            end = len(self.buffer) if end < 0 else end + 1
+            if size is not None and size >= 0:
+                end = min(end, size)
+            return self._consume(end)
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncioWFile(object):
+
+    """A write-only file which sends data through an asyncio transport.
+
+    It may be written to from the event loop or from executor threads.
+    Writers from other threads wait while the transport asks us to pause.
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.loop = protocol.loop
+        self.closed = False
+        self.bytes_written = 0
+        self.timeout = protocol.server.timeout
+        self._can_write = threading.Event()
+        self._can_write.set()
+        self._held = []
+
+    def write(self, data):
+        if self.closed:
+            raise socket.error(errno.EPIPE, "Broken pipe")
+        if self._held:
+            self._held.append(data)
+            data = EMPTY.join(self._held)
+            self._held = []
+        self.bytes_written += len(data)
+        if self.protocol.server.in_loop_thread():
+            self.protocol.transport.write(data)
+            return
+        if not self._can_write.wait(self.timeout):
+            raise socket.timeout("timed out")
+        self.loop.call_soon_threadsafe(self.protocol.write, bytes(data))
+
+    def hold(self, data):
+        self._held.append(data)
+
+    def writev(self, segments):
+        self.write(EMPTY.join(segments))
+
+    def flush(self):
+        if self._held:
+            self.write(EMPTY)
+
+    def close(self):
+        self.closed = True
+        self._can_write.set()
+
+
+class AsyncioHTTPConnection(HTTPConnection):
+
+    """An HTTP connection whose I/O is driven by an asyncio event loop.
+
+    Unlike HTTPConnection, it does not loop over requests itself; the
+    AsyncioHTTPProtocol parses each request on the event loop and calls
+    respond() in an executor thread.
+    """
+
+    def __init__(self, server, protocol):
+        self.server = server
+        self.protocol = protocol
+        self.socket = protocol.transport.get_extra_info('socket')
+        self.rfile = AsyncioRFile(protocol)
+        self.wfile = AsyncioWFile(protocol)
+        self.requests_seen = 0
+
+    def set_read_deadline(self, read_deadline):
+        """Make reads fail with socket.timeout after the ReadDeadline.
+
+        The request head is read on the event loop, within the server
+        timeout (see AsyncioHTTPProtocol), so only body reads are affected.
+        """
+        self.read_deadline = read_deadline
+        self.rfile.read_deadline = read_deadline
+
+    def respond(self, req):
+        """Call the application for the given parsed request."""
+        if req.timeline is not None:
+            req.timeline.mark("queue")
+        try:
+            req.respond()
+        except socket.error:
+            e = sys.exc_info()[1]
+            errnum = e.args[0] if e.args else None
+            req.close_connection = True
+            if errnum == 'timed out':
+                if not req.sent_headers:
+                    req.simple_response("408 Request Timeout")
+            elif errnum not in socket_errors_to_ignore:
+                self.server.error_log("socket.error %s" % repr(errnum),
+                                      level=logging.WARNING, traceback=True)
+                if not req.sent_headers:
+                    req.simple_response("500 Internal Server Error")
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            e = sys.exc_info()[1]
+            self.server.error_log(repr(e), level=logging.ERROR, traceback=True)
+            req.close_connection = True
+            if not req.sent_headers:
+                req.simple_response("500 Internal Server Error")
+
+    def close(self):
+        """Close the transport once pending writes are flushed."""
+        self.rfile.close()
+        self.wfile.close()
+        self.protocol.close()
+
+
+class AsyncioHTTPProtocol(asyncio.Protocol):
+
+    """An asyncio Protocol serving one HTTP connection.
+
+    Data is buffered until a complete request head has arrived. The head
+    is parsed on the event loop (it is already in memory, so parsing never
+    blocks), then the Gateway runs in the server's executor, reading any
+    request body from the buffer as it arrives. Requests on a connection
+    are served strictly in order, which also makes pipelining safe.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.loop = server.loop
+        self.transport = None
+        self.conn = None
+        self.busy = False
+        self.served = False
+        self._search_pos = 0
+        self._timer = None
+        self._ssl = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        server = self.server
+        if server.stats['Enabled']:
+            server.stats['Accepts'] += 1
+        self.conn = conn = server.ConnectionClass(server, self)
+        server._protocols.add(self)
+        if server.slow_request_time:
+            conn.timeline = RequestTimeline()
+            conn.timeline.mark("accept")
+
+        if not isinstance(server.bind_addr, basestring):
+            addr = transport.get_extra_info('peername') or ('', 0)
+            conn.remote_addr = addr[0]
+            conn.remote_port = addr[1]
+
+        conn.ssl_env = {}
+        ssl_object = transport.get_extra_info('ssl_object')
+        self._ssl = ssl_object is not None
+        get_environ = getattr(server.ssl_adapter, 'get_environ', None)
+        cipher = transport.get_extra_info('cipher')
+        if ssl_object is not None and get_environ is not None:
+            # The handshake is done by now.
+            conn.ssl_env = get_environ(ssl_object)
+        elif cipher:
+            conn.ssl_env = {
+                'HTTPS': 'on',
+                'SSL_CIPHER': cipher[0],
+                'SSL_PROTOCOL': cipher[1],
+            }
+        self._arm_timer()
+
+    def data_received(self, data):
+        self.conn.rfile.feed(data)
+        if not self.busy:
+            self._next_request()
+
+    def eof_received(self):
+        self.conn.rfile.feed_eof()
+        if not self.busy:
+            self._next_request()
+        # Keep the transport open so a response can still be written (SSL
+        # transports can't be half-closed).
+        return not self._ssl
+
+    def connection_lost(self, exc):
+        self._cancel_timer()
+        self.conn.rfile.feed_eof()
+        self.conn.wfile.close()
+        self.server._protocols.discard(self)
+
+    def pause_writing(self):
+        self.conn.wfile._can_write.clear()
+
+    def resume_writing(self):
+        self.conn.wfile._can_write.set()
+
+    def pause_reading(self):
+        self.loop.call_soon_threadsafe(self.transport.pause_reading)
+
+    def resume_reading(self):
+        self.loop.call_soon_threadsafe(self.transport.resume_reading)
+
+    def write(self, data):
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    def close(self):
+        if self.server.in_loop_thread():
+            self.transport.close()
+        else:
+            self.loop.call_soon_threadsafe(self.transport.close)
+
+    def _arm_timer(self):
+        self._cancel_timer()
+        if self.server.timeout:
+            self._timer = self.loop.call_later(
+                self.server.timeout, self._on_timeout)
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timeout(self):
+        self._timer = None
+        if self.busy:
+            return
+        if len(self.conn.rfile):
+            # The client started a request but didn't finish it in time.
+            req = self.conn.RequestHandlerClass(self.server, self.conn)
+            req.simple_response("408 Request Timeout")
+        self.transport.close()
+
+    def _has_request_head(self):
+        rfile = self.conn.rfile
+        mrhs = self.server.max_request_header_size
+        if mrhs and len(rfile) > mrhs:
+            # Let parse_request() raise the proper 413/414 response.
+            return True
+        pos = rfile.find(CRLF + CRLF, max(self._search_pos - 3, 0))
+        if pos < 0:
+            self._search_pos = len(rfile)
+            return False
+        return True
+
+    def _next_request(self):
+        """Start serving the next buffered request, if it is complete."""
+        rfile = self.conn.rfile
+        if not self._has_request_head():
+            if rfile.eof:
+                self.transport.close()
+            return
+
+        self._search_pos = 0
+        self._cancel_timer()
+        req = self.conn.RequestHandlerClass(self.server, self.conn)
+        try:
+            req.parse_request()
+        except Exception:
+            e = sys.exc_info()[1]
+            self.server.error_log(repr(e), level=logging.ERROR, traceback=True)
+            req.simple_response("500 Internal Server Error")
+            self.transport.close()
+            return
+        if self.server.stats['Enabled']:
+            self.conn.requests_seen += 1
+        if not req.ready:
+            # The request was rejected; a response has already been written.
+            self.transport.close()
+            return
+        if self.server.draining:
+            # Stopping (see AsyncioWSGIServer._drain): serve the request,
+            # but no more on this connection.
+            req.close_connection = True
+
+        pool = None
+        if self.server.pools:
+            pool = self.server.pool_for(req.path or b"/")
+        if pool is None:
+            task = self.loop.run_in_executor(
+                self.server.executor, self.conn.respond, req)
+        else:
+            try:
+                task = pool.submit(self.loop, self.conn.respond, req)
+            except queue.Full:
+                self.server.shed(self.conn)
+                return
+        self.busy = True
+        task.add_done_callback(lambda f: self._request_done(req, f))
+
+    def _request_done(self, req, future):
+        self.busy = False
+        self.served = True
+        if self.server.draining:
+            self.server.drain_report['Completed'] += 1
+        exc = future.exception()
+        if exc is not None:
+            self.server.interrupt = exc
+        if exc is not None or req.close_connection:
+            self.transport.close()
+            return
+        self._arm_timer()
+        self._next_request()
+
+
+class ExecutorPool(object):
+
+    """A named pool of executor threads, added by AsyncioWSGIServer.add_pool.
+
+    Its requests are run by an executor of `max` threads (or `min`, if
+    there's no max). At most `queue_size` (-1 for no limit) more requests
+    wait for a thread; the connections of others are shed with 503.
+    Requests are only submitted from the event loop thread.
+    """
+
+    def __init__(self, server, name, min=1, max=-1, queue_size=-1):
+        self.server = server
+        self.name = name
+        self.min = min
+        self.max = max
+        self.queue_size = queue_size
+        self.executor = None
+        self.busy = 0
+        self.shed_count = 0
+        self.autoscaler = None
+        self.stats = {
+            'Queue': lambda s: self.qsize,
+            'Threads': lambda s: len(self._threads),
+            'Threads Idle': lambda s: self.idle,
+            'Shed': lambda s: self.shed_count,
+        }
+
+    def _get_size(self):
+        """The number of executor threads. Read-only."""
+        if self.max > 0:
+            return self.max
+        return self.min or 1
+    size = property(_get_size, doc=_get_size.__doc__)
+
+    def start(self):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.size,
+            thread_name_prefix="CP Server %s Executor" % self.name)
+
+    def submit(self, loop, func, *args):
+        """Run func(*args) in the executor; raise queue.Full if full."""
+        if self.queue_size >= 0 and (
+                self.busy >= self.size + self.queue_size):
+            self.shed_count += 1
+            raise queue.Full
+        self.busy += 1
+        future = loop.run_in_executor(self.executor, func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        self.busy -= 1
+
+    def _get_threads(self):
+        return getattr(self.executor, '_threads', ())
+    _threads = property(_get_threads)
+
+    def _get_qsize(self):
+        return max(self.busy - self.size, 0)
+    qsize = property(_get_qsize)
+
+    def _get_idle(self):
+        """Number of executor threads which are idle. Read-only."""
+        return max(self.size - self.busy, 0)
+    idle = property(_get_idle, doc=_get_idle.__doc__)
+
+    def stop(self, timeout=None):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+class AsyncioWSGIServer(HTTPServer):
+
+    """A WSGI server which handles HTTP on an asyncio event loop.
+
+    Accepting connections, parsing requests and writing responses all
+    happen on one event loop thread; only the WSGI application call is
+    sent to a bounded pool of `numthreads` executor threads. An idle or
+    slow connection therefore costs a buffer, not a whole WorkerThread,
+    so one process can hold thousands of connections.
+
+    Requests are parsed by the same HTTPRequest class and served through
+    the same WSGI gateways as CherryPyWSGIServer, so applications (and
+    WSGIPathInfoDispatcher) see identical environ dicts. The routes given
+    to add_pool() are run by executors of their own (see ExecutorPool).
+    """
+
+    wsgi_version = (1, 0)
+    """The version of WSGI to produce."""
+
+    ConnectionClass = AsyncioHTTPConnection
+    """The class to use for handling HTTP connections."""
+
+    loop = None
+    """The asyncio event loop, while the server is running."""
+
+    executor = None
+    """The Executor which runs the WSGI application calls."""
+
+    _drain_timeout = None
+
+    def __init__(self, bind_addr, wsgi_app, numthreads=10, server_name=None,
+                 request_queue_size=5, timeout=10, shutdown_timeout=5):
+        self.requests = None
+        self.numthreads = numthreads or 1
+        self.wsgi_app = wsgi_app
+        self.gateway = wsgi_gateways[self.wsgi_version]
+
+        self.bind_addr = bind_addr
+        if not server_name:
+            server_name = socket.gethostname()
+        self.server_name = server_name
+        self.request_queue_size = request_queue_size
+
+        self.timeout = timeout
+        self.shutdown_timeout = shutdown_timeout
+        self._protocols = set()
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self.clear_stats()
+
+    def _make_pool(self, name, min, max, queue_size):
+        return ExecutorPool(self, name, min=min, max=max,
+                            queue_size=queue_size)
+
+    def in_loop_thread(self):
+        """Return True if called from the event loop's thread."""
+        return threading.current_thread().ident == self._loop_thread
+
+    def start(self):
+        """Run the server forever."""
+        self._interrupt = None
+        self._stopped.clear()
+
+        if self.software is None:
+            self.software = "%s Server" % self.version
+
+        ssl_context = None
+        if self.ssl_adapter is not None:
+            ssl_context = getattr(self.ssl_adapter, 'context', None)
+            if ssl_context is None:
+                raise ValueError("%s requires an SSL adapter with an "
+                                 "ssl.SSLContext 'context' attribute."
+                                 % self.__class__.__name__)
+
+        self.prepare_socket()
+        self.socket.setblocking(False)
+
+        self.loop = asyncio.new_event_loop()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.numthreads,
+            thread_name_prefix="CP Server Executor")
+        for pool in (self.pools or {}).values():
+            pool.start()
+        self._start_watchdog()
+        self._loop_thread = threading.current_thread().ident
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            listener = self.loop.run_until_complete(self.loop.create_server(
+                lambda: AsyncioHTTPProtocol(self), sock=self.socket,
+                backlog=self.request_queue_size, ssl=ssl_context))
+            self.ready = True
+            self._start_time = time.time()
+            self.loop.run_forever()
+            listener.close()
+            self._drain()
+        finally:
+            self._shutdown()
+        if self.interrupt:
+            raise self.interrupt
+
+    def _drain(self):
+        """Run the loop until the requests in progress are done, for at
+        most shutdown_timeout seconds (or the timeout given to drain()).
+
+        Idle keep-alive connections are closed. New connections are still
+        served their first request, which may be on its way, with
+        "Connection: close".
+        """
+        timeout = self._drain_timeout
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        self._drain_timeout = None
+        deadline = time.time() + timeout
+        while self._protocols and time.time() < deadline:
+            for protocol in list(self._protocols):
+                if (protocol.served and not protocol.busy and
+                        not protocol.transport.is_closing()):
+                    protocol.transport.close()
+            # Closing transports still flush their responses.
+            self.loop.run_until_complete(asyncio.sleep(0.05))
+        self.drain_report['Aborted'] = len(
+            [protocol for protocol in self._protocols if protocol.busy])
+        self.draining = False
+
+    def _shutdown(self):
+        """Close all connections and release the loop and executor."""
+        self.ready = False
+        if self.profiler is not None:
+            self.profiler.stop()
+        for protocol in list(self._protocols):
+            protocol.transport.abort()
+        self.executor.shutdown(wait=False)
+        for pool in (self.pools or {}).values():
+            pool.stop()
+        self._stop_watchdog()
+        try:
+            self.loop.run_until_complete(self.loop.shutdown_asyncgens())
+        finally:
+            self.loop.close()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        self._loop_thread = None
+        self._stopped.set()
+
+    def stop(self):
+        """Gracefully shutdown a server that is serving forever.
+
+        The requests in progress are given shutdown_timeout seconds to
+        finish (see _drain).
+        """
+        if self.ready:
+            self.drain_report = {'Completed': 0, 'Aborted': 0, 'Rejected': 0}
+            self.draining = True
+        self.ready = False
+        if self._start_time is not None:
+            self._run_time += (time.time() - self._start_time)
+        self._start_time = None
+
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        if loop.is_running() and not self.in_loop_thread():
+            loop.call_soon_threadsafe(loop.stop)
+            self._stopped.wait(self.shutdown_timeout)
+        else:
+            loop.stop()
+
+    def drain(self, timeout=None):
+        """Stop the server like stop(), giving the requests in progress
+        timeout seconds (default shutdown_timeout) to finish, and return the
+        drain_report (see HTTPServer.drain).
+
+        Requests waiting for an executor thread can't be taken back, so
+        they are served or aborted like those in progress, never 'Rejected'.
+        Call it from another thread than the one running start().
+        """
+        if timeout is None:
+            timeout = self.shutdown_timeout
+        self._drain_timeout = timeout
+        self.stop()
+        if self.loop is not None:
+            self._stopped.wait(timeout + self.shutdown_timeout)
+        return self.drain_report
@@ -9,32 +9,56 @@ Modified extensively.
 
 """
 
+import os
 import re
 import json
+import signal
 import subprocess
 import urllib.parse
 
 
-def command(repo, *args):
-    """Run a git command on this Repo and return the result."""
+def command(repo, *args, timeout=None):
+    """Run a git command on this Repo and return the result.
+
+    With a timeout in seconds (e.g. the time left of a wsgi request, see
+    fw.http.tools.remaining_time), a command running longer is killed, and
+    TimeoutError raised.
+
+    Without a timeout, the command runs in this process's session, so that
+    ssh and credential helpers can still prompt on its terminal.
+
+    """
     if repo is not None:
         path = repo.get('path', '.')
     else:
         path = '.'
+    cmd = "git " + " ".join(args)
+    if timeout is not None and timeout <= 0:
+        raise TimeoutError("No time left to run %s" % cmd)
+    # A command which may be killed runs in a session of its own, so that
+    # any helpers it has started (ssh, hooks) are killed with it, and don't
+    # keep the pipes open.
     proc = subprocess.Popen(["git"] + list(args), stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE, cwd=path)
-    out, err = [x.decode("utf-8") for x in  proc.communicate()]
+        stderr=subprocess.PIPE, cwd=path,
+        start_new_session=timeout is not None)
+    try:
+        out, err = [x.decode("utf-8") for x in
+            proc.communicate(timeout=timeout)]
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.communicate()
+        raise TimeoutError("Timed out after %.3fs running %s"
+            % (timeout, cmd))
 
     if proc.returncode or 'Warning:' in err:
-        cmd = "git " + " ".join(args)
         raise Exception("Error running %s:\n\tErr: %s\n\tOut: %s\n\tExit: %s"
             % (cmd, err, out, proc.returncode))
     return out, err
 
 
-def clone(url, path, *args):
+def clone(url, path, *args, timeout=None):
     """Clone repository at given `url` to `path`, returns repo dictionary."""
-    _, err = command(None, "clone", url, path, *args)
+    _, err = command(None, "clone", url, path, *args, timeout=timeout)
     if "Cloning into ".format(path) in err and 'done.' in err:
         return {
             "path": path,
@@ -190,26 +214,27 @@ def status(repo, empty=False):
     return changes
 
 
-def push(repo, destination=None, branch_name=None):
+def push(repo, destination=None, branch_name=None, timeout=None):
     """Push changes from this Repo."""
     args = [arg for arg in (destination, branch_name) if not arg is None]
-    _, _ = command(repo, "push", *args)  # pylint: disable=star-args
+    _, _ = command(repo, "push", *args,  # pylint: disable=star-args
+        timeout=timeout)
 
 
-def pull(repo, source=None):
+def pull(repo, source=None, timeout=None):
     """Pull changes to this Repo."""
     if source is None:
-        _, _ = command(repo, "pull")
+        _, _ = command(repo, "pull", timeout=timeout)
     else:
-        _, _ = command(repo, "pull", source)
+        _, _ = command(repo, "pull", source, timeout=timeout)
 
 
-def fetch(repo, source=None):
+def fetch(repo, source=None, timeout=None):
     """Fetch changes to this Repo."""
     if source is None:
-        _, _ = command(repo, "fetch")
+        _, _ = command(repo, "fetch", timeout=timeout)
     else:
-        _, _ = command(repo, "fetch", source)
+        _, _ = command(repo, "fetch", source, timeout=timeout)
 
 
 def revision(repo, identifier=None):
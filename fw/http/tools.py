@@ -6,6 +6,7 @@
 # Python imports.
 import re
 import cgi
+import time
 import datetime
 import tempfile
 import http.cookies
@@ -119,6 +120,9 @@ def prepare_response_data(response):
     binary_data = response.get('binary_data', [])
     if data == [] and binary_data is not None:
         encoded_data = binary_data
+        if not isinstance(encoded_data, (bytes, str)):
+            # A wsgi.file_wrapper, its Content-Length is set along with it.
+            return encoded_data
     else:
         response_data = ''.join(data)
         encoded_data = response_data.encode(response['charset'])
@@ -140,6 +144,20 @@ def prepare_response_headers(response):
     return response_headers
 
 
+def remaining_time(request):
+    """Returns the seconds left until the request's deadline, or None.
+
+    The deadline is set by the wsgi server in 'fw.deadline' (see start_wsgi
+    in fw.wsgi.server). Blocking calls made for the request should give up
+    by then, as with fw.git.api.command(..., timeout=remaining_time(request)).
+
+    """
+    deadline = request.get('fw.deadline')
+    if deadline is None:
+        return None
+    return max(deadline - time.time(), 0)
+
+
 def parse_form_data(request, private_sid, transfers, buffer_size=1024 * 200):
     """Parses the form data into a FieldStorage instance.
 
@@ -150,6 +168,8 @@ def parse_form_data(request, private_sid, transfers, buffer_size=1024 * 200):
     transfers.
     The progress can be read by separate ajax calls and provide feedback for
     the user.
+    If the request has a deadline (see remaining_time), the data must be read
+    by then, or TimeoutError is raised.
 
     """
     transfer_id = None
@@ -170,8 +190,21 @@ def parse_form_data(request, private_sid, transfers, buffer_size=1024 * 200):
         session_transfers[transfer_id] = 0
         stream = request['wsgi.input']
         body = tempfile.TemporaryFile(mode='w+b')
+        # Stream the upload through one buffer, if the input supports it.
+        readinto = getattr(stream, 'readinto', None)
+        buffer = memoryview(bytearray(buffer_size))
+        deadline = request.get('fw.deadline')
         while length > 0:
-            part = stream.read(min(length, buffer_size))
+            if deadline is not None and time.time() >= deadline:
+                del session_transfers[transfer_id]
+                if len(session_transfers) == 0:
+                    del transfers[private_sid]
+                raise TimeoutError('Form data not read in time, {} of {} '
+                    'bytes left.'.format(length, total_length))
+            if readinto is not None:
+                part = buffer[:readinto(buffer[:min(length, buffer_size)])]
+            else:
+                part = stream.read(min(length, buffer_size))
             if not part:
                 break
             body.write(part)
@@ -1,14 +1,19 @@
 """Docstring"""
 
 # Python imports.
+import os
 import re
 import logging
+import mimetypes
 # Framework imports.
 import fw.cache
 import fw.config.manage as configmanage
 
 LOG = logging.getLogger(__name__)
 
+# Resources shared by all apps, like the favicon.
+DEFAULT_RESOURCE_PATH = os.path.join(os.path.dirname(__file__), 'resources')
+
 
 def get_app_config(request):
     """Doc string."""
@@ -30,6 +35,8 @@ def get_path_parts(request, wsgi_apps_types):
         if regex.match(path):
             parts['@type_name'] = type_name
             parts['@function'] = type_values['function']
+            if type_values.get('resource_path'):
+                parts['resource_path'] = type_values['resource_path']
             match = regex.match(path)
             for index in regex.groupindex:
                 parts[index] = match.group(index)
@@ -38,19 +45,36 @@ def get_path_parts(request, wsgi_apps_types):
 
 
 def get_app_resource(session):
-    """Doc string."""
+    """Puts the requested resource file in the response.
+
+    Resources are looked up in the app config's 'resource_path', except for
+    the favicon, which is taken from the default resources. The file is
+    passed on wrapped in the server's wsgi.file_wrapper, if available, to be
+    sent without copying it through Python.
+
+    """
     request = session['@tmp']['request']
     response = session['@tmp']['response']
     path = request['PATH_INFO']
     try:
         if path == '/favicon.ico':
-            # get the file, path for default resources?
-            response['binary_data'] = ''
+            resource_path = DEFAULT_RESOURCE_PATH
         else:
-            # Parse application path.
-            # Determine path and access rights.
-            # Get the file.
-            response['binary_data'] = ''
+            app_config = session.get('@app_config') or {}
+            resource_path = (app_config.get('resource_path') or
+                DEFAULT_RESOURCE_PATH)
+        resource_file = _open_resource(resource_path, path)
+        size = os.fstat(resource_file.fileno()).st_size
+        content_type = mimetypes.guess_type(path)[0]
+        response['headers']['Content-Type'] = (content_type or
+            'application/octet-stream')
+        response['headers']['Content-Length'] = size
+        file_wrapper = request.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            response['binary_data'] = file_wrapper(resource_file)
+        else:
+            with resource_file:
+                response['binary_data'] = resource_file.read()
     except FileNotFoundError as exc:
         response['status'] = '404 Not Found'
         LOG.exception('File "{}" not found, exc: {}.'.format(path, exc))
@@ -60,3 +84,15 @@ def get_app_resource(session):
     except Exception as exc:
         response['status'] = '500 Internal Server Error'
         LOG.exception('Failed to get file "{}", exc: {}.'.format(path, exc))
+
+
+def _open_resource(resource_path, path):
+    """Opens the file for the request path, inside the resource path."""
+    root = os.path.realpath(resource_path)
+    file_path = os.path.realpath(os.path.join(root, path.lstrip('/')))
+    if not file_path.startswith(root + os.sep):
+        raise PermissionError('Path outside of the resources: "{}"'.format(
+            path))
+    if os.path.isdir(file_path):
+        raise FileNotFoundError('Not a file: "{}"'.format(path))
+    return open(file_path, 'rb')
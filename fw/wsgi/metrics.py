@@ -0,0 +1,242 @@
+"""Request metrics for the wsgi server, in the Prometheus text format.
+
+A MetricsRegistry is set as the server's 'metrics' attribute, and is called
+by the worker threads after each response. Every thread counts into its own
+dicts, so recording a request takes no locks; the per-thread values are only
+summed up when the metrics are scraped.
+
+"""
+
+# Python imports.
+import time
+import bisect
+import logging
+import threading
+# Framework imports.
+import fw.cache
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the request latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0)
+
+# Route label of requests not matching any route.
+UNMATCHED_ROUTE = ''
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRegistry(object):
+    """Per-route request counters and latency histograms, plus gauges.
+
+    The routes are the path prefixes of the apps, as given to
+    WSGIPathInfoDispatcher. Requests are labelled with the longest matching
+    prefix, keeping the number of label values bounded.
+
+    """
+
+    def __init__(self, routes=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Longest prefix first, as in WSGIPathInfoDispatcher.
+        prefixes = sorted([route.rstrip('/') for route in routes],
+            reverse=True)
+        self._routes = [(prefix.encode('ISO-8859-1'), prefix or '/')
+            for prefix in prefixes]
+        self._gauges = []
+        # Requests answered with 504 for running out of time, by route.
+        self._timeouts = {}
+        self._local = threading.local()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def gauge(self, name, doc, function, labels=None):
+        """Adds a gauge, whose value is function() at the time of a scrape.
+
+        Gauges of the same name are told apart by their labels, a dict of
+        label name: value.
+
+        """
+        self._gauges.append((name, 'gauge', doc, function, labels))
+
+    def counter(self, name, doc, function, labels=None):
+        """Adds a counter, read like a gauge, whose values never go down."""
+        self._gauges.append((name, 'counter', doc, function, labels))
+
+    def route(self, path):
+        """Returns the route label for the request path (bytes)."""
+        for prefix, route in self._routes:
+            if path.startswith(prefix + b'/') or path == prefix:
+                return route
+        return UNMATCHED_ROUTE
+
+    def observe(self, req):
+        """Records a finished request; the server's metrics hook."""
+        if req.start_time is None:
+            return
+        code = req.status[:3]
+        if isinstance(code, bytes):
+            code = code.decode('ISO-8859-1')
+        self.observe_request(self.route(req.path or b'/'), code or '200',
+            time.time() - req.start_time)
+
+    def observe_timeout(self, req):
+        """Records a request past its deadline; the server's watchdog hook.
+
+        Timeouts are rare, and may be recorded from any thread, so they are
+        counted under the lock.
+
+        """
+        route = self.route(req.path or b'/')
+        with self._lock:
+            self._timeouts[route] = self._timeouts.get(route, 0) + 1
+
+    def observe_request(self, route, code, seconds):
+        """Counts one request, and its latency in seconds."""
+        try:
+            requests, latencies = self._local.data
+        except AttributeError:
+            requests, latencies = self._thread_data()
+        key = (route, code)
+        requests[key] = requests.get(key, 0) + 1
+        latency = latencies.get(route)
+        if latency is None:
+            # A count per bucket (the last one for +Inf), then the sum.
+            latency = latencies[route] = [0] * (len(self.buckets) + 1) + [0.0]
+        latency[bisect.bisect_left(self.buckets, seconds)] += 1
+        latency[-1] += seconds
+
+    def _thread_data(self):
+        """Creates the calling thread's counters."""
+        data = self._local.data = ({}, {})
+        with self._lock:
+            # Kept after the thread exits, so counters never go backwards.
+            self._threads.append(data)
+        return data
+
+    def collect(self):
+        """Returns the request counts and the latency histograms.
+
+        The counts are a dict of (route, code): count, and the histograms
+        a dict of route: [count per bucket..., sum], summed over all threads.
+
+        """
+        with self._lock:
+            threads = list(self._threads)
+        requests = {}
+        latencies = {}
+        for thread_requests, thread_latencies in threads:
+            for key, count in dict(thread_requests).items():
+                requests[key] = requests.get(key, 0) + count
+            for route, latency in dict(thread_latencies).items():
+                total = latencies.get(route)
+                if total is None:
+                    latencies[route] = list(latency)
+                else:
+                    for index, value in enumerate(latency):
+                        total[index] += value
+        return requests, latencies
+
+    def render(self):
+        """Returns all metrics in the Prometheus text format."""
+        requests, latencies = self.collect()
+        lines = [
+            '# HELP fw_http_requests_total Requests handled, by route and '
+            'status code.',
+            '# TYPE fw_http_requests_total counter'
+        ]
+        for (route, code), count in sorted(requests.items()):
+            lines.append('fw_http_requests_total{{route="{}",code="{}"}} {}'
+                .format(_escape(route), code, count))
+        lines.append('# HELP fw_http_request_duration_seconds Time from the '
+            'first request byte read to the last response byte written.')
+        lines.append('# TYPE fw_http_request_duration_seconds histogram')
+        for route, latency in sorted(latencies.items()):
+            label = _escape(route)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf', ), latency):
+                cumulative += count
+                lines.append('fw_http_request_duration_seconds_bucket'
+                    '{{route="{}",le="{}"}} {}'.format(label, bound,
+                    cumulative))
+            lines.append('fw_http_request_duration_seconds_sum'
+                '{{route="{}"}} {}'.format(label, repr(latency[-1])))
+            lines.append('fw_http_request_duration_seconds_count'
+                '{{route="{}"}} {}'.format(label, cumulative))
+        with self._lock:
+            timeouts = sorted(self._timeouts.items())
+        lines.append('# HELP fw_http_deadline_exceeded_total Requests '
+            'answered with 504, their deadline having passed.')
+        lines.append('# TYPE fw_http_deadline_exceeded_total counter')
+        for route, count in timeouts:
+            lines.append('fw_http_deadline_exceeded_total{{route="{}"}} {}'
+                .format(_escape(route), count))
+        described = set()
+        for name, kind, doc, function, labels in self._gauges:
+            try:
+                value = function()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.debug('Gauge {} failed: {!r}'.format(name, exc))
+                continue
+            if name not in described:
+                described.add(name)
+                lines.append('# HELP {} {}'.format(name, doc))
+                lines.append('# TYPE {} {}'.format(name, kind))
+            if labels:
+                lines.append('{}{{{}}} {}'.format(name, ','.join([
+                    '{}="{}"'.format(label, _escape(label_value))
+                    for label, label_value in sorted(labels.items())]),
+                    value))
+            else:
+                lines.append('{} {}'.format(name, value))
+        lines.append('')
+        return '\n'.join(lines)
+
+    def app(self, _, start_response):
+        """Wsgi app serving the metrics, for mounting on the server."""
+        data = self.render().encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', CONTENT_TYPE),
+            ('Content-Length', str(len(data))),
+            ('Cache-Control', 'no-cache')
+        ])
+        return [data]
+
+
+def add_server_gauges(registry, server):
+    """Adds gauges for the server's thread pool, connections and sessions."""
+    registry.gauge('fw_server_queue_depth',
+        'Connections waiting for a worker thread.',
+        lambda: server.requests.qsize)
+    registry.gauge('fw_server_threads', 'Worker threads.',
+        lambda: len(server.requests._threads))  # pylint: disable=W0212
+    registry.gauge('fw_server_threads_idle', 'Idle worker threads.',
+        lambda: server.requests.idle)
+    registry.gauge('fw_server_connections_parked',
+        'Idle keep-alive connections parked between requests.',
+        lambda: server.connections.parked)
+    registry.gauge('fw_sessions', 'Cached sessions.',
+        lambda: len(fw.cache.get_sessions()))
+    pools = getattr(server, 'pools', None) or {}
+    for name, pool in sorted(pools.items()):
+        add_pool_gauges(registry, name, pool)
+
+
+def add_pool_gauges(registry, name, pool):
+    """Adds gauges for a named worker pool of the server (see add_pool)."""
+    labels = {'pool': name}
+    registry.gauge('fw_pool_queue_depth',
+        'Requests waiting for a worker thread of the pool.',
+        lambda: pool.qsize, labels)
+    registry.gauge('fw_pool_threads', 'Worker threads of the pool.',
+        lambda: len(pool._threads), labels)  # pylint: disable=W0212
+    registry.gauge('fw_pool_threads_idle', 'Idle worker threads of the pool.',
+        lambda: pool.idle, labels)
+    registry.counter('fw_pool_shed_total',
+        'Requests shed with 503, the pool\'s queue being full.',
+        lambda: pool.shed_count, labels)
+
+
+def _escape(value):
+    """Escapes a Prometheus label value."""
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
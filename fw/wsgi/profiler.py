@@ -0,0 +1,185 @@
+"""Sampling stack profiler for the worker threads of the wsgi server.
+
+A StackSampler is set as the server's 'profiler' attribute, and is started
+and stopped with the server. It snapshots the stacks of the busy worker
+threads a number of times per second, and counts each distinct stack. The
+counts are dumped in the collapsed stack format read by flamegraph.pl and
+speedscope: one line per stack, with the frames from the thread's root to
+the innermost frame separated by semicolons, followed by the count.
+
+"""
+
+# Python imports.
+import os
+import sys
+import signal
+import logging
+import tempfile
+import threading
+
+LOG = logging.getLogger(__name__)
+
+# Where dump() writes the samples, formatted with the process id.
+DEFAULT_DUMP_PATH = '/tmp/fw-profile-{pid}.txt'
+
+# Frames deeper than this are cut off at the thread's root end.
+MAX_DEPTH = 128
+
+
+class StackSampler(object):
+    """Samples the stacks of a wsgiserver's worker threads.
+
+    Idle worker threads (not serving a connection) are skipped, except in
+    the asyncio server, whose executor threads can't be told apart; their
+    idle stacks end in concurrent.futures.thread._worker.
+
+    """
+
+    def __init__(self, server, rate=100, dump_path=DEFAULT_DUMP_PATH,
+            lines=False):
+        self.server = server
+        self.interval = 1.0 / rate
+        self.dump_path = dump_path
+        self.lines = lines
+        self.samples = 0
+        self._stacks = {}
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts sampling in a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run,
+            name='Stack sampler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling; the samples are kept until reset()."""
+        self._stopped.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+
+    def _run(self):
+        """Takes a sample every interval, until stopped."""
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as exc:  # pylint: disable=broad-except
+                LOG.exception('Stack sample failed: {!r}'.format(exc))
+
+    def worker_idents(self):
+        """Returns the thread idents of the server's busy worker threads.
+
+        The threads of the server's named pools (see add_pool) are included.
+
+        """
+        pools = [getattr(self.server, 'requests', None)]
+        if pools[0] is None:
+            pools[0] = getattr(self.server, 'executor', None)
+        pools.extend((getattr(self.server, 'pools', None) or {}).values())
+        idents = set()
+        for pool in pools:
+            for thread in list(getattr(pool, '_threads', None) or ()):
+                # Executor threads have no 'conn', and count as busy.
+                if getattr(thread, 'conn', thread) is not None:
+                    idents.add(thread.ident)
+        return idents
+
+    def sample(self):
+        """Takes one snapshot of the worker threads' stacks."""
+        idents = self.worker_idents()
+        if not idents:
+            return
+        frames = sys._current_frames()  # pylint: disable=protected-access
+        stacks = []
+        for ident in idents:
+            frame = frames.get(ident)
+            if frame is not None:
+                stacks.append(self._stack(frame))
+        del frames
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+
+    def _stack(self, frame):
+        """Returns the collapsed stack of the frame, root first."""
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame))
+            frame = frame.f_back
+        labels.reverse()
+        return ';'.join(labels)
+
+    def _label(self, frame):
+        """Returns 'module.function' (':line', if lines) for the frame."""
+        code = frame.f_code
+        if self.lines:
+            key = (code, frame.f_lineno)
+        else:
+            key = code
+        label = self._labels.get(key)
+        if label is None:
+            module = frame.f_globals.get('__name__') or code.co_filename
+            # The qualified name (Class.method) is new in Python 3.11.
+            label = '{}.{}'.format(module,
+                getattr(code, 'co_qualname', code.co_name))
+            if self.lines:
+                label = '{}:{}'.format(label, frame.f_lineno)
+            self._labels[key] = label
+        return label
+
+    def collapsed(self):
+        """Returns the samples in the collapsed stack format."""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+        return ''.join(['{} {}\n'.format(stack, count)
+            for stack, count in stacks])
+
+    def reset(self):
+        """Discards the samples taken so far."""
+        with self._lock:
+            self._stacks = {}
+            self.samples = 0
+
+    def dump(self, path=None):
+        """Writes the samples to the path (default dump_path), returns it.
+
+        The samples are written to a new temporary file next to it, which
+        then replaces it, so a file planted in a shared directory like /tmp
+        is never written through.
+
+        """
+        path = (path or self.dump_path).format(pid=os.getpid())
+        directory, name = os.path.split(path)
+        temp_fd, temp_path = tempfile.mkstemp(prefix='{}.'.format(name),
+            suffix='.tmp', dir=directory or '.')
+        try:
+            with os.fdopen(temp_fd, 'w') as dump_file:
+                dump_file.write(self.collapsed())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        LOG.info('Dumped {} stack samples to {}.'.format(self.samples, path))
+        return path
+
+
+def install_signal_handler(sampler, signum=signal.SIGUSR1):
+    """Makes the signal dump the sampler's samples (main thread only)."""
+
+    def dump_samples(*_):
+        """Signal handler dumping the samples."""
+        try:
+            sampler.dump()
+        except OSError as exc:
+            LOG.error('Stack sample dump failed: {}'.format(exc))
+
+    signal.signal(signum, dump_samples)
@@ -1,33 +1,256 @@
 """Module for starting and stopping the wsgi Web server."""
 
 # Python imports.
+import os
+import sys
+import time
+import fcntl
+import signal
+import socket
 import logging
+import threading
 if __name__ == '__main__':
-    import os
-    import sys
     PARTS = __file__.split(os.path.sep)
     PARTS = PARTS[:-3]
     PATH = os.path.sep.join(PARTS)
     if not PATH in sys.path:
         sys.path.insert(0, PATH)
 # System imports.
+import fw.cache
 import fw.externals.wsgiserver as wsgiserver
+import fw.wsgi.metrics as wsgimetrics
+import fw.wsgi.profiler as wsgiprofiler
 
 LOG = logging.getLogger(__name__)
 
+# Minimum number of seconds between restarts of a crashing worker process.
+RESTART_DELAY = 1
+
+# The first file descriptor passed with LISTEN_FDS (as by systemd).
+LISTEN_FDS_START = 3
+
+# Environment variable with the fd on which a process started by SIGUSR2
+# tells the old process that it is ready to serve.
+READY_FD_ENV = 'FW_READY_FD'
+
 
 def start_wsgi(address, port, apps_list,
-    server_class=wsgiserver.CherryPyWSGIServer):
-    """Start up the wsgi server."""
-    apps = wsgiserver.WSGIPathInfoDispatcher(apps_list)
-    server = server_class((address, port, ), apps)
+    server_class=wsgiserver.CherryPyWSGIServer, workers=1, threads=10,
+    reuse_port=False, backlog=128, accept_batch=64, tcp_defer_accept=0,
+    tcp_fastopen=0, compression_level=0, compression_min_size=1024,
+    metrics_path=None, slow_request_time=0, profile_rate=0,
+    profile_dump_path=wsgiprofiler.DEFAULT_DUMP_PATH, header_timeout=20,
+    min_body_rate=500, pools=None, listen_fd=None, write_behind=0,
+    deadline=0, deadlines=None, keepalive_parking=False, queue_size=-1,
+    queue_discipline='fifo', queue_shards=0, queue_placement='round-robin',
+    max_threads=-1, autoscale=False, autoscale_cooldown=60):
+    """Start up the wsgi server.
+
+    The server_class can be any HTTPServer subclass taking a bind address and
+    a wsgi app, e.g. wsgiserver.CherryPyWSGIServer (one thread per active
+    connection) or wsgiserver.AsyncioWSGIServer (an asyncio event loop, with
+    only the app calls run in a thread pool).
+
+    If workers is more than 1, that many server processes are forked, each
+    running its own pool of 'threads' threads, and this process supervises
+    them until shutdown. The workers either share one listening socket, or
+    with reuse_port, bind their own (SO_REUSEPORT) sockets.
+
+    The backlog is the listen queue length, and accept_batch the max number
+    of connections accepted per wakeup of the listening socket. Non-zero
+    tcp_defer_accept (seconds) and tcp_fastopen (queue length) enable those
+    TCP options, where the platform supports them.
+
+    With a compression_level (1-9), responses of compressible types and at
+    least compression_min_size bytes are gzip/deflate compressed for clients
+    that accept it.
+
+    With a metrics_path (e.g. '/metrics'), per-route request counts and
+    latencies are recorded, and served in the Prometheus text format on
+    that path.
+
+    Requests taking at least slow_request_time seconds (if non-zero) are
+    logged by the server, with the time spent in each phase of the request.
+
+    A request's line and headers must be read within header_timeout
+    seconds, and its body at min_body_rate bytes per second or faster (after
+    the first socket timeout, from when the app starts reading it), or it is
+    answered with 408 (0 for no limit).
+
+    With a write_behind size (bytes), a worker thread is released as soon
+    as the app has returned, even if the client is slow to receive the
+    response: up to that much of the response is held, and left for the
+    server's output multiplexer thread to send (0 to send it all on the
+    worker thread).
+
+    With autoscale, the server adds threads (up to max_threads, which must
+    then be set) while requests wait for one, and removes those left idle
+    for autoscale_cooldown seconds (down to 'threads'). It only applies to
+    CherryPyWSGIServer, and is ignored (with a warning) by
+    AsyncioWSGIServer.
+
+    With keepalive_parking, idle keep-alive connections are parked in a
+    selector between requests, instead of each holding a worker thread.
+
+    At most queue_size (-1 for no limit, the default) accepted connections
+    wait for a worker thread, and others are shed with 503. The
+    queue_discipline is 'fifo', 'lifo' (serve the newest first, and drop
+    the oldest when full) or 'codel' (drop those which waited too long
+    while the queue stays long). With queue_shards above 1, the queue is
+    split into that many shards, each with its own lock, and a connection
+    is placed on the next shard in turn ('round-robin', the default) or on
+    the least loaded one ('least-loaded'). These only apply to
+    CherryPyWSGIServer, and are ignored (with a warning) by
+    AsyncioWSGIServer.
+
+    A request must have its response started within deadline seconds (0 for
+    no limit) of its first byte, or the deadlines ({route: seconds}) of its
+    route, or the server answers 504 Gateway Timeout in its place. The app
+    finds the time.time() of the deadline in environ['fw.deadline'], to
+    bound its own blocking calls (see fw.http.tools.remaining_time).
+
+    The pools are worker pools of their own for some routes, as registered
+    with fw.config.manage.register_wsgi_pools (the default): a dict of pool
+    name: {'routes': [path prefixes], 'min_threads': 1, 'max_threads': -1,
+    'queue_size': -1}. Requests for the routes are only served by the
+    pool's threads, so e.g. slow uploads can't hold up the page loads.
+
+    With a profile_rate, the stacks of the busy worker threads are sampled
+    that many times per second. SIGUSR1 dumps the samples, in the collapsed
+    (flamegraph) stack format, to profile_dump_path ('{pid}' is replaced by
+    the process id, so each worker process writes its own file).
+
+    The server listens on the socket with file descriptor listen_fd, if
+    given, or else on the first socket passed in the environment (LISTEN_FDS
+    and LISTEN_PID, as set by systemd socket activation), instead of binding
+    its own. SIGUSR2 restarts the server without closing the port: a new
+    process is started with the same command line and listening socket, and
+    once it is serving, this one stops accepting, finishes the requests in
+    progress and exits. With reuse_port, the new process binds sockets of
+    its own, and connections still queued on the old ones are reset.
+
+    """
+    if pools is None:
+        pools = fw.cache.get_wsgi_pools()
+    metrics = None
+    if metrics_path:
+        apps_list = dict(apps_list)
+        routes = list(apps_list.keys()) + [metrics_path]
+        for pool in pools.values():
+            routes.extend(pool['routes'])
+        metrics = wsgimetrics.MetricsRegistry(set(routes))
+        apps_list[metrics_path] = metrics.app
+    # Each environ is created per request, so the dispatcher may modify it.
+    apps = wsgiserver.WSGIPathInfoDispatcher(apps_list, copy_environ=False)
+    queue_options = {}
+    if queue_size != -1:
+        queue_options['accepted_queue_size'] = queue_size
+    if queue_discipline != 'fifo':
+        queue_options['queue_discipline'] = queue_discipline
+    if queue_shards > 1:
+        queue_options['queue_shards'] = queue_shards
+    if queue_placement != 'round-robin':
+        queue_options['queue_placement'] = queue_placement
+    if queue_options and issubclass(server_class,
+            wsgiserver.AsyncioWSGIServer):
+        LOG.warning('Ignoring the queue settings, which only apply to '
+            'CherryPyWSGIServer.')
+        queue_options = {}
+    if autoscale and issubclass(server_class, wsgiserver.AsyncioWSGIServer):
+        LOG.warning('Ignoring autoscale, which only applies to '
+            'CherryPyWSGIServer.')
+        autoscale = False
+    server = server_class((address, port, ), apps, **queue_options)
+    server.numthreads = threads
+    server.maxthreads = max_threads
+    server.autoscale = autoscale
+    server.autoscale_cooldown = autoscale_cooldown
+    server.request_queue_size = backlog
+    server.accept_batch = accept_batch
+    server.tcp_defer_accept = tcp_defer_accept
+    server.tcp_fastopen = tcp_fastopen
+    server.compression_level = compression_level
+    server.compression_min_size = compression_min_size
+    server.slow_request_time = slow_request_time
+    server.header_timeout = header_timeout
+    server.min_body_rate = min_body_rate
+    server.write_behind = write_behind
+    server.keepalive_parking = keepalive_parking
+    server.deadline = deadline
+    for route, seconds in (deadlines or {}).items():
+        server.set_deadline([route], seconds)
+    if listen_fd is None:
+        inherited = inherited_sockets()
+        if len(inherited) > 1:
+            LOG.warning('Listening on the first of {} inherited sockets.'
+                .format(len(inherited)))
+        if inherited:
+            server.bound_socket = inherited[0]
+    else:
+        server.bound_socket = socket.socket(fileno=listen_fd)
+    for name, pool in sorted(pools.items()):
+        server.add_pool(name, pool['routes'],
+            min=pool.get('min_threads', 1), max=pool.get('max_threads', -1),
+            queue_size=pool.get('queue_size', -1))
+    if profile_rate:
+        server.profiler = wsgiprofiler.StackSampler(server, profile_rate,
+            profile_dump_path)
+    if metrics is not None:
+        wsgimetrics.add_server_gauges(metrics, server)
+        server.metrics = metrics
     LOG.info('Starting wsgi server, {}:{}.'.format(address, port))
-    _run_wsgi(server)
+    if workers > 1:
+        _run_workers(server, workers, reuse_port)
+    else:
+        _run_wsgi(server)
     return server
 
 
-def _run_wsgi(server):
-    """Method that encapsulates the exception handling of the server."""
+def inherited_sockets():
+    """Returns the listening sockets passed to this process by its parent.
+
+    The sockets are file descriptors LISTEN_FDS_START and up, LISTEN_FDS of
+    them, if LISTEN_PID is this process. The variables are removed from the
+    environment, so they aren't passed on to child processes.
+
+    """
+    count = os.environ.pop('LISTEN_FDS', None)
+    pid = os.environ.pop('LISTEN_PID', None)
+    os.environ.pop('LISTEN_FDNAMES', None)
+    if count is None or pid != str(os.getpid()):
+        return []
+    sockets = []
+    for fd in range(LISTEN_FDS_START, LISTEN_FDS_START + int(count)):
+        os.set_inheritable(fd, False)
+        sockets.append(socket.socket(fileno=fd))
+    return sockets
+
+
+def _run_wsgi(server, restartable=True):
+    """Method that encapsulates the exception handling of the server.
+
+    Returns False if the server was stopped by an unexpected exception.
+    SIGTERM drains the server: the requests already accepted are finished,
+    and a report of them logged. If restartable, SIGUSR2 replaces the
+    process (see start_wsgi), and the server is drained as well.
+
+    Signal handlers can only be installed by the main thread; run from
+    another thread, the server is left to the caller to stop.
+
+    """
+    clean_exit = True
+    handle_signals = threading.current_thread() is threading.main_thread()
+    profiler = getattr(server, 'profiler', None)
+    if profiler is not None and handle_signals:
+        wsgiprofiler.install_signal_handler(profiler)
+    drain = _Drain(server)
+    if handle_signals:
+        signal.signal(signal.SIGTERM, drain.start)
+    if restartable:
+        _notify_ready(server)
+        if handle_signals:
+            signal.signal(signal.SIGUSR2, lambda *_: _restart(
+                [getattr(server, 'socket', None)], drain.run))
     try:
         server.start()
         LOG.info('Normal execution exit...')
@@ -36,12 +259,263 @@ def _run_wsgi(server):
     except SystemExit:
         LOG.critical('SystemExit')
     except Exception as exc:
+        clean_exit = False
         LOG.critical('Exception: {}'.format(exc))
     except:
+        clean_exit = False
         LOG.critical('Without exception object.')
     finally:
-        server.stop()  # Gracefully shut down the thread pool.
+        if drain.started:
+            drain.done.wait()
+        else:
+            server.stop()  # Gracefully shut down the thread pool.
         LOG.info('Server stopped.')
+        if handle_signals:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if restartable:
+                signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+    return clean_exit
+
+
+class _Drain(object):
+    """Drains a server (see HTTPServer.drain) once, from another thread
+    than the one running it."""
+
+    def __init__(self, server):
+        self.server = server
+        self.started = False
+        self.done = threading.Event()
+
+    def start(self, *_):
+        """Starts draining in a thread of its own (a signal handler)."""
+        if self.started:
+            return
+        self.started = True
+        thread = threading.Thread(target=self.run, name='Drain')
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        """Drains the server, and logs the report."""
+        self.started = True
+        try:
+            report = self.server.drain()
+            LOG.info('Drained: {Completed} requests completed, {Aborted} '
+                'aborted, {Rejected} rejected.'.format(**report))
+        finally:
+            self.done.set()
+
+
+def _notify_ready(server):
+    """Tells the process that started this one (see _restart), if any,
+    that the server is ready, once it is (or right away, if None)."""
+    ready_fd = os.environ.pop(READY_FD_ENV, None)
+    if ready_fd is None:
+        return
+    ready_fd = int(ready_fd)
+    os.set_inheritable(ready_fd, False)
+    if server is None:
+        _write_ready(ready_fd)
+        return
+
+    def wait_ready():
+        """Waits for the server to start, then notifies."""
+        while not getattr(server, 'ready', True):
+            time.sleep(0.05)
+        _write_ready(ready_fd)
+
+    thread = threading.Thread(target=wait_ready, name='Ready notifier')
+    thread.daemon = True
+    thread.start()
+
+
+def _write_ready(ready_fd):
+    """Writes the ready byte to the fd, and closes it."""
+    try:
+        os.write(ready_fd, b'1')
+    except OSError as exc:
+        LOG.warning('Could not notify readiness: {}'.format(exc))
+    finally:
+        os.close(ready_fd)
+
+
+def _restart(listeners, stop):
+    """Starts a new process serving on the listeners, and calls stop()
+    once it is ready. Returns the new process's pid, or None.
+
+    The new process runs the same command line, with the listening sockets
+    passed in LISTEN_FDS. If it exits before it is ready, this process
+    keeps serving.
+
+    """
+    listeners = [listener for listener in listeners if listener is not None]
+    ready_r, ready_w = os.pipe()
+    try:
+        pid = os.fork()
+    except OSError as exc:
+        os.close(ready_r)
+        os.close(ready_w)
+        LOG.error('Restart failed: {}'.format(exc))
+        return None
+    if not pid:
+        try:
+            os.close(ready_r)
+            _exec_replacement(listeners, ready_w)
+        finally:
+            os._exit(1)  # pylint: disable=protected-access
+    os.close(ready_w)
+    LOG.info('Restarting, new process {}.'.format(pid))
+
+    def wait_ready():
+        """Waits for the ready byte from the new process."""
+        try:
+            ready = os.read(ready_r, 1)
+        finally:
+            os.close(ready_r)
+        if ready:
+            LOG.info('New process {} is ready, stopping.'.format(pid))
+            stop()
+            return
+        LOG.error('New process {} exited, not restarting.'.format(pid))
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass  # Reaped by the supervisor's wait().
+
+    thread = threading.Thread(target=wait_ready, name='Restart waiter')
+    thread.daemon = True
+    thread.start()
+    return pid
+
+
+def _exec_replacement(listeners, ready_fd):
+    """Replaces this (forked) process with a new run of the command line,
+    inheriting the listeners and the ready fd."""
+    fds = [listener.fileno() for listener in listeners] + [ready_fd]
+    # Move the fds out of the way first, so dup2() can't overwrite them.
+    fds = [fcntl.fcntl(fd, fcntl.F_DUPFD, LISTEN_FDS_START + len(fds))
+        for fd in fds]
+    for index, fd in enumerate(fds):
+        os.dup2(fd, LISTEN_FDS_START + index)  # Inheritable.
+    env = dict(os.environ)
+    if listeners:
+        env['LISTEN_FDS'] = str(len(listeners))
+        env['LISTEN_PID'] = str(os.getpid())
+    env[READY_FD_ENV] = str(LISTEN_FDS_START + len(listeners))
+    os.execve(sys.executable, [sys.executable] + sys.orig_argv[1:], env)
+
+
+def _run_workers(server, workers, reuse_port):
+    """Forks the worker processes and supervises them until shutdown.
+
+    Workers that crash are restarted. SIGTERM (or Ctrl-C) stops all workers
+    (SIGTERM drains them, see _run_wsgi), SIGHUP makes the workers exit
+    gracefully and restarts them. With a profiler, SIGUSR1 is passed on to
+    the workers (see profile_rate).
+    SIGUSR2 starts a new supervisor and its workers on the same listening
+    socket, and stops these workers once it is ready (see start_wsgi).
+
+    """
+    if reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+        LOG.warning('SO_REUSEPORT is not supported, sharing one socket.')
+        reuse_port = False
+    listener = None
+    if reuse_port:
+        server.reuse_port = True
+    else:
+        # Bind before forking, so all workers accept on the same socket.
+        server.prepare_socket()
+        listener = server.bound_socket = server.socket
+    children = {}
+    restarting = set()
+    state = {'stopping': False}
+
+    def forward_signal(signum, _):
+        """Passes the signal on to all workers."""
+        if signum == signal.SIGHUP:
+            restarting.update(children.keys())
+        elif signum == signal.SIGTERM:
+            state['stopping'] = True
+        for pid in list(children.keys()):
+            _kill(pid, signum)
+
+    def stop_workers():
+        """Stops the workers, once the new supervisor is ready."""
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGHUP, forward_signal)
+    signal.signal(signal.SIGUSR2,
+        lambda *_: _restart([listener], stop_workers))
+    if getattr(server, 'profiler', None) is not None:
+        # The workers replace this with their own handler (see _run_wsgi).
+        signal.signal(signal.SIGUSR1, forward_signal)
+    # The workers are forked as soon as the socket is bound, so a process
+    # that started this one can stop its workers now.
+    _notify_ready(None)
+    for _ in range(workers):
+        pid = _fork_worker(server)
+        children[pid] = time.time()
+    LOG.info('Started {} worker processes.'.format(workers))
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except KeyboardInterrupt:
+            # The workers got SIGINT as well, wait for them to stop.
+            state['stopping'] = True
+            continue
+        started = children.pop(pid, None)
+        if started is None or state['stopping']:
+            continue
+        if pid in restarting:
+            restarting.discard(pid)
+        elif os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            continue  # The worker stopped normally.
+        else:
+            LOG.warning('Worker {} died, status {}, restarting.'.format(pid,
+                status))
+            time.sleep(max(RESTART_DELAY - (time.time() - started), 0))
+        pid = _fork_worker(server)
+        children[pid] = time.time()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+    signal.signal(signal.SIGUSR2, signal.SIG_DFL)
+    if listener is not None:
+        listener.close()
+    LOG.info('All worker processes stopped.')
+
+
+def _fork_worker(server):
+    """Forks a worker process running the server, returns its pid."""
+    pid = os.fork()
+    if pid:
+        return pid
+    exit_code = 1
+    try:
+        # SIGTERM drains the server, see _run_wsgi.
+        signal.signal(signal.SIGHUP, _exit_worker)
+        signal.signal(signal.SIGUSR2, signal.SIG_IGN)
+        if _run_wsgi(server, restartable=False):
+            exit_code = 0
+    finally:
+        logging.shutdown()
+        os._exit(exit_code)  # pylint: disable=protected-access
+
+
+def _exit_worker(signum, _):
+    """Signal handler making a worker process stop its server."""
+    raise SystemExit(signum)
+
+
+def _kill(pid, signum):
+    """Sends a signal to a process that may already have exited."""
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
 
 
 def _test_entry_method(_, start_response):
@@ -0,0 +1 @@
+# pylint: skip-file
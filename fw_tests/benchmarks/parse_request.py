@@ -0,0 +1,83 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=invalid-name
+"""Benchmark of HTTPRequest.parse_request() on a typical browser request.
+
+Compares parsing the whole request head in one pass (read_request_head)
+with the readline() per line path, on a GET with 15 headers read from an
+in-memory buffer. Run with:
+
+    python -m fw_tests.benchmarks.parse_request [runs]
+
+"""
+
+import io
+import sys
+import timeit
+
+import fw.externals.wsgiserver as wsgiserver
+
+REQUEST = (
+    b'GET /foo/bar/index.html?x=1&y=2 HTTP/1.1\r\n'
+    b'Host: www.example.com\r\n'
+    b'Connection: keep-alive\r\n'
+    b'Cache-Control: max-age=0\r\n'
+    b'Upgrade-Insecure-Requests: 1\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+    b'(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36\r\n'
+    b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,'
+    b'image/avif,image/webp,*/*;q=0.8\r\n'
+    b'Sec-Fetch-Site: none\r\n'
+    b'Sec-Fetch-Mode: navigate\r\n'
+    b'Sec-Fetch-User: ?1\r\n'
+    b'Sec-Fetch-Dest: document\r\n'
+    b'Sec-Ch-Ua: "Chromium";v="120"\r\n'
+    b'Sec-Ch-Ua-Mobile: ?0\r\n'
+    b'Accept-Encoding: gzip, deflate, br\r\n'
+    b'Accept-Language: en-US,en;q=0.9,sv;q=0.8\r\n'
+    b'Cookie: sid=abcdef0123456789; theme=dark\r\n'
+    b'\r\n')
+
+
+class ServerMock(wsgiserver.HTTPServer):
+    """An HTTPServer with its defaults, which never runs."""
+    header_timeout = 0
+
+    def __init__(self):
+        self.stats = {'Enabled': False}
+
+
+class LineReader:
+    """A reader without peek(), for the readline() path."""
+    def __init__(self, rfile):
+        self.read = rfile.read
+        self.readline = rfile.readline
+
+
+class ConnMock:
+    read_deadline = None
+
+    def __init__(self, bulk):
+        rfile = wsgiserver.io.BufferedReader(io.BytesIO(REQUEST), 8192)
+        self.rfile = rfile if bulk else LineReader(rfile)
+
+
+def parse(bulk):
+    request = wsgiserver.HTTPRequest(ServerMock(), ConnMock(bulk))
+    request.parse_request()
+    assert request.ready
+    return request
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name, bulk in (('readline path', False), ('bulk path', True)):
+        seconds = min(timeit.repeat(lambda: parse(bulk), number=runs,
+            repeat=5))
+        print('{:14} {:6.1f} us/request'.format(name + ':',
+            seconds / runs * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=invalid-name
+"""Benchmark of pipelined requests, with and without batched responses.
+
+A client sends rounds of pipelined GETs over one keep-alive connection and
+reads all the responses, against servers with pipeline_batch 0 (a flush
+per response) and 16. Prints the requests per second and the number of
+socket sends. Run with:
+
+    python -m fw_tests.benchmarks.pipelining [rounds] [depth]
+
+"""
+
+import sys
+import time
+import socket
+import threading
+
+import fw.externals.wsgiserver as wsgiserver
+
+
+def app(environ, start_response):
+    body = b'hello'
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain'),
+        ('Content-Length', '{}'.format(len(body)))
+    ])
+    return [body]
+
+
+def serve(pipeline_batch):
+    server = wsgiserver.CherryPyWSGIServer(('127.0.0.1', 0), app,
+        numthreads=1)
+    server.pipeline_batch = pipeline_batch
+    threading.Thread(target=server.start, daemon=True).start()
+    while not server.ready:
+        time.sleep(0.01)
+    return server, server.socket.getsockname()[1]
+
+
+def run(port, rounds, depth):
+    sock = socket.create_connection(('127.0.0.1', port))
+    requests = b'GET / HTTP/1.1\r\nHost: x\r\n\r\n' * depth
+    response_size = None
+    started = time.time()
+    for _ in range(rounds):
+        sock.sendall(requests)
+        if response_size is None:
+            data = sock.recv(65536)
+            response_size = len(data.split(b'hello')[0]) + 5
+            received = len(data)
+        else:
+            received = 0
+        while received < response_size * depth:
+            received += len(sock.recv(65536))
+    seconds = time.time() - started
+    sock.close()
+    return rounds * depth / seconds
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    sends = [0]
+    flush_unlocked = wsgiserver.CP_BufferedWriter._flush_unlocked
+
+    def count_sends(writer, keep=0):
+        if writer._segments:
+            sends[0] += 1
+        return flush_unlocked(writer, keep)
+
+    wsgiserver.CP_BufferedWriter._flush_unlocked = count_sends
+    for pipeline_batch in (0, 16):
+        server, port = serve(pipeline_batch)
+        sends[0] = 0
+        rate = run(port, rounds, depth)
+        server.stop()
+        print('pipeline_batch {:2}: {:8.0f} requests/s, {:.2f} sends per '
+            'request'.format(pipeline_batch, rate,
+                sends[0] / (rounds * depth)))
+
+
+if __name__ == '__main__':
+    main()
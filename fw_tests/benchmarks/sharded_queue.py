@@ -0,0 +1,80 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=invalid-name
+"""Benchmark of the request queue, single locked deque versus sharded.
+
+A producer puts items to a pool of worker threads, which take them with
+no work (a saturated queue) and with 1 ms of work per item (a moderately
+loaded queue, the producer pacing itself to the pool). Prints the items
+per second, the cost of put() and the share of items a worker stole from
+another shard than its own. Run with:
+
+    python -m fw_tests.benchmarks.sharded_queue [items] [workers]
+
+"""
+
+import sys
+import time
+import threading
+
+import fw.externals.wsgiserver as wsgiserver
+
+
+class Item:
+    __slots__ = ('queued_at', )
+
+
+def run(request_queue, items, workers, work):
+    def worker():
+        while True:
+            item = request_queue.get()
+            if item is wsgiserver._SHUTDOWNREQUEST:
+                return
+            if work:
+                time.sleep(work)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    put_seconds = 0.0
+    started = time.perf_counter()
+    for _ in range(items):
+        item = Item()
+        item.queued_at = 0
+        before = time.perf_counter()
+        request_queue.put(item)
+        put_seconds += time.perf_counter() - before
+        if work:
+            time.sleep(work / workers / 1.2)
+    for thread in threads:
+        request_queue.put(wsgiserver._SHUTDOWNREQUEST)
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return items / seconds, put_seconds / items * 1e6
+
+
+def main():
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    queues = (
+        ('single', lambda: wsgiserver.RequestQueue()),
+        ('4 shards round-robin', lambda: wsgiserver.ShardedRequestQueue(4)),
+        ('4 shards least-loaded', lambda: wsgiserver.ShardedRequestQueue(4,
+            placement='least-loaded')),
+    )
+    for work, count in ((0, items), (0.001, max(items // 30, 100))):
+        print('work {} ms, {} items, {} workers:'.format(work * 1000, count,
+            workers))
+        for label, make in queues:
+            request_queue = make()
+            rate, put_us = run(request_queue, count, workers, work)
+            steals = getattr(request_queue, 'steals', None)
+            print('  {:22} {:8.0f} items/s, put() {:5.2f} us{}'.format(label,
+                rate, put_us, '' if steals is None else
+                    ', {:3.0f}% stolen'.format(100.0 * steals / count)))
+
+
+if __name__ == '__main__':
+    main()
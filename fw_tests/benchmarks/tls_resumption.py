@@ -0,0 +1,105 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=invalid-name
+"""Benchmark of HTTPS connections, with full handshakes and resumed ones.
+
+Client threads, in a process of their own, each make a new TLS connection
+per request, with TLS 1.2 and 1.3, either from scratch or resuming the
+session of their previous connection. Prints the connections per second,
+and how many were resumed. Needs openssl, to make a certificate. Run with:
+
+    python -m fw_tests.benchmarks.tls_resumption [connections] [clients]
+
+"""
+
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+
+import fw.externals.wsgiserver as wsgiserver
+from fw.externals.ssl_builtin import BuiltinSSLAdapter
+from fw_tests.externals.ssl_builtin import make_certificate
+
+
+CLIENT = r'''
+import sys
+import ssl
+import time
+import socket
+import threading
+
+port, connections, clients = [int(arg) for arg in sys.argv[1:4]]
+resume, version, cafile = sys.argv[4] == '1', sys.argv[5], sys.argv[6]
+context = ssl.create_default_context(cafile=cafile)
+context.maximum_version = getattr(ssl.TLSVersion, version)
+request = b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n'
+resumed = [0]
+
+def run():
+    session = None
+    for _ in range(connections):
+        raw = socket.create_connection(('127.0.0.1', port))
+        # Else Nagle holds up the request behind the client's Finished of
+        # an abbreviated TLS 1.2 handshake, until the delayed ACK.
+        raw.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock = context.wrap_socket(raw, server_hostname='localhost',
+            session=session)
+        sock.sendall(request)
+        while sock.recv(4096):
+            pass
+        resumed[0] += sock.session_reused
+        if resume:
+            session = sock.session
+        sock.close()
+
+threads = [threading.Thread(target=run) for _ in range(clients)]
+started = time.perf_counter()
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(connections * clients / (time.perf_counter() - started), resumed[0])
+'''
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Length', '2')])
+    return [b'ok']
+
+
+def main():
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    directory = tempfile.mkdtemp()
+    try:
+        files = make_certificate(directory)
+        if files is None:
+            sys.exit('openssl is needed to make a certificate.')
+        server = wsgiserver.CherryPyWSGIServer(('127.0.0.1', 0), app,
+            numthreads=8, request_queue_size=128)
+        server.ssl_adapter = BuiltinSSLAdapter(*files)
+        threading.Thread(target=server.start, daemon=True).start()
+        while not server.ready or server.socket is None:
+            time.sleep(0.01)
+        port = server.socket.getsockname()[1]
+        for version in ('TLSv1_2', 'TLSv1_3'):
+            for resume in ('0', '1'):
+                output = subprocess.run([sys.executable, '-c', CLIENT,
+                    str(port), str(connections), str(clients), resume,
+                    version, files[0]], check=True, stdout=subprocess.PIPE,
+                    universal_newlines=True).stdout.split()
+                print('{} {:14}: {:6.0f} connections/s, {} of {} '
+                    'resumed'.format(version, 'resumed' if resume == '1'
+                        else 'full handshake', float(output[0]), output[1],
+                    connections * clients))
+        server.stop()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
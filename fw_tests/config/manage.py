@@ -292,6 +292,62 @@ class TestConfigManage(unittest.TestCase):
         self.assertEqual(overrides.get('@api'), None)
         self.assertEqual(overrides['nodes'].get('001'), None)
 
+    def test_04f_get_new_config_wsgi_server_1_2_0(self):
+        config = config_manage.create_new_config('WsgiServer',
+            type_version='1.2.0')
+        self.assertEqual(config['@api']['version'], '1.2.0')
+        self.assertEqual(config['@api']['prev_version'], '1.1.0')
+        self.assertEqual(config['server']['workers'], 1)
+        self.assertEqual(config['server']['threads'], 10)
+        self.assertEqual(config['server']['reuse_port'], False)
+        result = config_manage.validate_config(config)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(len(result['errors']), 0)
+
+    def test_04f_get_new_config_wsgi_server(self):
+        config = config_manage.create_new_config('WsgiServer')
+        self.assertEqual(config['@api']['version'], '1.13.0')
+        self.assertEqual(config['@api']['prev_version'], '1.12.0')
+        self.assertEqual(config['server']['keepalive_parking'], False)
+        self.assertEqual(config['server']['workers'], 1)
+        self.assertEqual(config['server']['threads'], 10)
+        self.assertEqual(config['server']['reuse_port'], False)
+        self.assertEqual(config['server']['max_threads'], -1)
+        self.assertEqual(config['server']['autoscale'], False)
+        self.assertEqual(config['server']['autoscale_cooldown'], 60)
+        self.assertEqual(config['server']['queue_size'], -1)
+        self.assertEqual(config['server']['queue_discipline'], 'fifo')
+        self.assertEqual(config['server']['backlog'], 128)
+        self.assertEqual(config['server']['accept_batch'], 64)
+        self.assertEqual(config['server']['tcp_defer_accept'], 0)
+        self.assertEqual(config['server']['tcp_fastopen'], 0)
+        self.assertEqual(config['server']['compression_level'], 0)
+        self.assertEqual(config['server']['compression_min_size'], 1024)
+        self.assertEqual(config['server']['metrics_path'], '')
+        self.assertEqual(config['server']['slow_request_time'], 0)
+        self.assertEqual(config['server']['profile_rate'], 0)
+        self.assertEqual(config['server']['profile_dump_path'],
+            '/tmp/fw-profile-{pid}.txt')
+        self.assertEqual(config['server']['header_timeout'], 20)
+        self.assertEqual(config['server']['min_body_rate'], 500)
+        self.assertEqual(config['server']['queue_shards'], 0)
+        self.assertEqual(config['server']['queue_placement'], 'round-robin')
+        self.assertEqual(config['server']['write_behind'], 0)
+        self.assertEqual(config['server']['deadline'], 0)
+        self.assertEqual(config['server']['deadlines'], {})
+        result = config_manage.validate_config(config)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(len(result['errors']), 0)
+
+    def test_04g_get_new_config_wsgi_apps(self):
+        config = config_manage.create_new_config('WsgiApps')
+        self.assertEqual(config['@api']['version'], '1.1.0')
+        self.assertEqual(config['@api']['prev_version'], '1.0.0')
+        self.assertEqual(config['resource_path'], None)
+        result = config_manage.validate_config(config)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(len(result['errors']), 0)
+
     def test_05_validate_config_ok(self):
         result = config_manage.validate_config(CONFIG_1_0_0)
         self.assertEqual(result['status'], 'ok')
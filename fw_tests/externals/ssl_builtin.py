@@ -0,0 +1,181 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=invalid-name
+
+import os
+import ssl
+import time
+import shutil
+import socket
+import tempfile
+import unittest
+import threading
+import subprocess
+
+import fw.externals.wsgiserver as wsgiserver
+from fw.externals.ssl_builtin import BuiltinSSLAdapter
+from fw_tests.externals.wsgiserver import serve, read_responses
+
+
+def make_certificate(directory):
+    """Generates a self-signed certificate for localhost with openssl.
+
+    Returns the (certificate, private key) filenames, or None if openssl
+    can't be run.
+    """
+    certificate = os.path.join(directory, 'cert.pem')
+    private_key = os.path.join(directory, 'key.pem')
+    try:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'ec',
+            '-pkeyopt', 'ec_paramgen_curve:prime256v1', '-nodes', '-days',
+            '1', '-subj', '/CN=localhost', '-keyout', private_key, '-out',
+            certificate], check=True, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return certificate, private_key
+
+
+def _tls_app(environ, start_response):
+    """Answers with the serving thread's type and the SSL environ."""
+    body = '{} {} {} {}'.format(
+        isinstance(threading.current_thread(), wsgiserver.WorkerThread),
+        environ['wsgi.url_scheme'], environ['SSL_PROTOCOL'],
+        environ['SSL_SESSION_RESUMED']).encode('utf-8')
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain'),
+        ('Content-Length', '{}'.format(len(body)))
+    ])
+    return [body]
+
+
+class TestBuiltinSSLAdapter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.files = make_certificate(cls.directory)
+
+    def setUp(self):
+        if self.files is None:
+            self.skipTest('openssl is needed to make a certificate.')
+        self.adapter = BuiltinSSLAdapter(*self.files)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+
+    def _serve(self, **options):
+        server, port = serve(app=_tls_app, options=options,
+            ssl_adapter=self.adapter)
+        self.servers.append(server)
+        return port
+
+    def _client_context(self, version):
+        context = ssl.create_default_context(cafile=self.files[0])
+        context.maximum_version = version
+        return context
+
+    def _get(self, port, context, session=None):
+        """Sends a request over a new connection, returning (body, the
+        session and whether it was reused)."""
+        sock = context.wrap_socket(
+            socket.create_connection(('127.0.0.1', port), timeout=10),
+            server_hostname='localhost', session=session)
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n')
+        [(status, _, body)] = read_responses(sock, 1)
+        self.assertEqual(status, 200)
+        # TLS 1.3 session tickets come after the handshake, and are read
+        # along with the response.
+        result = (body.decode('utf-8'), sock.session, sock.session_reused)
+        sock.close()
+        return result
+
+    def test_01_handshake_on_worker(self):
+        port = self._serve()
+        handshakes = []
+        handshake = self.adapter.handshake
+
+        def spy(sock):
+            handshakes.append(threading.current_thread())
+            return handshake(sock)
+
+        self.adapter.handshake = spy
+        context = self._client_context(ssl.TLSVersion.TLSv1_3)
+        body, _, _ = self._get(port, context)
+        self.assertEqual(body, 'True https TLSv1.3 Initial')
+        self.assertEqual(len(handshakes), 1)
+        self.assertIsInstance(handshakes[0], wsgiserver.WorkerThread)
+
+    def test_02_silent_client(self):
+        port = self._serve(numthreads=2)
+        # Clients which connect but never start the handshake hold a worker
+        # thread each, not the accepting thread.
+        silent = socket.create_connection(('127.0.0.1', port))
+        time.sleep(0.2)
+        context = self._client_context(ssl.TLSVersion.TLSv1_3)
+        started = time.time()
+        body, _, _ = self._get(port, context)
+        self.assertEqual(body, 'True https TLSv1.3 Initial')
+        self.assertLess(time.time() - started, 2)
+        silent.close()
+
+    def test_03_shed_before_handshake(self):
+        port = self._serve(numthreads=1, accepted_queue_size=1)
+        # The worker waits for the handshake of the first silent client,
+        # the second one waits in the queue.
+        silent = [socket.create_connection(('127.0.0.1', port), timeout=10)
+            for _ in range(2)]
+        time.sleep(0.2)
+        # Those shed are closed at once, instead of the accepting thread
+        # waiting for their handshake to send them a 503.
+        for _ in range(2):
+            shed = socket.create_connection(('127.0.0.1', port), timeout=10)
+            started = time.time()
+            self.assertEqual(shed.recv(1024), b'')
+            self.assertLess(time.time() - started, 1)
+            shed.close()
+        self.assertEqual(self.servers[0].stats['Shed Queue Full'], 2)
+        for sock in silent:
+            sock.close()
+
+    def test_04_session_resumed(self):
+        port = self._serve()
+        for version, name in ((ssl.TLSVersion.TLSv1_2, 'TLSv1.2'),
+                (ssl.TLSVersion.TLSv1_3, 'TLSv1.3')):
+            context = self._client_context(version)
+            body, session, reused = self._get(port, context)
+            self.assertEqual(body, 'True https {} Initial'.format(name))
+            self.assertFalse(reused)
+            body, session, reused = self._get(port, context, session)
+            self.assertEqual(body, 'True https {} Resumed'.format(name))
+            self.assertTrue(reused)
+
+    def test_05_no_session_tickets(self):
+        self.adapter.session_tickets = 0
+        self.adapter.context = self.adapter.create_context()
+        port = self._serve()
+        context = self._client_context(ssl.TLSVersion.TLSv1_3)
+        _, session, _ = self._get(port, context)
+        body, _, reused = self._get(port, context, session)
+        self.assertEqual(body, 'True https TLSv1.3 Initial')
+        self.assertFalse(reused)
+
+    def test_06_plain_http(self):
+        port = self._serve()
+        sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+        sock.sendall(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n')
+        [(status, _, body)] = read_responses(sock, 1)
+        sock.close()
+        self.assertEqual(status, 400)
+        self.assertIn(b'only speaks HTTPS', body)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,1456 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=too-many-public-methods
+# pylint: disable=invalid-name
+# pylint: disable=too-many-statements
+
+import io
+import time
+import logging
+import itertools
+import queue
+import socket
+import unittest
+import threading
+import collections
+import http.client
+import unittest.mock as mock
+
+import fw.externals.wsgiserver as wsgiserver
+
+
+def _test_app(environ, start_response):
+    """Echoes the request body, or sleeps for /sleep?seconds."""
+    path = environ['PATH_INFO']
+    if path.startswith('/sleep'):
+        time.sleep(float(environ['QUERY_STRING'] or 1))
+    body = environ['wsgi.input'].read()
+    if not body:
+        body = 'hello {}'.format(path).encode('utf-8')
+    start_response('200 OK', [
+        ('Content-Type', 'text/plain'),
+        ('Content-Length', '{}'.format(len(body)))
+    ])
+    return [body]
+
+
+def serve(server_class=wsgiserver.CherryPyWSGIServer, app=_test_app,
+        options=None, pools=None, **attributes):
+    """Starts a server on a free port, in a thread of its own.
+
+    The options are passed to the server class, the pools ({name: (routes,
+    add_pool keyword arguments)}) added to it, and the other keyword
+    arguments set as attributes of the server.
+    """
+    server = server_class(('127.0.0.1', 0), app, **(options or {}))
+    for name, (routes, kwargs) in (pools or {}).items():
+        server.add_pool(name, routes, **kwargs)
+    for name, value in attributes.items():
+        setattr(server, name, value)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    for _ in range(200):
+        if server.ready and getattr(server, 'socket', None) is not None:
+            break
+        time.sleep(0.01)
+    return server, server.socket.getsockname()[1]
+
+
+def get(port, path='/', conn=None, method='GET', body=None, headers=None):
+    """Sends a request, returning (status, headers, body, connection)."""
+    if conn is None:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return (response.status, dict(response.getheaders()), response.read(),
+        conn)
+
+
+def read_responses(sock, count):
+    """Reads count responses off a raw socket, as (status, headers, body).
+
+    Pass a file from sock.makefile('rb') instead, to read what follows the
+    responses later on.
+    """
+    rfile = sock if hasattr(sock, 'readline') else sock.makefile('rb')
+    responses = []
+    for _ in range(count):
+        status = int(rfile.readline().split()[1])
+        headers = {}
+        while True:
+            line = rfile.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        body = rfile.read(int(headers.get('content-length', 0)))
+        responses.append((status, headers, body))
+    return responses
+
+
+class ConnMock:
+    """Mock class for a parked HTTPConnection."""
+    def __init__(self):
+        self.socket, self.peer = socket.socketpair()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        self.socket.close()
+        self.peer.close()
+
+
+class ServerMock:
+    """Mock class for the server of a ConnectionManager."""
+    timeout = 10
+
+
+class ParseServerMock(wsgiserver.HTTPServer):
+    """An HTTPServer with its defaults, which never runs."""
+    header_timeout = 0
+
+    def __init__(self, max_request_header_size=0):
+        self.stats = {'Enabled': False}
+        self.max_request_header_size = max_request_header_size
+
+
+class LineReader:
+    """A reader without peek(), which HTTPRequest reads line by line."""
+    def __init__(self, rfile):
+        self.read = rfile.read
+        self.readinto = rfile.readinto
+        self.readline = rfile.readline
+
+
+class ParseConnMock:
+    """Mock class for the HTTPConnection of a request to parse."""
+    read_deadline = None
+    socket = None
+
+    def __init__(self, head, bulk):
+        rfile = wsgiserver.io.BufferedReader(io.BytesIO(head), 8192)
+        self.rfile = rfile if bulk else LineReader(rfile)
+        self.wfile = io.BytesIO()
+
+
+# A body with lines of varying length, to read in chunks of varying size.
+BODY = b''.join('line {}{}\n'.format(n, 'x' * (n * 37 % 300)).encode('ascii')
+    for n in range(150))
+
+
+def chunked(data, sizes, trailers=b''):
+    """Encodes data in chunks of the given sizes, in turn."""
+    parts = []
+    pos = 0
+    for n in itertools.cycle(sizes):
+        if pos >= len(data):
+            break
+        chunk = data[pos:pos + n]
+        # Some chunk sizes with an extension, as clients may send them.
+        extension = b';ext=1' if n % 2 else b''
+        parts.append(b'%x%s\r\n%s\r\n' % (len(chunk), extension, chunk))
+        pos += n
+    parts.append(b'0\r\n' + trailers + b'\r\n')
+    return b''.join(parts)
+
+
+class TestBodyReaders(unittest.TestCase):
+
+    def _readers(self, data):
+        """Yields the kinds of rfile a body is read from."""
+        for buffer_size in (16, 8192):
+            yield wsgiserver.CP_BufferedReader(io.BytesIO(data), buffer_size)
+        # Without peek(), which is read chunk by chunk.
+        yield LineReader(wsgiserver.CP_BufferedReader(io.BytesIO(data)))
+
+    def _read_all(self, body, how):
+        if how == 'read':
+            return body.read()
+        parts = []
+        while True:
+            if how == 'readline':
+                data = body.readline()
+            elif how == 'readline(n)':
+                data = body.readline(100)
+                self.assertLessEqual(len(data), 100)
+            elif how == 'readinto':
+                buf = bytearray(999)
+                n = body.readinto(buf)
+                data = bytes(buf[:n])
+            else:
+                data = body.read(how)
+                self.assertLessEqual(len(data), how)
+            if not data:
+                return b''.join(parts)
+            parts.append(data)
+
+    def test_01_chunked(self):
+        for sizes in ((1,), (7, 1, 300), (8192,), (len(BODY),)):
+            data = chunked(BODY, sizes) + b'GET /next'
+            for how in ('read', 1, 3, 1000, 'readinto', 'readline',
+                    'readline(n)'):
+                for rfile in self._readers(data):
+                    body = wsgiserver.ChunkedRFile(rfile, 0)
+                    self.assertEqual(self._read_all(body, how), BODY,
+                        (sizes, how, rfile))
+                    self.assertEqual(list(body.read_trailer_lines()), [])
+                    # The body ends right after the last chunk.
+                    self.assertEqual(rfile.read(), b'GET /next')
+
+    def test_02_chunked_readline(self):
+        data = chunked(b'one\ntwo\nthree', (2, 5))
+        for rfile in self._readers(data):
+            body = wsgiserver.ChunkedRFile(rfile, 0)
+            self.assertEqual(body.readline(), b'one\n')
+            self.assertEqual(body.readline(2), b'tw')
+            self.assertEqual(body.readline(), b'o\n')
+            self.assertEqual(body.readlines(), [b'three'])
+            self.assertEqual(body.readline(), b'')
+
+    def test_03_chunked_trailers(self):
+        data = chunked(BODY, (1000,), b'X-Sum: 1\r\nX-Other: 2\r\n')
+        for rfile in self._readers(data):
+            body = wsgiserver.ChunkedRFile(rfile, 0)
+            with self.assertRaises(ValueError):
+                list(body.read_trailer_lines())
+            self.assertEqual(body.read(), BODY)
+            self.assertEqual(list(body.read_trailer_lines()),
+                [b'X-Sum: 1\r\n', b'X-Other: 2\r\n'])
+
+    def test_04_chunked_maxlen(self):
+        data = chunked(BODY, (1000,))
+        for rfile in self._readers(data):
+            body = wsgiserver.ChunkedRFile(rfile, 5000)
+            with self.assertRaises((IOError, wsgiserver.MaxSizeExceeded)):
+                body.read()
+        for rfile in self._readers(data):
+            body = wsgiserver.ChunkedRFile(rfile, len(data))
+            self.assertEqual(body.read(), BODY)
+
+    def test_05_chunked_bad_framing(self):
+        for data in (b'5\r\nabcdeXX0\r\n\r\n', b'zz\r\nabc\r\n',
+                b'5\r\nabc'):
+            for rfile in self._readers(data):
+                body = wsgiserver.ChunkedRFile(rfile, 0)
+                with self.assertRaises(ValueError):
+                    body.read()
+
+    def test_06_known_length(self):
+        data = BODY + b'GET /next'
+        for how in ('read', 1, 3, 1000, 'readinto', 'readline',
+                'readline(n)'):
+            for rfile in self._readers(data):
+                body = wsgiserver.KnownLengthRFile(rfile, len(BODY))
+                self.assertEqual(self._read_all(body, how), BODY,
+                    (how, rfile))
+                self.assertEqual(body.remaining, 0)
+                self.assertEqual(rfile.read(), b'GET /next')
+
+    def test_07_known_length_readline(self):
+        rfile = io.BytesIO(b'one\ntwo\nthree\nfour')
+        body = wsgiserver.KnownLengthRFile(rfile, 12)
+        self.assertEqual(body.readline(2), b'on')
+        self.assertEqual(body.readline(), b'e\n')
+        self.assertEqual(body.readlines(), [b'two\n', b'thre'])
+        self.assertEqual(body.readline(), b'')
+        self.assertEqual(body.read(), b'')
+        self.assertEqual(body.readinto(bytearray(10)), 0)
+
+
+class TestHTTPRequestParse(unittest.TestCase):
+
+    def _parse(self, head, max_request_header_size=0):
+        """Parses the head both ways; returns the bulk path's result."""
+        results = []
+        for bulk in (False, True):
+            conn = ParseConnMock(head, bulk)
+            request = wsgiserver.HTTPRequest(
+                ParseServerMock(max_request_header_size), conn)
+            request.parse_request()
+            results.append((request.ready, request.inheaders,
+                conn.wfile.getvalue().split(b'\r\n')[0]))
+        self.assertEqual(results[0], results[1])
+        return results[1]
+
+    def test_01_headers(self):
+        ready, headers, response = self._parse(
+            b'GET /a?b=c HTTP/1.1\r\nhost: x\r\nAccept: a\r\n'
+            b'accept: b\r\nX-Empty:\r\n\r\n')
+        self.assertTrue(ready)
+        self.assertEqual(response, b'')
+        self.assertEqual(headers[b'Host'], b'x')
+        self.assertEqual(headers[b'Accept'], b'a, b')
+        self.assertEqual(headers[b'X-Empty'], b'')
+
+    def test_02_bad_request(self):
+        for head in (b'GET / HTTP/1.1\nHost: x\r\n\r\n',
+                b'GET / HTTP/1.1\r\nno colon\r\n\r\n',
+                b'GET\r\n\r\n'):
+            ready, _, response = self._parse(head)
+            self.assertFalse(ready)
+            self.assertEqual(response, b'HTTP/1.1 400 Bad Request')
+
+    def test_03_too_large(self):
+        ready, _, response = self._parse(
+            b'GET /' + b'x' * 300 + b' HTTP/1.1\r\n\r\n', 200)
+        self.assertFalse(ready)
+        self.assertEqual(response, b'HTTP/1.1 414 Request-URI Too Long')
+        ready, _, response = self._parse(
+            b'GET / HTTP/1.1\r\nX-Big: ' + b'y' * 300 + b'\r\n\r\n', 200)
+        self.assertFalse(ready)
+        self.assertEqual(response,
+            b'HTTP/1.1 413 Request Entity Too Large')
+
+    def test_04_version(self):
+        ready, _, response = self._parse(b'GET / HTTP/2.0\r\n\r\n')
+        self.assertFalse(ready)
+        self.assertEqual(response,
+            b'HTTP/1.1 505 HTTP Version Not Supported')
+
+
+# The CPU time of a phase in a slow request log line, if the phase ran in
+# a single thread, and the phase with its seconds.
+CPU = r'(\(cpu \d+\.\d{6}\))?'
+PHASE = r'\d+\.\d{6}' + CPU
+
+
+class TestRequestTimeline(unittest.TestCase):
+
+    @mock.patch('fw.externals.wsgiserver.thread_time', autospec=True)
+    @mock.patch('time.time', autospec=True)
+    def test_01_phases(self, time_mock, thread_time):
+        time_mock.side_effect = [100.0, 100.5, 101.0, 103.0]
+        thread_time.side_effect = [1.0, 1.1, 1.3, 2.0]
+        timeline = wsgiserver.RequestTimeline()
+        for name in ('accept', 'queue', 'parse', 'app'):
+            timeline.mark(name)
+        self.assertTrue(timeline.has('parse'))
+        self.assertFalse(timeline.has('first_byte'))
+        self.assertEqual(timeline.elapsed(), 3.0)
+        phases = timeline.phases()
+        self.assertEqual([name for name, _, _ in phases],
+            ['queue', 'parse', 'app'])
+        self.assertEqual([wall for _, wall, _ in phases], [0.5, 0.5, 2.0])
+        self.assertEqual([round(cpu, 6) for _, _, cpu in phases],
+            [0.1, 0.2, 0.7])
+        self.assertEqual(timeline.format(),
+            'queue=0.500000(cpu 0.100000) parse=0.500000(cpu 0.200000) '
+            'app=2.000000(cpu 0.700000)')
+
+    def test_02_phase_in_another_thread(self):
+        timeline = wsgiserver.RequestTimeline()
+        timeline.mark('accept')
+        thread = threading.Thread(target=timeline.mark, args=('queue',))
+        thread.start()
+        thread.join()
+        timeline.mark('read')
+        (_, _, queue_cpu), (_, _, read_cpu) = timeline.phases()
+        self.assertIsNone(queue_cpu)
+        self.assertIsNone(read_cpu)
+        self.assertRegex(timeline.format(),
+            r'^queue=\d+\.\d{6} read=\d+\.\d{6}$')
+        self.assertEqual(wsgiserver.RequestTimeline().elapsed(), 0.0)
+
+    def _slow_requests(self, server_class):
+        logged = []
+
+        def error_log(msg='', level=20, traceback=False):
+            logged.append((msg, level))
+
+        server, port = serve(server_class, slow_request_time=0.2,
+            error_log=error_log)
+        try:
+            self.assertEqual(get(port, '/fast')[0], 200)
+            self.assertEqual(get(port, '/sleep?0.3')[0], 200)
+        finally:
+            server.stop()
+        return [(msg, level) for msg, level in logged
+            if msg.startswith('Slow request')]
+
+    def test_03_slow_request_log(self):
+        (msg, level), = self._slow_requests(
+            wsgiserver.CherryPyWSGIServer)
+        self.assertEqual(level, logging.WARNING)
+        self.assertRegex(msg,
+            r'^Slow request \(0\.3\d\ds\): GET /sleep\?0\.3 200: '
+            r'queue={0} read={0} parse={0} app=0\.3\d{{5}}{1} '
+            r'first_byte={0} last_byte={0}$'.format(PHASE, CPU))
+
+    def test_04_slow_request_log_asyncio(self):
+        (msg, level), = self._slow_requests(wsgiserver.AsyncioWSGIServer)
+        self.assertEqual(level, logging.WARNING)
+        # The request is parsed before it is queued for the executor.
+        self.assertRegex(msg,
+            r'^Slow request \(0\.3\d\ds\): GET /sleep\?0\.3 200: '
+            r'read={0} parse={0} queue={0} app=0\.3\d{{5}}{1} '
+            r'first_byte={0} last_byte={0}$'.format(PHASE, CPU))
+
+
+class TestReadDeadline(unittest.TestCase):
+
+    @mock.patch('time.time', autospec=True)
+    def test_01_rate_clock_starts_at_first_read(self, time_mock):
+        time_mock.return_value = 1000.0
+        read_deadline = wsgiserver.ReadDeadline(min_rate=100, grace=1)
+        # However long before the first read, the grace period is whole.
+        time_mock.return_value = 1010.0
+        self.assertEqual(read_deadline.remaining(), 1.0)
+        read_deadline.bytes_read = 200
+        time_mock.return_value = 1012.0
+        self.assertEqual(read_deadline.remaining(), 1.0)
+        time_mock.return_value = 1013.5
+        self.assertEqual(read_deadline.remaining(), -0.5)
+
+    @mock.patch('time.time', autospec=True)
+    def test_02_fixed_deadline_first(self, time_mock):
+        time_mock.return_value = 1000.0
+        read_deadline = wsgiserver.ReadDeadline(1002.0, min_rate=100,
+            grace=5)
+        self.assertEqual(read_deadline.remaining(), 2.0)
+        read_deadline = wsgiserver.ReadDeadline(1002.0)
+        time_mock.return_value = 1003.0
+        self.assertEqual(read_deadline.remaining(), -1.0)
+
+    def _post_to_slow_app(self, server_class, read_body):
+        def app(environ, start_response):
+            if environ['REQUEST_METHOD'] == 'POST':
+                # The app thinks for longer than the grace period first.
+                time.sleep(2.5)
+            body = b''
+            if read_body:
+                body = environ['wsgi.input'].read()
+            body = '{}'.format(len(body)).encode('ascii')
+            start_response('200 OK', [
+                ('Content-Length', '{}'.format(len(body)))])
+            return [body]
+
+        server, port = serve(server_class, app, timeout=1)
+        try:
+            status, headers, body, conn = get(port, '/', method='POST',
+                body=b'x' * 200000)
+            self.assertEqual(status, 200)
+            self.assertNotEqual(headers.get('Connection'), 'close')
+            # The unread body was drained, and the connection kept alive.
+            self.assertEqual(get(port, '/', conn=conn)[0], 200)
+            conn.close()
+        finally:
+            server.stop()
+        return body
+
+    def test_03_slow_app_reading_body(self):
+        for server_class in (wsgiserver.CherryPyWSGIServer,
+                wsgiserver.AsyncioWSGIServer):
+            self.assertEqual(self._post_to_slow_app(server_class, True),
+                b'200000')
+
+    def test_04_slow_app_not_reading_body(self):
+        for server_class in (wsgiserver.CherryPyWSGIServer,
+                wsgiserver.AsyncioWSGIServer):
+            self.assertEqual(self._post_to_slow_app(server_class, False),
+                b'0')
+
+    def test_05_slow_client(self):
+        for server_class in (wsgiserver.CherryPyWSGIServer,
+                wsgiserver.AsyncioWSGIServer):
+            server, port = serve(server_class, timeout=1)
+            try:
+                sock = socket.create_connection(('127.0.0.1', port),
+                    timeout=10)
+                started = time.time()
+                sock.sendall(b'POST / HTTP/1.1\r\nHost: x\r\n'
+                    b'Content-Length: 100000\r\n\r\n' + b'x' * 100)
+                (status, _, _), = read_responses(sock, 1)
+                self.assertEqual(status, 408)
+                self.assertLess(time.time() - started, 2)
+                sock.close()
+            finally:
+                server.stop()
+
+
+class TestHeaderLine(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(wsgiserver, '_header_lines', {})
+        self.lines = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_01_cached(self):
+        line = wsgiserver.header_line(b'Content-Type', b'text/plain')
+        self.assertEqual(line, b'Content-Type: text/plain\r\n')
+        self.assertIs(wsgiserver.header_line(b'Content-Type', b'text/plain'),
+            line)
+        self.assertEqual(list(self.lines), [(b'Content-Type', b'text/plain')])
+
+    def test_02_not_cached(self):
+        for name in (b'Set-Cookie', b'set-cookie', b'Content-Length',
+                b'Location', b'ETag'):
+            self.assertEqual(wsgiserver.header_line(name, b'x'),
+                name + b': x\r\n')
+        self.assertEqual(self.lines, {})
+
+    def test_03_full(self):
+        with mock.patch.object(wsgiserver, 'MAX_CACHED_HEADER_LINES', 2):
+            for value in (b'a', b'b', b'c'):
+                wsgiserver.header_line(b'X-Test', value)
+            # The lines cached first are kept.
+            self.assertEqual(sorted(self.lines),
+                [(b'X-Test', b'a'), (b'X-Test', b'b')])
+            self.assertEqual(wsgiserver.header_line(b'X-Test', b'c'),
+                b'X-Test: c\r\n')
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+
+    def _negotiate(self, accept_encoding):
+        return wsgiserver.negotiate_encoding(accept_encoding)
+
+    def test_01_none(self):
+        self.assertIsNone(self._negotiate(None))
+        self.assertIsNone(self._negotiate(b''))
+        self.assertIsNone(self._negotiate(b'br, identity'))
+
+    def test_02_preference(self):
+        self.assertEqual(self._negotiate(b'gzip, deflate, br'), b'gzip')
+        self.assertEqual(self._negotiate(b'deflate'), b'deflate')
+        self.assertEqual(self._negotiate(b' GZip ; q=0.5 , Deflate'),
+            b'deflate')
+
+    def test_03_qvalues(self):
+        self.assertEqual(self._negotiate(b'gzip;q=0.4, deflate;q=0.6'),
+            b'deflate')
+        self.assertEqual(self._negotiate(b'gzip;q=0.6, deflate;q=0.4'),
+            b'gzip')
+        self.assertIsNone(self._negotiate(b'gzip;q=0, deflate;q=0'))
+        # A malformed q-value counts as 0.
+        self.assertEqual(self._negotiate(b'gzip;q=x, deflate;q=0.1'),
+            b'deflate')
+
+    def test_04_identity_q0(self):
+        # Excluding identity doesn't make an unlisted coding acceptable;
+        # the response is then sent as it is.
+        self.assertIsNone(self._negotiate(b'identity;q=0'))
+        self.assertEqual(self._negotiate(b'identity;q=0, gzip'), b'gzip')
+
+    def test_05_star(self):
+        self.assertEqual(self._negotiate(b'*'), b'gzip')
+        self.assertEqual(self._negotiate(b'gzip;q=0, *'), b'deflate')
+        self.assertEqual(self._negotiate(b'*;q=0.5, gzip;q=0.4'),
+            b'deflate')
+        self.assertIsNone(self._negotiate(b'*;q=0'))
+        self.assertEqual(self._negotiate(b'*;q=0, deflate'), b'deflate')
+
+
+class TestPipelining(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.port = serve(pipeline_batch=4)
+        self.flushes = []
+        flush_unlocked = wsgiserver.CP_BufferedWriter._flush_unlocked
+
+        def count_flushes(writer, keep=0):
+            if writer._segments:
+                self.flushes.append(writer._held_bytes)
+            return flush_unlocked(writer, keep)
+
+        patcher = mock.patch.object(wsgiserver.CP_BufferedWriter,
+            '_flush_unlocked', count_flushes)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sock = socket.create_connection(('127.0.0.1', self.port),
+            timeout=10)
+
+    def _pipeline(self, paths):
+        self.sock.sendall(b''.join(
+            'GET {} HTTP/1.1\r\nHost: x\r\n\r\n'.format(path).encode(
+                'ascii') for path in paths))
+        return read_responses(self.sock, len(paths))
+
+    def test_01_batch(self):
+        paths = ['/{}'.format(n) for n in range(2)]
+        responses = self._pipeline(paths)
+        self.assertEqual([body for _, _, body in responses],
+            [b'hello /0', b'hello /1'])
+        # Both responses go out in one flush.
+        self.assertEqual(len(self.flushes), 1)
+
+    def test_02_batch_limit(self):
+        paths = ['/{}'.format(n) for n in range(12)]
+        responses = self._pipeline(paths)
+        self.assertEqual([body for _, _, body in responses],
+            ['hello {}'.format(path).encode('ascii') for path in paths])
+        # Batches of the 4 held responses and the one ending the batch.
+        self.assertEqual(len(self.flushes), 3)
+
+    def test_03_body_flushes_first(self):
+        self.sock.sendall(b'GET /a HTTP/1.1\r\nHost: x\r\n\r\n'
+            b'POST /b HTTP/1.1\r\nHost: x\r\nContent-Length: 3\r\n'
+            b'Expect: 100-continue\r\n\r\n')
+        rfile = self.sock.makefile('rb')
+        # The held response and 100 Continue arrive before the body is sent.
+        self.assertEqual(rfile.readline(), b'HTTP/1.1 200 OK\r\n')
+        while rfile.readline() != b'\r\n':
+            pass
+        self.assertEqual(rfile.read(8), b'hello /a')
+        self.assertEqual(rfile.readline(), b'HTTP/1.1 100 Continue\r\n')
+        self.assertEqual(rfile.readline(), b'\r\n')
+        self.sock.sendall(b'abc')
+        self.assertEqual(rfile.readline(), b'HTTP/1.1 200 OK\r\n')
+        while rfile.readline() != b'\r\n':
+            pass
+        self.assertEqual(rfile.read(3), b'abc')
+
+    def tearDown(self):
+        self.sock.close()
+        self.server.stop()
+
+
+class TestPools(unittest.TestCase):
+
+    def _pool_isolation(self, server_class):
+        server, port = serve(server_class, options={'numthreads': 2},
+            pools={'slow': (['/sleep'], {'min': 1, 'queue_size': 1})})
+        try:
+            busy = socket.create_connection(('127.0.0.1', port), timeout=10)
+            busy.sendall(b'GET /sleep?1 HTTP/1.0\r\n\r\n')
+            time.sleep(0.2)
+            queued = socket.create_connection(('127.0.0.1', port), timeout=10)
+            queued.sendall(b'GET /sleep?0 HTTP/1.0\r\n\r\n')
+            time.sleep(0.2)
+            # The pool's thread is busy and its queue full: shed.
+            shed = socket.create_connection(('127.0.0.1', port), timeout=10)
+            shed.sendall(b'GET /sleep?0 HTTP/1.0\r\n\r\n')
+            (status, headers, _), = read_responses(shed, 1)
+            self.assertEqual(status, 503)
+            self.assertEqual(headers['connection'], 'close')
+            # The other routes are still served at once by the default pool.
+            started = time.time()
+            for path in ('/a', '/b', '/c'):
+                status, _, body, conn = get(port, path)
+                self.assertEqual(status, 200)
+                self.assertEqual(body, 'hello {}'.format(path).encode(
+                    'ascii'))
+                conn.close()
+            self.assertLess(time.time() - started, 0.5)
+            self.assertEqual(read_responses(busy, 1)[0][0], 200)
+            self.assertEqual(read_responses(queued, 1)[0][0], 200)
+            for sock in (busy, queued, shed):
+                sock.close()
+        finally:
+            server.stop()
+        return server
+
+    def test_01_pool_isolation(self):
+        server = self._pool_isolation(wsgiserver.CherryPyWSGIServer)
+        self.assertEqual(server.pools['slow'].shed_count, 1)
+        self.assertEqual(server.requests.shed_count, 0)
+
+    def test_02_pool_isolation_asyncio(self):
+        server = self._pool_isolation(wsgiserver.AsyncioWSGIServer)
+        self.assertEqual(server.stats['Shed Queue Full'], 1)
+
+    def test_03_hand_back_full(self):
+        server, port = serve(options={'numthreads': 1,
+            'accepted_queue_size': 1}, pools={'slow': (['/sleep'], {})},
+            min_body_rate=0)
+        try:
+            kept = socket.create_connection(('127.0.0.1', port), timeout=10)
+            kept.sendall(b'GET /sleep?0.5 HTTP/1.1\r\nHost: x\r\n\r\n')
+            time.sleep(0.1)
+            # The default pool's thread waits for a body, and its queue is
+            # full, when the slow pool hands the connection back.
+            busy = socket.create_connection(('127.0.0.1', port), timeout=10)
+            busy.sendall(b'POST /a HTTP/1.1\r\nHost: x\r\n'
+                b'Connection: close\r\nContent-Length: 3\r\n\r\n')
+            time.sleep(0.1)
+            queued = socket.create_connection(('127.0.0.1', port),
+                timeout=10)
+            queued.sendall(b'GET /b HTTP/1.1\r\nHost: x\r\n\r\n')
+            kept_file = kept.makefile('rb')
+            self.assertEqual(read_responses(kept_file, 1)[0][0], 200)
+            # Closed, with no 503 for a request the client never sent.
+            self.assertEqual(kept_file.read(), b'')
+            self.assertEqual(server.requests.shed_count, 0)
+            self.assertEqual(server.stats['Shed Queue Full'], 0)
+            busy.sendall(b'abc')
+            self.assertEqual(read_responses(busy, 1)[0][2], b'abc')
+            self.assertEqual(read_responses(queued, 1)[0][2], b'hello /b')
+            for sock in (kept, busy, queued):
+                sock.close()
+        finally:
+            server.stop()
+
+
+class TestDrain(unittest.TestCase):
+
+    def _connect(self, port, request):
+        sock = socket.create_connection(('127.0.0.1', port), timeout=10)
+        sock.sendall(request)
+        time.sleep(0.2)
+        return sock
+
+    def test_01_drain(self):
+        server, port = serve(options={'numthreads': 2})
+        # A keep-alive connection holding the first worker, idle...
+        idle = self._connect(port, b'GET /a HTTP/1.1\r\nHost: x\r\n\r\n')
+        self.assertEqual(read_responses(idle, 1)[0][0], 200)
+        # ...one in progress on the second, and one waiting for either.
+        busy = self._connect(port,
+            b'GET /sleep?0.5 HTTP/1.1\r\nHost: x\r\n\r\n')
+        queued = self._connect(port, b'GET /b HTTP/1.1\r\nHost: x\r\n\r\n')
+        started = time.time()
+        report = server.drain(5)
+        self.assertLess(time.time() - started, 2)
+        self.assertEqual(report, {'Completed': 2, 'Aborted': 0,
+            'Rejected': 0})
+        for sock, body in ((busy, b'hello /sleep'), (queued, b'hello /b')):
+            (status, headers, data), = read_responses(sock, 1)
+            self.assertEqual(status, 200)
+            self.assertEqual(headers['connection'], 'close')
+            self.assertEqual(data, body)
+        self.assertEqual(idle.recv(1024), b'')
+        for sock in (idle, busy, queued):
+            sock.close()
+
+    def test_02_drain_timeout(self):
+        server, port = serve(options={'numthreads': 1})
+        busy = self._connect(port, b'GET /sleep?1 HTTP/1.1\r\nHost: x\r\n\r\n')
+        queued = self._connect(port, b'GET /b HTTP/1.1\r\nHost: x\r\n\r\n')
+        started = time.time()
+        report = server.drain(0.3)
+        # The timeout is a soft limit: the request which didn't read nor
+        # write meanwhile still finished, and was counted so.
+        self.assertGreater(time.time() - started, 0.5)
+        self.assertEqual(report, {'Completed': 1, 'Aborted': 0,
+            'Rejected': 1})
+        (status, headers, _), = read_responses(busy, 1)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['connection'], 'close')
+        (status, headers, _), = read_responses(queued, 1)
+        self.assertEqual(status, 503)
+        self.assertEqual(headers['connection'], 'close')
+        for sock in (busy, queued):
+            sock.close()
+
+    def test_03_drain_aborted(self):
+        def app(environ, start_response):
+            body = environ['wsgi.input'].read()
+            if len(body) < int(environ['CONTENT_LENGTH']):
+                raise IOError('The body was cut off.')
+            return _test_app(environ, start_response)
+
+        server, port = serve(app=app, options={'numthreads': 1})
+        # The app blocks reading a body which never comes in full, until
+        # the drain times out and shuts the connection for reading.
+        busy = self._connect(port, b'POST /a HTTP/1.1\r\nHost: x\r\n'
+            b'Content-Length: 100\r\n\r\nabc')
+        with mock.patch.object(server, 'error_log'):
+            report = server.drain(0.3)
+        self.assertEqual(report, {'Completed': 0, 'Aborted': 1,
+            'Rejected': 0})
+        self.assertEqual(read_responses(busy, 1)[0][0], 500)
+        busy.close()
+
+
+def _big_app(environ, start_response):
+    """Answers /big?size with size bytes of a pattern, else like _test_app."""
+    if environ['PATH_INFO'] != '/big':
+        return _test_app(environ, start_response)
+    size = int(environ['QUERY_STRING'])
+    start_response('200 OK', [
+        ('Content-Type', 'application/octet-stream'),
+        ('Content-Length', '{}'.format(size))
+    ])
+    return [PATTERN * (size // len(PATTERN))]
+
+
+PATTERN = bytes(range(256)) * 256
+BIG = 16 << 20
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def _slow_reader(self, port, pipelined=b''):
+        """Requests a big response (and the pipelined requests), on a socket
+        with a small receive buffer, and reads none of it yet."""
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        sock.settimeout(10)
+        sock.connect(('127.0.0.1', port))
+        sock.sendall('GET /big?{} HTTP/1.1\r\nHost: x\r\n\r\n'.format(
+            BIG).encode('ascii') + pipelined)
+        time.sleep(0.3)
+        return sock
+
+    def test_01_slow_reader(self):
+        server, port = serve(app=_big_app, options={'numthreads': 1},
+            write_behind=2 * BIG)
+        try:
+            slow = self._slow_reader(port)
+            # The worker thread left the response to the output multiplexer.
+            self.assertEqual(server.output_mux.pending, 1)
+            self.assertEqual(server.requests.busy, 0)
+            started = time.time()
+            status, _, body, conn = get(port, '/fast')
+            self.assertLess(time.time() - started, 1)
+            self.assertEqual((status, body), (200, b'hello /fast'))
+            conn.close()
+            # The slow client gets the whole body, then its next response.
+            slow.sendall(b'GET /again HTTP/1.1\r\nHost: x\r\n\r\n')
+            (status, headers, data), again = read_responses(slow, 2)
+            self.assertEqual(status, 200)
+            self.assertEqual(len(data), BIG)
+            self.assertTrue(data == PATTERN * (BIG // len(PATTERN)))
+            self.assertEqual(again[2], b'hello /again')
+            self.assertEqual(server.output_mux.pending, 0)
+            slow.close()
+        finally:
+            server.stop()
+
+    def test_02_hand_back_full(self):
+        server, port = serve(app=_big_app, options={'numthreads': 1,
+            'accepted_queue_size': 1}, write_behind=2 * BIG, min_body_rate=0)
+        try:
+            slow = self._slow_reader(port,
+                b'GET /again HTTP/1.1\r\nHost: x\r\n\r\n')
+            # The worker thread waits for a body, and its queue is full, when
+            # the output multiplexer hands the connection back, with the
+            # pipelined request.
+            busy = socket.create_connection(('127.0.0.1', port), timeout=10)
+            busy.sendall(b'POST /a HTTP/1.1\r\nHost: x\r\n'
+                b'Connection: close\r\nContent-Length: 3\r\n\r\n')
+            time.sleep(0.1)
+            queued = socket.create_connection(('127.0.0.1', port),
+                timeout=10)
+            queued.sendall(b'GET /b HTTP/1.1\r\nHost: x\r\n\r\n')
+            time.sleep(0.1)
+            slow_file = slow.makefile('rb')
+            (status, _, data), = read_responses(slow_file, 1)
+            self.assertEqual((status, len(data)), (200, BIG))
+            # Shed, but closed without a 503, which could block the
+            # multiplexer thread.
+            self.assertEqual(slow_file.read(), b'')
+            self.assertEqual(server.requests.shed_count, 1)
+            self.assertEqual(server.stats['Shed Queue Full'], 1)
+            busy.sendall(b'abc')
+            self.assertEqual(read_responses(busy, 1)[0][2], b'abc')
+            self.assertEqual(read_responses(queued, 1)[0][2], b'hello /b')
+            for sock in (slow, busy, queued):
+                sock.close()
+        finally:
+            server.stop()
+
+    def test_03_without_write_behind(self):
+        server, port = serve(app=_big_app, options={'numthreads': 1})
+        try:
+            slow = self._slow_reader(port)
+            # The only worker thread is stuck sending to the slow client.
+            self.assertEqual(server.requests.busy, 1)
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=0.5)
+            with self.assertRaises(socket.timeout):
+                get(port, '/fast', conn)
+            conn.close()
+            (status, _, data), = read_responses(slow, 1)
+            self.assertEqual((status, len(data)), (200, BIG))
+            slow.close()
+        finally:
+            server.stop()
+
+
+class ItemMock:
+    """Mock class for a queued connection."""
+    def __init__(self, name, waited=0.0):
+        self.name = name
+        self.queued_at = time.time() - waited
+
+    def __repr__(self):
+        return self.name
+
+
+class TestRequestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+
+    def _on_drop(self, conn, reason):
+        self.dropped.append((conn.name, reason))
+
+    def _names(self, request_queue, count):
+        return [request_queue.get().name for _ in range(count)]
+
+    def test_01_fifo(self):
+        request_queue = wsgiserver.RequestQueue(maxsize=2,
+            on_drop=self._on_drop)
+        request_queue.put(ItemMock('a'))
+        request_queue.put(ItemMock('b'))
+        with self.assertRaises(queue.Full):
+            request_queue.put(ItemMock('c'), timeout=0)
+        self.assertEqual(self._names(request_queue, 2), ['a', 'b'])
+        self.assertEqual(self.dropped, [])
+
+    def test_02_lifo_evicts_oldest(self):
+        request_queue = wsgiserver.RequestQueue(maxsize=2,
+            discipline='lifo', on_drop=self._on_drop)
+        for name in 'abc':
+            request_queue.put(ItemMock(name), timeout=0)
+        self.assertEqual(self.dropped, [('a', 'Shed Stale')])
+        self.assertEqual(self._names(request_queue, 2), ['c', 'b'])
+
+    def test_03_lifo_keeps_shutdown_requests(self):
+        request_queue = wsgiserver.RequestQueue(maxsize=1,
+            discipline='lifo', on_drop=self._on_drop)
+        request_queue.put(wsgiserver._SHUTDOWNREQUEST)
+        with self.assertRaises(queue.Full):
+            request_queue.put(ItemMock('a'), timeout=0)
+        self.assertIs(request_queue.get(), wsgiserver._SHUTDOWNREQUEST)
+
+    def test_04_codel(self):
+        request_queue = wsgiserver.RequestQueue(discipline='codel',
+            on_drop=self._on_drop, target=0.1, interval=0.05)
+        for name in 'abc':
+            request_queue.put(ItemMock(name, waited=1))
+        request_queue.put(ItemMock('d'))
+        # The first stale item starts the interval, and is still served.
+        self.assertEqual(self._names(request_queue, 1), ['a'])
+        time.sleep(0.06)
+        # Past the interval, stale items are shed until a fresh one.
+        self.assertEqual(self._names(request_queue, 1), ['d'])
+        self.assertEqual(self.dropped,
+            [('b', 'Shed Stale'), ('c', 'Shed Stale')])
+        # The fresh item ended the standing queue.
+        request_queue.put(ItemMock('e', waited=1))
+        self.assertEqual(self._names(request_queue, 1), ['e'])
+
+    def test_05_unknown_discipline(self):
+        with self.assertRaises(ValueError):
+            wsgiserver.RequestQueue(discipline='random')
+
+    def test_06_shed_over_socket(self):
+        # One worker busy and one connection queued: the next is shed.
+        server, port = serve(options={'numthreads': 1,
+            'accepted_queue_size': 1})
+        try:
+            busy = socket.create_connection(('127.0.0.1', port), timeout=10)
+            busy.sendall(b'GET /sleep?0.5 HTTP/1.0\r\n\r\n')
+            time.sleep(0.1)
+            queued = socket.create_connection(('127.0.0.1', port), timeout=10)
+            queued.sendall(b'GET /queued HTTP/1.0\r\n\r\n')
+            time.sleep(0.1)
+            shed = socket.create_connection(('127.0.0.1', port), timeout=10)
+            shed.sendall(b'GET /shed HTTP/1.0\r\n\r\n')
+            (status, headers, _), = read_responses(shed, 1)
+            self.assertEqual(status, 503)
+            self.assertEqual(headers['connection'], 'close')
+            self.assertEqual(read_responses(busy, 1)[0][0], 200)
+            self.assertEqual(read_responses(queued, 1)[0][2],
+                b'hello /queued')
+            self.assertEqual(server.stats['Shed Queue Full'], 1)
+            self.assertEqual(server.requests.shed_count, 1)
+            for sock in (busy, queued, shed):
+                sock.close()
+        finally:
+            server.stop()
+
+
+class TestShardedRequestQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+
+    def _on_drop(self, conn, reason):
+        self.dropped.append((conn.name, reason))
+
+    def _workers(self, request_queue, count):
+        """Starts count threads getting items until a shutdown request."""
+        got = []
+
+        def work():
+            while True:
+                item = request_queue.get()
+                if item is wsgiserver._SHUTDOWNREQUEST:
+                    return
+                got.append(item.name)
+
+        threads = [threading.Thread(target=work, daemon=True)
+            for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, got
+
+    def _wait_sleeping(self, request_queue, count):
+        for _ in range(500):
+            if sum(shard.sleeping for shard in request_queue.shards) == count:
+                return
+            time.sleep(0.01)
+        self.fail('Workers not sleeping.')
+
+    def test_01_wakeups(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=4)
+        threads, got = self._workers(request_queue, 8)
+        self._wait_sleeping(request_queue, 8)
+        names = ['item {}'.format(n) for n in range(1000)]
+        for name in names:
+            request_queue.put(ItemMock(name))
+        for _ in range(500):
+            if len(got) == len(names):
+                break
+            time.sleep(0.01)
+        self.assertEqual(sorted(got), sorted(names))
+        # Each woken worker went back to sleep.
+        self._wait_sleeping(request_queue, 8)
+        for thread in threads:
+            request_queue.put(wsgiserver._SHUTDOWNREQUEST)
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(request_queue.qsize(), 0)
+
+    def test_02_steal(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=4)
+        for name in 'abcd':
+            request_queue.put(ItemMock(name))
+        self.assertEqual([len(shard.items) for shard in request_queue.shards],
+            [1, 1, 1, 1])
+        # A single worker takes its own shard's item, then steals the rest.
+        self.assertEqual([request_queue.get().name for _ in range(4)],
+            ['a', 'b', 'c', 'd'])
+        self.assertEqual(request_queue.steals, 3)
+        self.assertTrue(request_queue.empty())
+
+    def test_03_shutdown(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=3, maxsize=1)
+        threads, _ = self._workers(request_queue, 5)
+        self._wait_sleeping(request_queue, 5)
+        # Shutdown requests are never refused, even when full.
+        for thread in threads:
+            request_queue.put(wsgiserver._SHUTDOWNREQUEST)
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+    def test_04_full(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=2, maxsize=2)
+        request_queue.put(ItemMock('a'))
+        request_queue.put(ItemMock('b'))
+        self.assertTrue(request_queue.full())
+        with self.assertRaises(queue.Full):
+            request_queue.put(ItemMock('c'))
+        self.assertEqual([item.name for item in request_queue.pop_all()],
+            ['a', 'b'])
+
+    def test_05_lifo_evicts_oldest(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=1, maxsize=2,
+            discipline='lifo', on_drop=self._on_drop)
+        for name in 'abc':
+            request_queue.put(ItemMock(name))
+        self.assertEqual(self.dropped, [('a', 'Shed Stale')])
+        self.assertEqual([request_queue.get().name for _ in range(2)],
+            ['c', 'b'])
+        request_queue.put(wsgiserver._SHUTDOWNREQUEST)
+        with self.assertRaises(queue.Full):
+            request_queue.put(ItemMock('d'))
+            request_queue.put(ItemMock('e'))
+        self.assertEqual(self.dropped, [('a', 'Shed Stale')])
+
+    def test_06_codel(self):
+        request_queue = wsgiserver.ShardedRequestQueue(shards=2,
+            discipline='codel', on_drop=self._on_drop, target=0.1,
+            interval=0.05)
+        for name in 'abc':
+            request_queue.put(ItemMock(name, waited=1))
+        request_queue.put(ItemMock('d'))
+        self.assertEqual(request_queue.get().name, 'a')
+        time.sleep(0.06)
+        self.assertEqual(request_queue.get().name, 'd')
+        self.assertEqual(sorted(self.dropped),
+            [('b', 'Shed Stale'), ('c', 'Shed Stale')])
+
+    def test_07_placement(self):
+        with self.assertRaises(ValueError):
+            wsgiserver.ShardedRequestQueue(placement='random')
+        request_queue = wsgiserver.ShardedRequestQueue(shards=4)
+        self.assertEqual([request_queue._place() for _ in range(5)],
+            [0, 1, 2, 3, 0])
+        # Round-robin skips to the next shard with a sleeping worker.
+        request_queue.shards[3].sleeping = 1
+        self.assertEqual([request_queue._place() for _ in range(3)],
+            [3, 3, 3])
+        request_queue = wsgiserver.ShardedRequestQueue(shards=3,
+            placement='least-loaded')
+        request_queue.shards[0].items.extend([1, 2])
+        request_queue.shards[1].items.extend([1])
+        request_queue.shards[2].items.extend([1, 2])
+        self.assertEqual(request_queue._place(), 1)
+        request_queue.shards[2].sleeping = 2
+        self.assertEqual(request_queue._place(), 2)
+
+
+class PoolMock:
+    """Mock class for the ThreadPool of a ThreadPoolAutoscaler."""
+    def __init__(self, threads, min=1, max=-1):
+        self._threads = list(range(threads))
+        self.min = min
+        self.max = max
+        self.qsize = 0
+        self.idle = 0
+        self.waits = (0, 0.0, 0.0)
+
+    def _clear_dead_threads(self):
+        pass
+
+    def pop_wait_stats(self):
+        waits, self.waits = self.waits, (0, 0.0, 0.0)
+        return waits
+
+    def grow(self, amount):
+        if self.max > 0:
+            amount = min(amount, self.max - len(self._threads))
+        self._threads.extend(range(amount))
+
+    def shrink(self, amount):
+        del self._threads[:amount]
+
+
+class TestThreadPoolAutoscaler(unittest.TestCase):
+
+    def test_01_grow_on_queue(self):
+        pool = PoolMock(4)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool)
+        pool.qsize, pool.idle = 3, 1
+        autoscaler.tick(now=1000.0)
+        self.assertEqual(len(pool._threads), 6)
+        self.assertEqual(autoscaler.stats['Grown'], 2)
+        self.assertIn('grow by 2 (queue 3, idle 1',
+            autoscaler.stats['Last Decision'])
+
+    def test_02_grow_at_most_doubling(self):
+        pool = PoolMock(2)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool)
+        pool.qsize = 50
+        autoscaler.tick(now=1000.0)
+        self.assertEqual(len(pool._threads), 4)
+
+    def test_03_grow_on_wait(self):
+        pool = PoolMock(2)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool, max_wait=0.05)
+        pool.idle = 1
+        pool.waits = (2, 0.2, 0.15)
+        autoscaler.tick(now=1000.0)
+        self.assertEqual(len(pool._threads), 3)
+        self.assertEqual(autoscaler.stats['Queue Wait Avg'], 0.1)
+        self.assertEqual(autoscaler.stats['Queue Wait Max'], 0.15)
+
+    def test_04_grow_not_above_max(self):
+        pool = PoolMock(4, max=5)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool)
+        pool.qsize = 4
+        autoscaler.tick(now=1000.0)
+        autoscaler.tick(now=1001.0)
+        self.assertEqual(len(pool._threads), 5)
+        self.assertEqual(autoscaler.stats['Grown'], 1)
+
+    def test_05_shrink_after_cooldown(self):
+        pool = PoolMock(8, min=2)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool, cooldown=10)
+        pool.idle = 6
+        autoscaler.tick(now=1000.0)
+        pool.idle = 4
+        autoscaler.tick(now=1005.0)
+        pool.idle = 5
+        autoscaler.tick(now=1009.0)
+        self.assertEqual(len(pool._threads), 8)
+        # Shrunk by the number of workers idle all along.
+        autoscaler.tick(now=1010.0)
+        self.assertEqual(len(pool._threads), 4)
+        self.assertEqual(autoscaler.stats['Shrunk'], 4)
+        self.assertIn('shrink by 4', autoscaler.stats['Last Decision'])
+
+    def test_06_load_resets_cooldown(self):
+        pool = PoolMock(8, min=2)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool, cooldown=10)
+        pool.idle = 6
+        autoscaler.tick(now=1000.0)
+        pool.idle = 0
+        autoscaler.tick(now=1005.0)
+        pool.idle = 6
+        autoscaler.tick(now=1010.0)
+        self.assertEqual(len(pool._threads), 8)
+        autoscaler.tick(now=1020.0)
+        self.assertEqual(len(pool._threads), 2)
+
+    def test_07_shrink_not_below_min(self):
+        pool = PoolMock(3, min=2)
+        autoscaler = wsgiserver.ThreadPoolAutoscaler(pool, cooldown=10)
+        pool.idle = 3
+        autoscaler.tick(now=1000.0)
+        autoscaler.tick(now=1010.0)
+        self.assertEqual(len(pool._threads), 2)
+        autoscaler.tick(now=1020.0)
+        autoscaler.tick(now=1030.0)
+        self.assertEqual(len(pool._threads), 2)
+        self.assertEqual(autoscaler.stats['Shrunk'], 1)
+
+    def test_08_wait_stats_thread_safe(self):
+        pool = wsgiserver.ThreadPool(None)
+        popped = []
+        done = threading.Event()
+
+        def record():
+            for _ in range(10000):
+                pool.record_wait(0.001)
+
+        def pop():
+            while not done.is_set():
+                popped.append(pool.pop_wait_stats())
+
+        popper = threading.Thread(target=pop)
+        popper.start()
+        recorders = [threading.Thread(target=record) for _ in range(4)]
+        for thread in recorders:
+            thread.start()
+        for thread in recorders:
+            thread.join()
+        done.set()
+        popper.join()
+        popped.append(pool.pop_wait_stats())
+        self.assertEqual(sum(count for count, _, _ in popped), 40000)
+        self.assertAlmostEqual(sum(total for _, total, _ in popped), 40.0)
+        self.assertEqual(pool.pop_wait_stats(), (0, 0.0, 0.0))
+
+    def test_09_start_needs_max(self):
+        server = wsgiserver.CherryPyWSGIServer(('127.0.0.1', 0), _test_app,
+            numthreads=2)
+        server.autoscale = True
+        # Without a max, the pool would double every interval under load.
+        with self.assertRaisesRegex(ValueError, 'default pool'):
+            server.start()
+        server.maxthreads = 8
+        server.add_pool('uploads', ['/upload'], min=1)
+        with self.assertRaisesRegex(ValueError, 'uploads pool'):
+            server.start()
+        self.assertIsNone(getattr(server, 'socket', None))
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        # The next whole second, as a TimerWheel starts at time.time().
+        self.t0 = float(int(time.time()) + 1)
+
+    def test_01_add_expire(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=8)
+        wheel.add('a', 2, now=self.t0)
+        wheel.add('b', 5, now=self.t0)
+        self.assertEqual(len(wheel), 2)
+        self.assertEqual(wheel.expire(now=self.t0 + 1.5), [])
+        self.assertEqual(wheel.expire(now=self.t0 + 2.0), ['a'])
+        self.assertEqual(wheel.expire(now=self.t0 + 2.0), [])
+        self.assertEqual(wheel.expire(now=self.t0 + 5.0), ['b'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_02_remove(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=8)
+        wheel.add('a', 2, now=self.t0)
+        wheel.remove('a')
+        wheel.remove('unknown')
+        self.assertEqual(len(wheel), 0)
+        self.assertEqual(wheel.expire(now=self.t0 + 10.0), [])
+
+    def test_03_add_again(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=8)
+        wheel.add('a', 2, now=self.t0)
+        wheel.add('a', 4, now=self.t0 + 1.0)
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.expire(now=self.t0 + 3.0), [])
+        self.assertEqual(wheel.expire(now=self.t0 + 5.0), ['a'])
+
+    def test_04_longer_than_one_turn(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=4)
+        wheel.add('a', 10, now=self.t0)
+        for now in range(1, 10):
+            self.assertEqual(wheel.expire(now=self.t0 + now), [])
+        self.assertEqual(wheel.expire(now=self.t0 + 10.0), ['a'])
+
+    def test_05_expire_skipping_turns(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=4)
+        wheel.add('a', 1, now=self.t0)
+        wheel.add('b', 3, now=self.t0)
+        self.assertEqual(sorted(wheel.expire(now=self.t0 + 100.0)), ['a', 'b'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_06_zero_timeout_expires_next_tick(self):
+        wheel = wsgiserver.TimerWheel(resolution=1.0, slots=4)
+        wheel.expire(now=self.t0)
+        wheel.add('a', 0, now=self.t0)
+        self.assertEqual(wheel.expire(now=self.t0 + 0.5), [])
+        self.assertEqual(wheel.expire(now=self.t0 + 1.0), ['a'])
+
+
+class TestConnectionManager(unittest.TestCase):
+
+    def test_01_select_readable(self):
+        manager = wsgiserver.ConnectionManager(ServerMock())
+        conn = ConnMock()
+        manager.put(conn)
+        self.assertEqual(manager.select(0), (False, []))
+        self.assertEqual(manager.parked, 1)
+        conn.peer.send(b'GET / HTTP/1.1\r\n')
+        self.assertEqual(manager.select(1), (False, [conn]))
+        self.assertEqual(manager.parked, 0)
+        manager.close()
+        self.assertFalse(conn.closed)
+        conn.close()
+
+    def test_02_close_parked(self):
+        manager = wsgiserver.ConnectionManager(ServerMock())
+        parked, pending = ConnMock(), ConnMock()
+        manager.put(parked)
+        manager.select(0)
+        manager.put(pending)
+        manager.close()
+        self.assertTrue(parked.closed)
+        self.assertTrue(pending.closed)
+        self.assertEqual(manager.parked, 0)
+
+    def test_03_put_after_close(self):
+        manager = wsgiserver.ConnectionManager(ServerMock())
+        manager.close()
+        conn = ConnMock()
+        manager.put(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(manager.parked, 0)
+
+    def test_04_put_racing_close(self):
+        manager = wsgiserver.ConnectionManager(ServerMock())
+
+        class RacingDeque(collections.deque):
+            """Closes the manager between put()'s check and its append."""
+            def append(self, conn):
+                manager.close()
+                collections.deque.append(self, conn)
+
+        manager._pending = RacingDeque()
+        conn = ConnMock()
+        manager.put(conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(manager.parked, 0)
+
+    def test_05_parking_over_socket(self):
+        # A single worker thread serves two idle keep-alive connections in
+        # turn, since neither holds it between requests.
+        server, port = serve(numthreads=1, keepalive_parking=True,
+            timeout=1)
+        try:
+            status, _, body, conn1 = get(port, '/a')
+            self.assertEqual((status, body), (200, b'hello /a'))
+            status, _, body, conn2 = get(port, '/b')
+            self.assertEqual((status, body), (200, b'hello /b'))
+            for _ in range(100):
+                if server.connections.parked == 2:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(server.connections.parked, 2)
+            status, _, body, _ = get(port, '/c', conn=conn1)
+            self.assertEqual((status, body), (200, b'hello /c'))
+            status, _, body, _ = get(port, '/d', conn=conn2)
+            self.assertEqual((status, body), (200, b'hello /d'))
+            # Idle connections are expired by the wheel after timeout.
+            time.sleep(2.5)
+            self.assertEqual(server.connections.parked, 0)
+            self.assertEqual(conn1.sock.recv(1), b'')
+            conn1.close()
+            conn2.close()
+        finally:
+            server.stop()
+
+
+class TestAsyncioWSGIServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.port = serve(wsgiserver.AsyncioWSGIServer,
+            numthreads=2)
+
+    def test_01_keep_alive(self):
+        status, headers, body, conn = get(self.port, '/a')
+        self.assertEqual((status, body), (200, b'hello /a'))
+        self.assertNotEqual(headers.get('Connection'), 'close')
+        sock = conn.sock
+        status, _, body, _ = get(self.port, '/b', conn=conn)
+        self.assertEqual((status, body), (200, b'hello /b'))
+        self.assertIs(conn.sock, sock)
+        conn.close()
+
+    def test_02_pipelining(self):
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=10)
+        sock.sendall(b''.join(
+            'GET /{} HTTP/1.1\r\nHost: x\r\n\r\n'.format(n).encode('ascii')
+            for n in range(5)))
+        responses = read_responses(sock, 5)
+        self.assertEqual([body for _, _, body in responses],
+            [b'hello /0', b'hello /1', b'hello /2', b'hello /3', b'hello /4'])
+        sock.close()
+
+    def test_03_http_1_0_close(self):
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=10)
+        sock.sendall(b'GET /old HTTP/1.0\r\n\r\n')
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        self.assertTrue(data.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(data.endswith(b'\r\n\r\nhello /old'))
+        sock.close()
+
+    def test_04_request_body_streaming(self):
+        received = []
+
+        def app(environ, start_response):
+            while True:
+                data = environ['wsgi.input'].read(1024)
+                if not data:
+                    break
+                received.append(data)
+            body = b''.join(received)
+            start_response('200 OK', [
+                ('Content-Length', '{}'.format(len(body)))])
+            return [body]
+
+        self.server.stop()
+        self.server, self.port = serve(wsgiserver.AsyncioWSGIServer, app)
+        sock = socket.create_connection(('127.0.0.1', self.port), timeout=10)
+        sock.sendall(b'POST / HTTP/1.1\r\nHost: x\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\n')
+        for n in range(3):
+            sock.sendall(b'1000\r\n' + bytes([65 + n]) * 4096 + b'\r\n')
+            # The app reads the body while it arrives.
+            for _ in range(100):
+                if sum(len(data) for data in received) == (n + 1) * 4096:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(sum(len(data) for data in received),
+                (n + 1) * 4096)
+        sock.sendall(b'0\r\n\r\n')
+        (status, _, body), = read_responses(sock, 1)
+        self.assertEqual(status, 200)
+        self.assertEqual(body, b'A' * 4096 + b'B' * 4096 + b'C' * 4096)
+        sock.close()
+
+    def test_05_stop(self):
+        status, _, _, conn = get(self.port, '/a')
+        self.assertEqual(status, 200)
+        self.server.stop()
+        self.assertFalse(self.server.ready)
+        # The idle keep-alive connection is closed, and so is the port.
+        self.assertEqual(conn.sock.recv(1), b'')
+        conn.close()
+        with self.assertRaises(ConnectionRefusedError):
+            socket.create_connection(('127.0.0.1', self.port), timeout=10)
+
+    def tearDown(self):
+        self.server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ Bug fixed and modified extensively.
 # pylint: disable=too-many-statements
 
 import os
+import sys
 import shutil
 import tempfile
 import unittest
@@ -64,6 +65,21 @@ class TestGitAPI(unittest.TestCase):
         gitapi.init(self.repo)
         self.assertTrue(os.path.exists(self.get_path("test/.git")))
 
+    def test_006_command_timeout(self):
+        out, _ = gitapi.command(self.repo, "status", "-s", timeout=30)
+        self.assertEqual(out, "")
+        with self.assertRaises(TimeoutError):
+            gitapi.command(self.repo, "status", timeout=0)
+
+    def test_007_command_session(self):
+        # Only a command with a timeout is moved to a session of its own.
+        alias = 'alias.sid=!{} -c "import os; print(os.getsid(0))"'.format(
+            sys.executable)
+        out, _ = gitapi.command(self.repo, "-c", alias, "sid")
+        self.assertEqual(int(out), os.getsid(0))
+        out, _ = gitapi.command(self.repo, "-c", alias, "sid", timeout=30)
+        self.assertNotEqual(int(out), os.getsid(0))
+
     def test_020_Add(self):
         with open(self.get_path("test/file.txt"), "w") as out:
             out.write("stuff")
@@ -5,6 +5,8 @@
 # pylint: disable=invalid-name
 # pylint: disable=too-many-statements
 
+import io
+import time
 import unittest
 
 import fw.http.tools as httptools
@@ -57,6 +59,46 @@ class TestSessionManage(unittest.TestCase):
         result = httptools.analyze_request_path(request, METHODS)
         self.assertEqual(result, 'resource_requested')
 
+    def test_08_parse_form_data_streamed(self):
+        data = 'a={}&b=c'.format('x' * 5000).encode('ascii')
+        request = {
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(data)),
+            'wsgi.input': io.BytesIO(data),
+            'parsed.qs': {'upload_id': 'test'}
+        }
+        transfers = {}
+        httptools.parse_form_data(request, 'sid', transfers, buffer_size=1000)
+        formdata = request['parsed.formdata']
+        self.assertEqual(formdata.getvalue('a'), 'x' * 5000)
+        self.assertEqual(formdata.getvalue('b'), 'c')
+        self.assertEqual(transfers, {})
+
+    def test_09_parse_form_data_deadline(self):
+        data = 'a={}'.format('x' * 5000).encode('ascii')
+        request = {
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+            'CONTENT_LENGTH': str(len(data)),
+            'wsgi.input': io.BytesIO(data),
+            'parsed.qs': {'upload_id': 'test'},
+            'fw.deadline': time.time() - 1
+        }
+        self.assertEqual(httptools.remaining_time(request), 0)
+        transfers = {}
+        with self.assertRaises(TimeoutError):
+            httptools.parse_form_data(request, 'sid', transfers,
+                buffer_size=1000)
+        self.assertNotIn('parsed.formdata', request)
+        self.assertEqual(transfers, {})
+        request['fw.deadline'] = time.time() + 60
+        request['wsgi.input'].seek(0)
+        self.assertTrue(59 < httptools.remaining_time(request) <= 60)
+        httptools.parse_form_data(request, 'sid', transfers, buffer_size=1000)
+        self.assertEqual(request['parsed.formdata'].getvalue('a'), 'x' * 5000)
+        self.assertIsNone(httptools.remaining_time({}))
+
     @classmethod
     def tearDownClass(cls):
         pass
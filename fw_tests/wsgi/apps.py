@@ -5,10 +5,15 @@
 # pylint: disable=invalid-name
 # pylint: disable=too-many-statements
 
+import os
+import shutil
 import unittest
+import tempfile
 import unittest.mock as mock
 
 import fw.wsgi.apps as wsgiapps
+import fw.http.tools as httptools
+import fw.externals.wsgiserver as wsgiserver
 
 APP_ROUTES = {
     'e_service': {
@@ -40,7 +45,9 @@ class TestSessionManage(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        pass
+        cls.resource_path = tempfile.mkdtemp()
+        with open(os.path.join(cls.resource_path, 'style.css'), 'wb') as f:
+            f.write(b'body {}')
 
     def test_01_get_path_parts_default(self):
         request = {'PATH_INFO': ''}
@@ -89,9 +96,84 @@ class TestSessionManage(unittest.TestCase):
         })
         self.assertEqual(config, {'@foo': 'bar'})  # Fake config.
 
+    def _resource_session(self, path, file_wrapper=None):
+        request = {'PATH_INFO': path}
+        if file_wrapper is not None:
+            request['wsgi.file_wrapper'] = file_wrapper
+        response = httptools.new_response({})
+        return {
+            '@app_config': {'resource_path': self.resource_path},
+            '@tmp': {'request': request, 'response': response}
+        }
+
+    def test_06_get_app_resource(self):
+        session = self._resource_session('/style.css',
+            file_wrapper=wsgiserver.FileWrapper)
+        wsgiapps.get_app_resource(session)
+        response = session['@tmp']['response']
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Type'], 'text/css')
+        self.assertEqual(response['headers']['Content-Length'], 7)
+        wrapper = httptools.prepare_response_data(response)
+        self.assertIsInstance(wrapper, wsgiserver.FileWrapper)
+        self.assertEqual(response['headers']['Content-Length'], 7)
+        self.assertEqual(b''.join(wrapper), b'body {}')
+        wrapper.close()
+
+    def test_07_get_app_resource_without_file_wrapper(self):
+        session = self._resource_session('/style.css')
+        wsgiapps.get_app_resource(session)
+        response = session['@tmp']['response']
+        self.assertEqual(response['binary_data'], b'body {}')
+        self.assertEqual(httptools.prepare_response_data(response), b'body {}')
+
+    def test_08_get_app_resource_not_found(self):
+        session = self._resource_session('/missing.css')
+        with self.assertLogs(wsgiapps.LOG, 'ERROR'):
+            wsgiapps.get_app_resource(session)
+        self.assertEqual(session['@tmp']['response']['status'],
+            '404 Not Found')
+
+    def test_09_get_app_resource_outside_resource_path(self):
+        session = self._resource_session('/../../etc/passwd')
+        with self.assertLogs(wsgiapps.LOG, 'ERROR'):
+            wsgiapps.get_app_resource(session)
+        self.assertEqual(session['@tmp']['response']['status'],
+            '403 Forbidden')
+
+    def test_10_get_app_resource_default_favicon(self):
+        request = {'PATH_INFO': '/favicon.ico'}
+        response = httptools.new_response({})
+        session = {'@tmp': {'request': request, 'response': response}}
+        wsgiapps.get_app_resource(session)
+        self.assertEqual(response['status'], '200 OK')
+        self.assertEqual(response['headers']['Content-Type'],
+            'image/vnd.microsoft.icon')
+        self.assertEqual(response['binary_data'][:4], b'\x00\x00\x01\x00')
+
+    def test_11_get_path_parts_resource_path(self):
+        apps_types = {
+            'notes': dict(APP_ROUTES['notes'],
+                resource_path=self.resource_path)
+        }
+        request = {'PATH_INFO': '/foo/notes/bar/'}
+        parts = wsgiapps.get_path_parts(request, apps_types)
+        self.assertEqual(parts, {
+            '@function': 'amnesia.web.notes.entry',
+            '@type_name': 'notes',
+            'resource_path': self.resource_path,
+            'user_name': 'foo',
+            'note': 'bar'
+        })
+        session = self._resource_session('/style.css')
+        session['@app_config'] = parts
+        wsgiapps.get_app_resource(session)
+        self.assertEqual(session['@tmp']['response']['binary_data'],
+            b'body {}')
+
     @classmethod
     def tearDownClass(cls):
-        pass
+        shutil.rmtree(cls.resource_path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,152 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=too-many-public-methods
+# pylint: disable=invalid-name
+# pylint: disable=too-many-statements
+
+import time
+import unittest
+import threading
+
+import fw.wsgi.metrics as wsgimetrics
+
+
+class RequestMock:
+    """Mock class for a finished wsgiserver HTTPRequest."""
+    def __init__(self, path, status, seconds):
+        self.path = path
+        self.status = status
+        self.start_time = time.time() - seconds
+
+
+class TestWsgiMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        pass
+
+    def test_01_route(self):
+        registry = wsgimetrics.MetricsRegistry(['/', '/api', '/api/v2/'])
+        self.assertEqual(registry.route(b'/'), '/')
+        self.assertEqual(registry.route(b'/foo'), '/')
+        self.assertEqual(registry.route(b'/api'), '/api')
+        self.assertEqual(registry.route(b'/api/x'), '/api')
+        self.assertEqual(registry.route(b'/apix'), '/')
+        self.assertEqual(registry.route(b'/api/v2/x'), '/api/v2')
+        registry = wsgimetrics.MetricsRegistry(['/api'])
+        self.assertEqual(registry.route(b'/foo'), wsgimetrics.UNMATCHED_ROUTE)
+
+    def test_02_observe(self):
+        registry = wsgimetrics.MetricsRegistry(['/', '/api'])
+        registry.observe(RequestMock(b'/api/x', b'200 OK', 0.003))
+        registry.observe(RequestMock(b'/api/y', b'200 OK', 0.2))
+        registry.observe(RequestMock(b'/x', b'404 Not Found', 0.001))
+        request = RequestMock(b'/x', b'200 OK', 0)
+        request.start_time = None  # Never read, not counted.
+        registry.observe(request)
+        requests, latencies = registry.collect()
+        self.assertEqual(requests, {('/api', '200'): 2, ('/', '404'): 1})
+        self.assertEqual(len(latencies['/api']),
+            len(wsgimetrics.LATENCY_BUCKETS) + 2)
+        self.assertEqual(latencies['/api'][0], 1)  # <= 0.005
+        self.assertEqual(latencies['/api'][5], 1)  # <= 0.25
+        self.assertEqual(sum(latencies['/api'][:-1]), 2)
+        self.assertTrue(0.2 <= latencies['/api'][-1] < 1)
+
+    def test_03_observe_threads(self):
+        registry = wsgimetrics.MetricsRegistry(['/'])
+
+        def work():
+            for _ in range(1000):
+                registry.observe_request('/', '200', 0.01)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        registry.observe_request('/', '200', 20)
+        requests, latencies = registry.collect()
+        self.assertEqual(requests, {('/', '200'): 4001})
+        self.assertEqual(latencies['/'][1], 4000)  # <= 0.01
+        self.assertEqual(latencies['/'][-2], 1)  # +Inf
+
+    def test_04_render(self):
+        registry = wsgimetrics.MetricsRegistry(['/'], buckets=(0.1, 1))
+        registry.observe_request('/', '200', 0.05)
+        registry.observe_request('/', '200', 0.5)
+        registry.observe_request('/', '500', 5)
+        registry.gauge('test_gauge', 'A gauge.', lambda: 7)
+        registry.gauge('test_broken', 'A failing gauge.', lambda: 1 / 0)
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE fw_http_requests_total counter', lines)
+        self.assertIn('fw_http_requests_total{route="/",code="200"} 2', lines)
+        self.assertIn('fw_http_requests_total{route="/",code="500"} 1', lines)
+        self.assertIn('# TYPE fw_http_request_duration_seconds histogram',
+            lines)
+        self.assertIn('fw_http_request_duration_seconds_bucket'
+            '{route="/",le="0.1"} 1', lines)
+        self.assertIn('fw_http_request_duration_seconds_bucket'
+            '{route="/",le="1"} 2', lines)
+        self.assertIn('fw_http_request_duration_seconds_bucket'
+            '{route="/",le="+Inf"} 3', lines)
+        self.assertIn('fw_http_request_duration_seconds_count{route="/"} 3',
+            lines)
+        self.assertIn('fw_http_request_duration_seconds_sum{route="/"} 5.55',
+            lines)
+        self.assertIn('# TYPE test_gauge gauge', lines)
+        self.assertIn('test_gauge 7', lines)
+        self.assertNotIn('# TYPE test_broken gauge', lines)
+
+    def test_05_app(self):
+        registry = wsgimetrics.MetricsRegistry(['/'])
+        registry.observe_request('/', '200', 0.05)
+        started = {}
+
+        def start_response(status, headers):
+            started['status'] = status
+            started['headers'] = dict(headers)
+
+        data = b''.join(registry.app({}, start_response))
+        self.assertEqual(started['status'], '200 OK')
+        self.assertEqual(started['headers']['Content-Type'],
+            wsgimetrics.CONTENT_TYPE)
+        self.assertEqual(started['headers']['Content-Length'],
+            str(len(data)))
+        self.assertIn(b'fw_http_requests_total{route="/",code="200"} 1',
+            data)
+
+    def test_06_render_labels(self):
+        registry = wsgimetrics.MetricsRegistry(['/'])
+        registry.gauge('test_queue', 'A pool gauge.', lambda: 3,
+            {'pool': 'uploads'})
+        registry.gauge('test_queue', 'A pool gauge.', lambda: 0,
+            {'pool': 'git'})
+        registry.counter('test_total', 'A counter.', lambda: 5,
+            {'pool': 'a"b'})
+        lines = registry.render().splitlines()
+        self.assertEqual(lines.count('# TYPE test_queue gauge'), 1)
+        self.assertIn('test_queue{pool="uploads"} 3', lines)
+        self.assertIn('test_queue{pool="git"} 0', lines)
+        self.assertIn('# TYPE test_total counter', lines)
+        self.assertIn('test_total{pool="a\\"b"} 5', lines)
+
+    def test_07_observe_timeout(self):
+        registry = wsgimetrics.MetricsRegistry(['/', '/git'])
+        registry.observe_timeout(RequestMock(b'/git/x', b'', 30))
+        registry.observe_timeout(RequestMock(b'/git/y', b'', 30))
+        registry.observe_timeout(RequestMock(b'/x', b'', 30))
+        lines = registry.render().splitlines()
+        self.assertIn('# TYPE fw_http_deadline_exceeded_total counter', lines)
+        self.assertIn('fw_http_deadline_exceeded_total{route="/git"} 2',
+            lines)
+        self.assertIn('fw_http_deadline_exceeded_total{route="/"} 1', lines)
+
+    @classmethod
+    def tearDownClass(cls):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+#@PydevCodeAnalysisIgnore
+# pylint: disable=missing-docstring
+# pylint: disable=line-too-long
+# pylint: disable=too-many-public-methods
+# pylint: disable=invalid-name
+# pylint: disable=too-many-statements
+
+import os
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+import threading
+
+import fw.wsgi.profiler as wsgiprofiler
+
+
+class WorkerMock(threading.Thread):
+    """Mock class for a busy wsgiserver WorkerThread."""
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.conn = object()
+        self.stopped = threading.Event()
+
+    def run(self):
+        self.busy_waiting()
+
+    def busy_waiting(self):
+        while not self.stopped.is_set():
+            time.sleep(0.001)
+
+
+class PoolMock:
+    def __init__(self, threads):
+        self._threads = threads
+
+
+class ServerMock:
+    def __init__(self, threads):
+        self.requests = PoolMock(threads)
+
+
+class TestWsgiProfiler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.busy = WorkerMock()
+        cls.idle = WorkerMock()
+        cls.idle.conn = None
+        cls.busy.start()
+        cls.idle.start()
+        cls.server = ServerMock([cls.busy, cls.idle])
+
+    def test_01_sample(self):
+        sampler = wsgiprofiler.StackSampler(self.server)
+        self.assertEqual(sampler.worker_idents(), set([self.busy.ident]))
+        sampler.sample()
+        sampler.sample()
+        self.assertEqual(sampler.samples, 2)
+        lines = sampler.collapsed().splitlines()
+        self.assertTrue(len(lines) >= 1)
+        stack, count = lines[0].rsplit(' ', 1)
+        frames = stack.split(';')
+        self.assertEqual(frames[0], 'threading.Thread._bootstrap')
+        self.assertIn(__name__ + '.WorkerMock.busy_waiting', frames)
+        self.assertEqual(sum([int(line.rsplit(' ', 1)[1])
+            for line in lines]), 2)
+        sampler.reset()
+        self.assertEqual(sampler.samples, 0)
+        self.assertEqual(sampler.collapsed(), '')
+
+    def test_02_sample_lines(self):
+        sampler = wsgiprofiler.StackSampler(self.server, lines=True)
+        sampler.sample()
+        self.assertRegex(sampler.collapsed(),
+            __name__ + r'\.WorkerMock\.busy_waiting:\d+')
+
+    def test_03_start_stop(self):
+        sampler = wsgiprofiler.StackSampler(self.server, rate=200)
+        sampler.start()
+        time.sleep(0.2)
+        sampler.stop()
+        samples = sampler.samples
+        self.assertTrue(samples > 5)
+        time.sleep(0.05)
+        self.assertEqual(sampler.samples, samples)
+
+    def test_04_dump_on_signal(self):
+        path = os.path.join(self.temp_dir, 'profile-{pid}.txt')
+        sampler = wsgiprofiler.StackSampler(self.server, dump_path=path)
+        sampler.sample()
+        wsgiprofiler.install_signal_handler(sampler)
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+        finally:
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+        with open(path.format(pid=os.getpid())) as dump_file:
+            self.assertEqual(dump_file.read(), sampler.collapsed())
+
+    def test_05_dump_not_through_links(self):
+        path = os.path.join(self.temp_dir, 'linked.txt')
+        target = os.path.join(self.temp_dir, 'target.txt')
+        with open(target, 'w') as target_file:
+            target_file.write('target')
+        # Links planted at the dump path and its old temporary path.
+        os.symlink(target, path)
+        os.symlink(target, path + '.tmp')
+        sampler = wsgiprofiler.StackSampler(self.server, dump_path=path)
+        sampler.sample()
+        self.assertEqual(sampler.dump(), path)
+        self.assertFalse(os.path.islink(path))
+        with open(path) as dump_file:
+            self.assertEqual(dump_file.read(), sampler.collapsed())
+        with open(target) as target_file:
+            self.assertEqual(target_file.read(), 'target')
+        # No temporary file is left behind.
+        self.assertEqual(sorted(name for name in os.listdir(self.temp_dir)
+            if name.startswith('linked.txt')),
+            ['linked.txt', 'linked.txt.tmp'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.busy.stopped.set()
+        cls.idle.stopped.set()
+        shutil.rmtree(cls.temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,14 @@
 # pylint: disable=invalid-name
 # pylint: disable=too-many-statements
 
-# import os
+import os
 # import shutil
+import signal
+import socket
 import unittest
+import time
+import threading
+import unittest.mock as mock
 # import tempfile
 
 import fw.wsgi.server as wsgiserver
@@ -15,11 +20,21 @@ import fw.wsgi.server as wsgiserver
 
 class ServerMock:
     """Mock class for the wsgi server."""
-    def __init__(self, bind_address, apps):
+    def __init__(self, bind_address, apps, **options):
+        self._options = options
         self._address = bind_address[0]
         self._port = bind_address[1]
         self._apps = apps
         self._started = False
+        self._pools = {}
+        self._deadlines = {}
+
+    def add_pool(self, name, routes, min=1, max=-1, queue_size=-1):
+        self._pools[name] = (routes, min, max, queue_size)
+
+    def set_deadline(self, routes, seconds):
+        for route in routes:
+            self._deadlines[route] = seconds
 
     def start(self):
         self._started = True
@@ -62,6 +77,282 @@ class TestGitManage(unittest.TestCase):
             server_class=ServerMock)
         self.assertEqual('ServerMock: localhost:8080, True.', str(server))
 
+    def test_02_start_wsgi_keepalive_parking(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server.keepalive_parking, False)
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, keepalive_parking=True)
+        self.assertEqual(server.keepalive_parking, True)
+
+    def test_03_start_wsgi_workers(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        handlers = {}
+        forked = iter(range(101, 110))
+        killed = []
+
+        def wait():
+            pid, status = next(waits)
+            if isinstance(pid, str):
+                handlers[status](status, None)
+                pid, status = next(waits)
+            return pid, status
+
+        waits = iter([
+            (101, 1 << 8),  # Crashed, restarted as 103.
+            (102, 0),  # Stopped normally, not restarted.
+            ('signal', signal.SIGHUP),
+            (103, 0),  # Restarted as 104.
+            ('signal', signal.SIGTERM),
+            (104, signal.SIGTERM),
+        ])
+        with mock.patch.object(wsgiserver, '_fork_worker',
+                    side_effect=lambda _: next(forked)) as fork_worker, \
+                mock.patch.object(wsgiserver, '_kill',
+                    side_effect=lambda *args: killed.append(args)), \
+                mock.patch.object(wsgiserver.os, 'wait', side_effect=wait), \
+                mock.patch.object(wsgiserver.signal, 'signal',
+                    side_effect=handlers.__setitem__), \
+                mock.patch.object(wsgiserver, 'RESTART_DELAY', 0), \
+                self.assertLogs('fw.wsgi.server', 'WARNING') as logs:
+            server = wsgiserver.start_wsgi('localhost', 8080, apps,
+                server_class=ServerMock, workers=2, threads=4,
+                reuse_port=True)
+        self.assertEqual(server.numthreads, 4)
+        self.assertTrue(server.reuse_port)
+        # The mock server is only started in the forked worker processes.
+        self.assertEqual('ServerMock: localhost:8080, False.', str(server))
+        self.assertEqual(fork_worker.call_count, 4)
+        self.assertIn('Worker 101 died, status 256', logs.output[0])
+        self.assertEqual(killed, [(103, signal.SIGHUP),
+            (104, signal.SIGTERM)])
+        # The default handlers are back once all workers have stopped.
+        self.assertEqual(handlers[signal.SIGTERM], signal.SIG_DFL)
+        self.assertEqual(handlers[signal.SIGHUP], signal.SIG_DFL)
+        self.assertEqual(handlers[signal.SIGUSR2], signal.SIG_DFL)
+
+    def test_04_start_wsgi_autoscale(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server.maxthreads, -1)
+        self.assertEqual(server.autoscale, False)
+        self.assertEqual(server.autoscale_cooldown, 60)
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, threads=4, max_threads=32,
+            autoscale=True, autoscale_cooldown=120)
+        self.assertEqual(server.numthreads, 4)
+        self.assertEqual(server.maxthreads, 32)
+        self.assertEqual(server.autoscale, True)
+        self.assertEqual(server.autoscale_cooldown, 120)
+
+    def test_05_start_wsgi_queue(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server._options, {})
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, queue_size=100, queue_discipline='lifo')
+        self.assertEqual(server._options, {
+            'accepted_queue_size': 100,
+            'queue_discipline': 'lifo'
+        })
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, queue_shards=1)
+        self.assertEqual(server._options, {})
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, queue_shards=4,
+            queue_placement='least-loaded')
+        self.assertEqual(server._options, {
+            'queue_shards': 4,
+            'queue_placement': 'least-loaded'
+        })
+
+        class AsyncioServerMock(wsgiserver.wsgiserver.AsyncioWSGIServer):
+            def start(self):
+                self.started = True
+
+        with self.assertLogs('fw.wsgi.server', 'WARNING') as logs:
+            server = wsgiserver.start_wsgi('localhost', 8080, apps,
+                server_class=AsyncioServerMock, queue_size=100,
+                queue_shards=4)
+        self.assertTrue(server.started)
+        self.assertIn('Ignoring the queue settings', logs.output[0])
+
+    def test_06_start_wsgi_metrics(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, metrics_path='/metrics')
+        self.assertEqual(sorted(server._apps.apps),
+            [('', _test_entry_method), ('/metrics', server.metrics.app)])
+        self.assertEqual(server.metrics.route(b'/metrics'), '/metrics')
+        self.assertEqual(server.metrics.route(b'/foo'), '/')
+        self.assertEqual(list(apps.keys()), ['/'])
+
+    def test_07_start_wsgi_slow_request_time(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, slow_request_time=0.5)
+        self.assertEqual(server.slow_request_time, 0.5)
+
+    def test_08_start_wsgi_profiler(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertFalse(hasattr(server, 'profiler'))
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, profile_rate=50,
+            profile_dump_path='/tmp/test-{pid}.txt')
+        self.assertIs(server.profiler.server, server)
+        self.assertEqual(server.profiler.interval, 0.02)
+        self.assertEqual(server.profiler.dump_path, '/tmp/test-{pid}.txt')
+        signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+
+    def test_09_start_wsgi_read_limits(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server.header_timeout, 20)
+        self.assertEqual(server.min_body_rate, 500)
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, header_timeout=0, min_body_rate=0)
+        self.assertEqual(server.header_timeout, 0)
+        self.assertEqual(server.min_body_rate, 0)
+
+    def test_10_start_wsgi_pools(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        pools = {
+            'uploads': {'routes': ['/upload'], 'min_threads': 2,
+                'max_threads': 4, 'queue_size': 8},
+            'git': {'routes': ['/git', '/repo/']}
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, pools=pools, metrics_path='/metrics')
+        self.assertEqual(server._pools, {
+            'uploads': (['/upload'], 2, 4, 8),
+            'git': (['/git', '/repo/'], 1, -1, -1)
+        })
+        self.assertEqual(server.metrics.route(b'/upload/x'), '/upload')
+        self.assertEqual(server.metrics.route(b'/repo/x'), '/repo')
+        self.assertEqual(server.metrics.route(b'/x'), '/')
+
+    def test_11_start_wsgi_listen_fd(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen(8)
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, listen_fd=os.dup(listener.fileno()))
+        self.assertEqual(server.bound_socket.getsockname(),
+            listener.getsockname())
+        server.bound_socket.close()
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertFalse(hasattr(server, 'bound_socket'))
+        # Sockets passed to another process are not taken.
+        os.environ['LISTEN_FDS'] = '1'
+        os.environ['LISTEN_PID'] = str(os.getpid() + 1)
+        self.assertEqual(wsgiserver.inherited_sockets(), [])
+        self.assertNotIn('LISTEN_FDS', os.environ)
+        self.assertNotIn('LISTEN_PID', os.environ)
+        listener.close()
+
+    def test_12_start_wsgi_in_thread(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        results = []
+
+        def run():
+            try:
+                results.append(wsgiserver.start_wsgi('127.0.0.1', 0, apps,
+                    server_class=ServerMock, profile_rate=50))
+            except Exception as exc:
+                results.append(exc)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(5)
+        # Served without signal handlers, which only the main thread sets.
+        self.assertEqual(str(results[0]), 'ServerMock: 127.0.0.1:0, True.')
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+        self.assertEqual(signal.getsignal(signal.SIGUSR1), signal.SIG_DFL)
+        self.assertEqual(signal.getsignal(signal.SIGUSR2), signal.SIG_DFL)
+
+    def test_13_run_wsgi_drain(self):
+
+        class DrainMock(ServerMock):
+            report = {'Completed': 2, 'Aborted': 0, 'Rejected': 1}
+
+            def start(self):
+                self._started = True
+                self.ready = True
+                os.kill(os.getpid(), signal.SIGTERM)
+                while self.ready:
+                    time.sleep(0.01)
+
+            def stop(self):
+                self.stopped = True
+
+            def drain(self):
+                self.ready = False
+                return self.report
+
+        server = DrainMock(('localhost', 8080), {})
+        self.assertTrue(wsgiserver._run_wsgi(server))
+        self.assertFalse(hasattr(server, 'stopped'))
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+        server = DrainMock(('localhost', 8080), {})
+        server.start = lambda: None
+        self.assertTrue(wsgiserver._run_wsgi(server))
+        self.assertTrue(server.stopped)
+
+    def test_14_start_wsgi_write_behind(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server.write_behind, 0)
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, write_behind=1048576)
+        self.assertEqual(server.write_behind, 1048576)
+
+    def test_15_start_wsgi_deadlines(self):
+        apps = {
+            '/': _test_entry_method
+        }
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock)
+        self.assertEqual(server.deadline, 0)
+        self.assertEqual(server._deadlines, {})
+        server = wsgiserver.start_wsgi('localhost', 8080, apps,
+            server_class=ServerMock, deadline=30,
+            deadlines={'/git': 120, '/metrics': 0})
+        self.assertEqual(server.deadline, 30)
+        self.assertEqual(server._deadlines, {'/git': 120, '/metrics': 0})
+
     @classmethod
     def tearDownClass(cls):
         pass